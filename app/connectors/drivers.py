@@ -0,0 +1,63 @@
+"""Seleção de driver a partir do `Device.config` (pzem004t, sdm630, register_map ou leitura genérica)."""
+from __future__ import annotations
+from typing import Any
+from .pzem004t import read_pzem004t_metrics, PZEM004T_MAP
+from .eastron_sdm630 import read_sdm630_metrics, SDM630_INPUT_BLOCKS
+from .register_map import RegisterMap, read_frame
+
+
+DEFAULT_GENERIC_METRICS = ["voltage", "current", "power", "energy_wh"]
+PZEM004T_METRICS = ["voltage", "current", "power", "energy_wh"]
+
+_custom_maps: dict[str, tuple[RegisterMap, Any]] = {}
+
+
+def custom_register_map(cfg: dict) -> tuple[RegisterMap, Any] | None:
+    """Mapa declarativo do `config["register_map"]`, compilado uma vez e reutilizado."""
+    fields = cfg.get("register_map")
+    if not fields:
+        return None
+    key = repr(fields)
+    cached = _custom_maps.get(key)
+    if cached is None:
+        regmap = RegisterMap.from_config("custom", fields)
+        cached = _custom_maps[key] = (regmap, regmap.compile())
+    return cached
+
+
+def input_blocks(cfg: dict) -> list[tuple[int, int]]:
+    """Blocos (endereço, quantidade) de Input Registers que o driver do dispositivo irá ler."""
+    driver = cfg.get("driver")
+    base = int(cfg.get("base", 0))
+    if driver == "pzem004t":
+        return PZEM004T_MAP.input_blocks(base)
+    if driver == "sdm630":
+        return list(SDM630_INPUT_BLOCKS)
+    custom = custom_register_map(cfg)
+    if custom is not None:
+        return custom[0].input_blocks(base)
+    return [(base, int(cfg.get("count", 4)))]
+
+
+def decode_metrics(cfg: dict, client: Any) -> dict[str, float]:
+    """Lê o dispositivo com o driver configurado e retorna apenas as métricas persistíveis."""
+    driver = cfg.get("driver")
+    base = int(cfg.get("base", 0))
+    if driver == "pzem004t":
+        values = read_pzem004t_metrics(client, base_address=base)
+        return {k: float(values[k]) for k in PZEM004T_METRICS if k in values}
+    if driver == "sdm630":
+        values = read_sdm630_metrics(client, base_address=base)
+        return {k: float(v) for k, v in values.items() if not k.startswith("_") and isinstance(v, (int, float))}
+    custom = custom_register_map(cfg)
+    if custom is not None:
+        regmap, decoder = custom
+        return decoder.decode(read_frame(client, regmap, base))
+    # leitura genérica de regs
+    regs = client.read_input_registers(address=base, count=int(cfg.get("count", 4)))
+    metrics = cfg.get("metrics", DEFAULT_GENERIC_METRICS)
+    out: dict[str, float] = {}
+    for idx, val in enumerate(regs):
+        metric = metrics[idx] if idx < len(metrics) else f"reg_{idx}"
+        out[metric] = float(val)
+    return out
@@ -1,93 +1,99 @@
 """Driver para medidor Eastron SDM630-Modbus-MID (trifásico)."""
 from __future__ import annotations
 from typing import Dict, Any, Union
+from .register_map import RegisterField, RegisterMap, read_frame
+
+
+# Mapa de Input Registers (função 0x04) do SDM630: endereço -> métrica.
+# Todos os valores são Float32 IEEE754 em 2 registradores (word alta primeiro).
+SDM630_FLOAT_REGISTERS: Dict[int, str] = {
+    0x0000: "voltage_l1",
+    0x0002: "voltage_l2",
+    0x0004: "voltage_l3",
+    0x0006: "current_l1",
+    0x0008: "current_l2",
+    0x000A: "current_l3",
+    0x000C: "power_l1",
+    0x000E: "power_l2",
+    0x0010: "power_l3",
+    0x0012: "apparent_power_l1",
+    0x0014: "apparent_power_l2",
+    0x0016: "apparent_power_l3",
+    0x0018: "reactive_power_l1",
+    0x001A: "reactive_power_l2",
+    0x001C: "reactive_power_l3",
+    0x001E: "power_factor_l1",
+    0x0020: "power_factor_l2",
+    0x0022: "power_factor_l3",
+    0x0034: "power_total",
+    0x0038: "apparent_power_total",
+    0x003C: "reactive_power_total",
+    0x003E: "power_factor",
+    0x0046: "frequency",
+    0x0048: "energy_import_kwh",
+    0x004A: "energy_export_kwh",
+    0x004C: "reactive_energy_import_kvarh",
+    0x004E: "reactive_energy_export_kvarh",
+    0x00C8: "voltage_l1_l2",
+    0x00CA: "voltage_l2_l3",
+    0x00CC: "voltage_l3_l1",
+    0x00E0: "current_neutral",
+    0x00EA: "thd_voltage_l1",
+    0x00EC: "thd_voltage_l2",
+    0x00EE: "thd_voltage_l3",
+    0x00F0: "thd_current_l1",
+    0x00F2: "thd_current_l2",
+    0x00F4: "thd_current_l3",
+    0x0156: "energy_total_kwh",
+    0x0158: "reactive_energy_total_kvarh",
+    0x015A: "energy_import_kwh_l1",
+    0x015C: "energy_import_kwh_l2",
+    0x015E: "energy_import_kwh_l3",
+    0x0160: "energy_export_kwh_l1",
+    0x0162: "energy_export_kwh_l2",
+    0x0164: "energy_export_kwh_l3",
+}
+
+SDM630_MAP = RegisterMap(
+    name="sdm630",
+    fields=tuple(RegisterField(name, address, "float32", word_order="big") for address, name in SDM630_FLOAT_REGISTERS.items()),
+)
+SDM630_DECODER = SDM630_MAP.compile()
+
+# Blocos de Input Registers lidos a cada coleta: (endereço, quantidade).
+# O mapa acima cabe em 3 transações (0x00-0x4F, 0xC8-0xF5, 0x156-0x165).
+SDM630_INPUT_BLOCKS = tuple(SDM630_MAP.input_blocks())
 
 
 def read_sdm630_metrics(client: Union[Any, Any], base_address: int = 0) -> Dict[str, Any]:
     """
     Lê métricas do medidor trifásico Eastron SDM630-Modbus-MID.
 
-    Registradores principais (Input Registers, função 0x04):
-    - 0x0000-0x0001: Tensão Fase 1 (V) - Float32
-    - 0x0002-0x0003: Tensão Fase 2 (V) - Float32
-    - 0x0004-0x0005: Tensão Fase 3 (V) - Float32
-    - 0x0006-0x0007: Corrente Fase 1 (A) - Float32
-    - 0x0008-0x0009: Corrente Fase 2 (A) - Float32
-    - 0x000A-0x000B: Corrente Fase 3 (A) - Float32
-    - 0x000C-0x000D: Potência Ativa Fase 1 (W) - Float32
-    - 0x000E-0x000F: Potência Ativa Fase 2 (W) - Float32
-    - 0x0010-0x0011: Potência Ativa Fase 3 (W) - Float32
-    - 0x0034-0x0035: Potência Ativa Total (W) - Float32
-    - 0x0046-0x0047: Frequência (Hz) - Float32
-    - 0x0048-0x0049: Energia Ativa Total (kWh) - Float32
-    - 0x001E-0x001F: Fator de Potência Total - Float32
+    Lê todo o mapa `SDM630_MAP` (Input Registers, função 0x04) nos blocos de
+    `SDM630_INPUT_BLOCKS` e decodifica o quadro com `SDM630_DECODER`: tensões de
+    fase e de linha, correntes (inclusive neutro), potências ativa/aparente/reativa
+    e fator de potência por fase e totais, frequência, THD de tensão e corrente, e
+    energias de importação/exportação.
 
-    Nota: SDM630 usa Float32 IEEE754 (2 registradores por valor)
+    Nota: SDM630 usa Float32 IEEE754 (2 registradores por valor). `power_factor`
+    é o fator de potência total (0x003E); os por fase ficam em `power_factor_l1..l3`.
+    `energy_kwh` é a energia ativa importada (0x0048), mantida por compatibilidade.
     """
+    frame = read_frame(client, SDM630_MAP)
+    values: Dict[str, Any] = SDM630_DECODER.decode(frame)
 
-    # Ler bloco principal (tensões, correntes, potências)
-    regs_main = client.read_input_registers(address=0x0000, count=36)
-
-    # Ler potência total
-    regs_power_total = client.read_input_registers(address=0x0034, count=2)
-
-    # Ler frequência e energia
-    regs_freq_energy = client.read_input_registers(address=0x0046, count=4)
-
-    # Ler fator de potência
-    regs_pf = client.read_input_registers(address=0x001E, count=2)
-
-    def regs_to_float32(reg_high: int, reg_low: int) -> float:
-        """Converte 2 registradores em Float32 IEEE754 (Big Endian)."""
-        import struct
-        # Combinar registradores (Big Endian: high word primeiro)
-        combined = (reg_high << 16) | reg_low
-        # Converter para float
-        return struct.unpack('>f', struct.pack('>I', combined))[0]
-
-    # Extrair valores
-    v1 = regs_to_float32(regs_main[0], regs_main[1])
-    v2 = regs_to_float32(regs_main[2], regs_main[3])
-    v3 = regs_to_float32(regs_main[4], regs_main[5])
-
-    i1 = regs_to_float32(regs_main[6], regs_main[7])
-    i2 = regs_to_float32(regs_main[8], regs_main[9])
-    i3 = regs_to_float32(regs_main[10], regs_main[11])
-
-    p1 = regs_to_float32(regs_main[12], regs_main[13])
-    p2 = regs_to_float32(regs_main[14], regs_main[15])
-    p3 = regs_to_float32(regs_main[16], regs_main[17])
-
-    power_total = regs_to_float32(regs_power_total[0], regs_power_total[1])
-    frequency = regs_to_float32(regs_freq_energy[0], regs_freq_energy[1])
-    energy_kwh = regs_to_float32(regs_freq_energy[2], regs_freq_energy[3])
-    power_factor = regs_to_float32(regs_pf[0], regs_pf[1])
+    v1, v2, v3 = values["voltage_l1"], values["voltage_l2"], values["voltage_l3"]
+    i1, i2, i3 = values["current_l1"], values["current_l2"], values["current_l3"]
 
     return {
-        # Tensões por fase
-        "voltage_l1": v1,
-        "voltage_l2": v2,
-        "voltage_l3": v3,
-        "voltage_avg": (v1 + v2 + v3) / 3,
+        **values,
 
-        # Correntes por fase
-        "current_l1": i1,
-        "current_l2": i2,
-        "current_l3": i3,
+        # Derivadas
+        "voltage_avg": (v1 + v2 + v3) / 3,
         "current_total": i1 + i2 + i3,
+        "energy_kwh": values["energy_import_kwh"],
+        "energy_wh": values["energy_import_kwh"] * 1000,  # Para compatibilidade
 
-        # Potências por fase
-        "power_l1": p1,
-        "power_l2": p2,
-        "power_l3": p3,
-        "power_total": power_total,
-
-        # Outros
-        "frequency": frequency,
-        "energy_kwh": energy_kwh,
-        "energy_wh": energy_kwh * 1000,  # Para compatibilidade
-        "power_factor": power_factor,
-
-        "_raw_main": regs_main,
+        "_raw_main": frame[:SDM630_INPUT_BLOCKS[0][1]].tolist(),
         "_device": "SDM630-Modbus-MID"
     }
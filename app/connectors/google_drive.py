@@ -2,18 +2,38 @@
 import os
 import json
 import io
+import gzip
+import threading
 from datetime import datetime, timedelta
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 import pandas as pd
 from typing import List, Dict, Optional
 
+UPLOAD_CHUNK_SIZE = 4 * 2**20  # upload retomável em pedaços de 4 MiB (múltiplo de 256 KiB)
+UPLOAD_RETRIES = 3  # novas tentativas de cada pedaço (recuo exponencial do googleapiclient)
+
+# IDs dos arquivos por (pasta, nome), compartilhados pelas instâncias do processo:
+# evita um files().list por leitura/envio de um arquivo já visto
+_file_ids: Dict[tuple, str] = {}
+_file_ids_lock = threading.Lock()
+
+
 class GoogleDriveStorage:
-    def __init__(self):
+    def __init__(self, service=None, folder_id: Optional[str] = None):
+        """
+        Args:
+            service: Cliente Drive v3 já construído (ex: um falso em testes); None autentica
+                com GOOGLE_DRIVE_CREDENTIALS_FILE
+            folder_id: Pasta das medições; padrão GOOGLE_DRIVE_FOLDER_ID
+        """
         self.credentials_file = os.getenv("GOOGLE_DRIVE_CREDENTIALS_FILE")
-        self.folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
-        self.service = None
+        self.folder_id = folder_id or os.getenv("GOOGLE_DRIVE_FOLDER_ID")
+        self.service = service
+        if service is not None:
+            return
         
         # Tentar inicializar o serviço
         try:
@@ -41,118 +61,97 @@ class GoogleDriveStorage:
         return build('drive', 'v3', credentials=credentials)
     
     def save_measurement(self, device_id: int, metric: str, value: float, timestamp: datetime = None):
-        """Salvar medição no Google Drive"""
+        """Enfileirar medição para o Google Drive
+
+        Só acrescenta uma linha ao spool local (`drive_spool`); o envio sai em segmentos
+        CSV gzip em segundo plano, sem baixar e regravar o CSV do dia a cada medição.
+        """
         if not self.service:
             print("❌ Google Drive API não inicializada")
             return False
-        
-        try:
-            if timestamp is None:
-                timestamp = datetime.now()
-            
-            # Criar dados da medição
-            data = {
-                'device_id': device_id,
-                'metric': metric,
-                'value': value,
-                'timestamp': timestamp.isoformat()
-            }
-            
-            # Nome do arquivo baseado na data
-            filename = f"measurements_{timestamp.strftime('%Y-%m-%d')}.csv"
-            
-            # Verificar se arquivo já existe
-            file_id = self._get_file_id(filename)
-            
-            if file_id:
-                # Atualizar arquivo existente
-                success = self._append_to_csv(file_id, data)
-            else:
-                # Criar novo arquivo
-                success = self._create_csv_file(filename, data)
-            
-            if success:
-                print(f"✅ Medição salva no Google Drive: {metric}={value}")
-            return success
-                
-        except HttpError as error:
-            print(f"❌ Erro ao salvar no Google Drive: {error}")
-            return False
-        except Exception as error:
-            print(f"❌ Erro inesperado: {error}")
-            return False
+        from app.services.drive_spool import drive_spool
+        drive_spool.append(device_id, metric, value, timestamp)
+        return True
     
-    def _get_file_id(self, filename: str) -> Optional[str]:
-        """Buscar ID do arquivo no Google Drive"""
-        try:
+    def _query(self, q: str) -> List[Dict]:
+        """files().list paginado dentro da pasta; guarda os IDs encontrados no cache"""
+        files, token = [], None
+        while True:
             results = self.service.files().list(
-                q=f"name='{filename}' and parents in '{self.folder_id}'",
-                fields="files(id, name)"
+                q=f"{q} and '{self.folder_id}' in parents and trashed = false",
+                fields="nextPageToken, files(id, name)",
+                pageSize=1000,
+                pageToken=token,
             ).execute()
-            
-            files = results.get('files', [])
+            files.extend(results.get('files', []))
+            token = results.get('nextPageToken')
+            if not token:
+                break
+        with _file_ids_lock:
+            for f in files:
+                _file_ids[(self.folder_id, f['name'])] = f['id']
+        return files
+    
+    def _get_file_id(self, filename: str) -> Optional[str]:
+        """Buscar ID do arquivo no Google Drive (cache do processo, depois files().list)"""
+        with _file_ids_lock:
+            file_id = _file_ids.get((self.folder_id, filename))
+        if file_id:
+            return file_id
+        try:
+            files = self._query(f"name = '{filename}'")
             return files[0]['id'] if files else None
             
         except HttpError as error:
             print(f"❌ Erro ao buscar arquivo: {error}")
             return None
     
-    def _create_csv_file(self, filename: str, data: Dict) -> bool:
-        """Criar novo arquivo CSV"""
-        try:
-            # Criar CSV em memória
-            df = pd.DataFrame([data])
-            csv_content = df.to_csv(index=False)
-            
-            # Upload para Google Drive
-            file_metadata = {
-                'name': filename,
-                'parents': [self.folder_id]
-            }
-            
-            media = io.BytesIO(csv_content.encode('utf-8'))
-            
-            self.service.files().create(
-                body=file_metadata,
-                media_body=media,
-                fields='id'
-            ).execute()
-            
-            print(f"✅ Arquivo criado no Google Drive: {filename}")
-            return True
-            
-        except Exception as error:
-            print(f"❌ Erro ao criar arquivo: {error}")
-            return False
+    def _forget(self, filename: str):
+        with _file_ids_lock:
+            _file_ids.pop((self.folder_id, filename), None)
+    
+    def day_files(self, date: datetime) -> List[Dict]:
+        """Arquivos de medições do dia: o CSV diário antigo e os segmentos .csv.gz do spool"""
+        prefix = f"measurements_{date.strftime('%Y-%m-%d')}"
+        files = self._query(f"name contains '{prefix}'")
+        return sorted(
+            (f for f in files if f['name'] == f"{prefix}.csv" or f['name'].startswith(f"{prefix}_")),
+            key=lambda f: f['name'],
+        )
     
-    def _append_to_csv(self, file_id: str, data: Dict) -> bool:
-        """Adicionar dados ao CSV existente"""
+    def read_file(self, file: Dict) -> pd.DataFrame:
+        """Baixar um arquivo de medições (descomprime segmentos .gz)"""
         try:
-            # Baixar arquivo atual
-            content = self.service.files().get_media(fileId=file_id).execute()
-            
-            # Converter para DataFrame
-            existing_df = pd.read_csv(io.BytesIO(content))
-            
-            # Adicionar nova linha
-            new_df = pd.DataFrame([data])
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-            
-            # Upload do arquivo atualizado
-            csv_content = combined_df.to_csv(index=False)
-            media = io.BytesIO(csv_content.encode('utf-8'))
-            
-            self.service.files().update(
-                fileId=file_id,
-                media_body=media
-            ).execute()
-            
-            print(f"✅ Dados adicionados ao arquivo existente")
-            return True
-            
-        except Exception as error:
-            print(f"❌ Erro ao atualizar arquivo: {error}")
-            return False
+            content = self.service.files().get_media(fileId=file['id']).execute()
+        except HttpError as error:
+            if error.resp.status == 404:
+                self._forget(file['name'])  # removido no Drive: o ID em cache não vale mais
+            raise
+        if file['name'].endswith('.gz'):
+            content = gzip.decompress(content)
+        return pd.read_csv(io.BytesIO(content))
+    
+    def upload_segment(self, filename: str, content: bytes, mimetype: str = 'application/gzip') -> str:
+        """Enviar um segmento com upload retomável; retorna o ID do arquivo
+
+        Idempotente pelo nome: se o arquivo já existe na pasta (envio anterior que
+        terminou mas não foi confirmado localmente), não cria outro.
+        """
+        file_id = self._get_file_id(filename)
+        if file_id:
+            return file_id
+        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        request = self.service.files().create(
+            body={'name': filename, 'parents': [self.folder_id]},
+            media_body=media,
+            fields='id',
+        )
+        response = None
+        while response is None:
+            _, response = request.next_chunk(num_retries=UPLOAD_RETRIES)
+        with _file_ids_lock:
+            _file_ids[(self.folder_id, filename)] = response['id']
+        return response['id']
     
     def get_measurements(self, device_id: int, metric: str, days: int = 7) -> List[Dict]:
         """Buscar medições dos últimos N dias"""
@@ -163,16 +162,11 @@ class GoogleDriveStorage:
         try:
             measurements = []
             
-            # Buscar arquivos dos últimos N dias
+            # Buscar arquivos dos últimos N dias (CSV diário e segmentos)
             for i in range(days):
                 date = datetime.now() - timedelta(days=i)
-                filename = f"measurements_{date.strftime('%Y-%m-%d')}.csv"
-                
-                file_id = self._get_file_id(filename)
-                if file_id:
-                    # Baixar e processar arquivo
-                    content = self.service.files().get_media(fileId=file_id).execute()
-                    df = pd.read_csv(io.BytesIO(content))
+                for file in self.day_files(date):
+                    df = self.read_file(file)
                     
                     # Filtrar por device_id e metric
                     filtered_df = df[
@@ -200,7 +194,7 @@ class GoogleDriveStorage:
         try:
             # Tentar listar arquivos na pasta
             results = self.service.files().list(
-                q=f"parents in '{self.folder_id}'",
+                q=f"'{self.folder_id}' in parents",
                 fields="files(id, name)",
                 pageSize=1
             ).execute()
@@ -73,6 +73,13 @@ class ModbusRTUClient:
         self.instrument.serial.timeout = timeout
         self.instrument.mode = minimalmodbus.MODE_RTU
 
+    @classmethod
+    def from_instrument(cls, instrument: minimalmodbus.Instrument) -> "ModbusRTUClient":
+        """Cria um cliente sobre um Instrument já configurado (porta mantida aberta por quem o criou)."""
+        obj = cls.__new__(cls)
+        obj.instrument = instrument
+        return obj
+
     def read_registers(self, address: int, count: int) -> list[int]:
         return self.instrument.read_registers(address, count, functioncode=3)
 
@@ -93,3 +100,24 @@ class ModbusRTUClient:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+
+
+class PrefetchedRegisters:
+    """Cliente somente-leitura que responde a partir de blocos de registradores já lidos.
+
+    Permite reutilizar os drivers síncronos (pzem004t, sdm630) sobre leituras feitas
+    por outro transporte (ex: cliente assíncrono), sem nova ida ao barramento.
+    """
+
+    def __init__(self, blocks: dict[int, list[int]] | None = None):
+        self.blocks: dict[int, list[int]] = dict(blocks or {})
+
+    def add_block(self, address: int, registers: list[int]):
+        self.blocks[address] = list(registers)
+
+    def read_input_registers(self, address: int, count: int) -> list[int]:
+        for start, regs in self.blocks.items():
+            offset = address - start
+            if offset >= 0 and offset + count <= len(regs):
+                return regs[offset:offset + count]
+        raise KeyError(f"registradores {address}..{address + count - 1} não foram lidos")
@@ -0,0 +1,352 @@
+"""Pool de conexões Modbus TCP persistentes, uma por gateway (host, porta).
+
+Vários escravos (SDM630, PZEM-004T) atrás do mesmo EW11 compartilham um único
+socket de longa duração em vez de abrir/fechar uma conexão por leitura. As
+transações no mesmo gateway são serializadas por um lock (o EW11 atende um único
+barramento RS485); no pool assíncrono o limite por gateway é `concurrency`
+(MODBUS_TCP_PER_GATEWAY_CONCURRENCY), já que o Modbus TCP casa as respostas pelo
+transaction id — RTU sobre TCP não tem esse id e fica sempre serial. Sockets mortos são detectados na falha de conexão e reabertos
+na próxima requisição, respeitando backoff exponencial.
+
+A conexão é do gateway, não do dispositivo: todos os dispositivos atrás dele precisam
+usar o mesmo framer (um pedido com outro é recusado com ValueError) e o timeout da
+conexão é o maior pedido entre eles.
+
+`ModbusTCPConnectionPool` usa o cliente síncrono do pymodbus (scripts, threads);
+`AsyncModbusTCPConnectionPool` usa o cliente assíncrono e deve ser usado sempre a
+partir do mesmo event loop.
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from pymodbus import Framer
+from pymodbus.client import ModbusTcpClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusException, ModbusIOException
+
+
+@dataclass
+class GatewayStats:
+    host: str
+    port: int
+    connected: bool = False
+    connects: int = 0
+    reconnects: int = 0
+    connect_failures: int = 0
+    requests: int = 0
+    request_errors: int = 0
+    last_error: str | None = None
+    backoff_s: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class _Backoff:
+    """Backoff exponencial entre tentativas de (re)conexão."""
+
+    def __init__(self, initial: float = 0.5, maximum: float = 60.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0.0
+        self.next_attempt = 0.0
+
+    def ready(self) -> bool:
+        return time.monotonic() >= self.next_attempt
+
+    def remaining(self) -> float:
+        return max(0.0, self.next_attempt - time.monotonic())
+
+    def failed(self):
+        self.delay = self.initial if self.delay == 0 else min(self.delay * 2, self.maximum)
+        self.next_attempt = time.monotonic() + self.delay
+
+    def succeeded(self):
+        self.delay = 0.0
+        self.next_attempt = 0.0
+
+
+def _is_socket_error(exc: Exception) -> bool:
+    return isinstance(exc, (ConnectionException, OSError))
+
+
+def _as_exception(result: Any) -> Exception | None:
+    """O cliente síncrono devolve (em vez de lançar) `ModbusIOException` quando o socket cai."""
+    if isinstance(result, ModbusIOException):
+        return ConnectionException(str(result))
+    return None
+
+
+def _framer(name: str) -> Framer:
+    """`socket` (Modbus TCP/MBAP) ou `rtu` (RTU sobre TCP, ex: EW11 em modo transparente)."""
+    try:
+        return Framer(name)
+    except ValueError:
+        raise ValueError(f"framer inválido: {name} (use socket ou rtu)") from None
+
+
+def _reuse(conn: _GatewayConnection | _AsyncGatewayConnection, timeout: float, framer: str):
+    """Confere um novo dispositivo na conexão existente do gateway: mesmo framer; vale o maior timeout."""
+    if framer != conn.framer:
+        raise ValueError(
+            f"gateway {conn.stats.host}:{conn.stats.port} já está aberto com framer {conn.framer} (pedido: {framer})"
+        )
+    params = conn.client.comm_params
+    if timeout > (params.timeout_connect or 0):
+        params.timeout_connect = timeout
+
+
+class _GatewayConnection:
+    def __init__(self, host: str, port: int, timeout: float, retries: int, backoff: _Backoff, framer: str = "socket"):
+        self.client = ModbusTcpClient(host=host, port=port, timeout=timeout, retries=retries, framer=_framer(framer))
+        self.framer = framer
+        self.lock = threading.Lock()
+        self.backoff = backoff
+        self.stats = GatewayStats(host=host, port=port)
+
+    def _ensure_connected(self):
+        if self.client.connected:
+            return
+        if not self.backoff.ready():
+            raise ConnectionError(
+                f"Gateway {self.stats.host}:{self.stats.port} em backoff ({self.backoff.remaining():.1f}s)"
+            )
+        if not self.client.connect():
+            self.stats.connect_failures += 1
+            self.backoff.failed()
+            raise ConnectionError(f"Falha ao conectar em {self.stats.host}:{self.stats.port}")
+        if self.stats.connects:
+            self.stats.reconnects += 1
+        self.stats.connects += 1
+        self.backoff.succeeded()
+
+    def execute(self, method: str, **kwargs) -> Any:
+        """Executa uma requisição; em socket morto, reconecta uma vez e repete."""
+        with self.lock:
+            for attempt in (0, 1):
+                self._ensure_connected()
+                self.stats.requests += 1
+                try:
+                    result = getattr(self.client, method)(**kwargs)
+                    io_error = _as_exception(result)
+                    if io_error is not None:
+                        raise io_error
+                except Exception as e:
+                    self.stats.request_errors += 1
+                    self.stats.last_error = str(e)
+                    if _is_socket_error(e):
+                        self.client.close()
+                        if attempt == 0:
+                            continue
+                        self.backoff.failed()
+                    raise
+                if result.isError():
+                    self.stats.request_errors += 1
+                    self.stats.last_error = str(result)
+                    raise ModbusException(f"Erro Modbus: {result}")
+                return result
+
+    def close(self):
+        with self.lock:
+            self.client.close()
+
+    def snapshot(self) -> dict[str, Any]:
+        self.stats.connected = bool(self.client.connected)
+        self.stats.backoff_s = round(self.backoff.remaining(), 3)
+        return self.stats.as_dict()
+
+
+class PooledModbusTCPClient:
+    """Cliente de um escravo sobre a conexão compartilhada do gateway.
+
+    Mesma interface de leitura/escrita de `ModbusTCPClient`; `close()` não fecha o
+    socket compartilhado.
+    """
+
+    def __init__(self, conn: _GatewayConnection, slave_id: int):
+        self._conn = conn
+        self.host = conn.stats.host
+        self.port = conn.stats.port
+        self.slave_id = slave_id
+
+    def connect(self) -> bool:
+        try:
+            with self._conn.lock:
+                self._conn._ensure_connected()
+            return True
+        except ConnectionError:
+            return False
+
+    def read_input_registers(self, address: int, count: int) -> list[int]:
+        """Lê Input Registers (função 0x04)."""
+        return self._conn.execute("read_input_registers", address=address, count=count, slave=self.slave_id).registers
+
+    def read_holding_registers(self, address: int, count: int) -> list[int]:
+        """Lê Holding Registers (função 0x03)."""
+        return self._conn.execute("read_holding_registers", address=address, count=count, slave=self.slave_id).registers
+
+    read_registers = read_holding_registers
+
+    def write_register(self, address: int, value: int) -> Any:
+        """Escreve em um Holding Register (função 0x06)."""
+        return self._conn.execute("write_register", address=address, value=value, slave=self.slave_id)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ModbusTCPConnectionPool:
+    def __init__(self, retries: int = 3, backoff_initial: float = 0.5, backoff_max: float = 60.0):
+        self.retries = retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._conns: dict[tuple[str, int], _GatewayConnection] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, host: str, port: int, timeout: float, framer: str = "socket") -> _GatewayConnection:
+        key = (host, int(port))
+        with self._lock:
+            conn = self._conns.get(key)
+            if conn is None:
+                conn = _GatewayConnection(
+                    host, int(port), timeout, self.retries, _Backoff(self.backoff_initial, self.backoff_max), framer
+                )
+                self._conns[key] = conn
+            else:
+                _reuse(conn, timeout, framer)
+            return conn
+
+    def client(
+        self, host: str, port: int = 502, slave_id: int = 1, timeout: float = 3.0, framer: str = "socket"
+    ) -> PooledModbusTCPClient:
+        return PooledModbusTCPClient(self._get(host, port, timeout, framer), slave_id)
+
+    def stats(self) -> list[dict[str, Any]]:
+        with self._lock:
+            conns = list(self._conns.values())
+        return [c.snapshot() for c in conns]
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for c in conns:
+            c.close()
+
+
+class _AsyncGatewayConnection:
+    def __init__(
+        self, host: str, port: int, timeout: float, retries: int, backoff: _Backoff, framer: str = "socket", concurrency: int = 1
+    ):
+        self.client = AsyncModbusTcpClient(
+            host=host, port=port, timeout=timeout, retries=retries, reconnect_delay=0, framer=_framer(framer)
+        )
+        self.framer = framer
+        # transações em voo no socket: o Modbus TCP casa respostas pelo transaction id; RTU sobre TCP não
+        self.slots = asyncio.Semaphore(max(1, concurrency) if framer == "socket" else 1)
+        self.connect_lock = asyncio.Lock()
+        self.backoff = backoff
+        self.stats = GatewayStats(host=host, port=port)
+
+    async def _ensure_connected(self):
+        if self.client.connected:
+            return
+        async with self.connect_lock:
+            if not self.client.connected:
+                await self._connect()
+
+    async def _connect(self):
+        if not self.backoff.ready():
+            raise ConnectionError(
+                f"Gateway {self.stats.host}:{self.stats.port} em backoff ({self.backoff.remaining():.1f}s)"
+            )
+        if not await self.client.connect():
+            self.stats.connect_failures += 1
+            self.backoff.failed()
+            raise ConnectionError(f"Falha ao conectar em {self.stats.host}:{self.stats.port}")
+        if self.stats.connects:
+            self.stats.reconnects += 1
+        self.stats.connects += 1
+        self.backoff.succeeded()
+
+    async def execute(self, method: str, **kwargs) -> Any:
+        async with self.slots:
+            for attempt in (0, 1):
+                await self._ensure_connected()
+                self.stats.requests += 1
+                try:
+                    result = await getattr(self.client, method)(**kwargs)
+                except Exception as e:
+                    self.stats.request_errors += 1
+                    self.stats.last_error = str(e)
+                    if _is_socket_error(e):
+                        self.client.close()
+                        if attempt == 0:
+                            continue
+                        self.backoff.failed()
+                    raise
+                if result.isError():
+                    self.stats.request_errors += 1
+                    self.stats.last_error = str(result)
+                    raise ModbusException(f"Erro Modbus: {result}")
+                return result
+
+    def snapshot(self) -> dict[str, Any]:
+        self.stats.connected = bool(self.client.connected)
+        self.stats.backoff_s = round(self.backoff.remaining(), 3)
+        return self.stats.as_dict()
+
+
+class AsyncModbusTCPConnectionPool:
+    def __init__(self, retries: int = 3, backoff_initial: float = 0.5, backoff_max: float = 60.0, concurrency: int = 1):
+        """
+        Args:
+            concurrency: Transações simultâneas por gateway (só framer `socket`)
+        """
+        self.retries = retries
+        self.concurrency = concurrency
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._conns: dict[tuple[str, int], _AsyncGatewayConnection] = {}
+
+    def _get(self, host: str, port: int, timeout: float, framer: str = "socket") -> _AsyncGatewayConnection:
+        key = (host, int(port))
+        conn = self._conns.get(key)
+        if conn is None:
+            conn = _AsyncGatewayConnection(
+                host, int(port), timeout, self.retries, _Backoff(self.backoff_initial, self.backoff_max), framer,
+                self.concurrency,
+            )
+            self._conns[key] = conn
+        else:
+            _reuse(conn, timeout, framer)
+        return conn
+
+    async def read_input_registers(
+        self, host: str, port: int, slave_id: int, address: int, count: int, timeout: float = 3.0, framer: str = "socket"
+    ) -> list[int]:
+        """Lê Input Registers (função 0x04) de um escravo atrás do gateway."""
+        conn = self._get(host, port, timeout, framer)
+        result = await conn.execute("read_input_registers", address=address, count=count, slave=slave_id)
+        return result.registers
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [c.snapshot() for c in list(self._conns.values())]
+
+    def close_all(self):
+        conns = list(self._conns.values())
+        self._conns.clear()
+        for c in conns:
+            c.client.close()
+
+
+# Pool compartilhado do processo (clientes síncronos)
+tcp_pool = ModbusTCPConnectionPool()
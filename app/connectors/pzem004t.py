@@ -1,28 +1,32 @@
 from __future__ import annotations
 from typing import Dict, Any
 from .modbus import ModbusRTUClient
+from .register_map import RegisterField, RegisterMap, read_frame
 
 
-def read_pzem004t_metrics(client: ModbusRTUClient, base_address: int = 0) -> Dict[str, Any]:
-    """Lê 5 registradores de entrada a partir de base_address e monta métricas do PZEM-004T.
+# Convenções adotadas (podem variar conforme revisão):
+# - voltage: U16 / 10.0 (V)
+# - current: U16 / 1000.0 (A)
+# - power:   U16 (W)
+# - energy:  U32 (Wh) combinando regs 3 (high) e 4 (low)
+PZEM004T_MAP = RegisterMap(
+    name="pzem004t",
+    fields=(
+        RegisterField("voltage", 0x0000, "u16", scale=0.1),
+        RegisterField("current", 0x0001, "u16", scale=0.001),
+        RegisterField("power", 0x0002, "u16"),
+        RegisterField("energy_wh", 0x0003, "u32", word_order="big"),
+    ),
+)
+PZEM004T_DECODER = PZEM004T_MAP.compile()
+
 
-    Convenções adotadas (podem variar conforme revisão):
-    - voltage: U16 / 10.0 (V)
-    - current: U16 / 1000.0 (A)
-    - power:   U16 (W)
-    - energy:  U32 (Wh) combinando regs 3 (high) e 4 (low)
-    """
-    regs = client.read_input_registers(address=base_address, count=5)
-    if len(regs) < 5:
+def read_pzem004t_metrics(client: ModbusRTUClient, base_address: int = 0) -> Dict[str, Any]:
+    """Lê 5 registradores de entrada a partir de base_address e monta métricas do PZEM-004T (ver `PZEM004T_MAP`)."""
+    frame = read_frame(client, PZEM004T_MAP, base_address)
+    if len(frame) < PZEM004T_DECODER.frame_length:
         raise ValueError("leituras insuficientes do PZEM-004T")
-    voltage_raw, current_raw, power_raw, energy_hi, energy_lo = regs[:5]
-    energy_wh = (int(energy_hi) << 16) | int(energy_lo)
     return {
-        "voltage": float(voltage_raw) / 10.0,
-        "current": float(current_raw) / 1000.0,
-        "power": float(power_raw),
-        "energy_wh": float(energy_wh),
-        "_raw": regs,
+        **PZEM004T_DECODER.decode(frame),
+        "_raw": frame.tolist(),
     }
-
-
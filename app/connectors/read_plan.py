@@ -0,0 +1,57 @@
+"""Planejamento de leituras Modbus: agrupa faixas de registradores no menor número de transações."""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable
+
+
+# Limite do protocolo para Read Holding/Input Registers (funções 0x03/0x04)
+MAX_REGISTERS_PER_READ = 125
+
+
+@dataclass(frozen=True)
+class ReadBlock:
+    address: int
+    count: int
+
+    @property
+    def end(self) -> int:
+        """Primeiro endereço após o bloco."""
+        return self.address + self.count
+
+
+def plan_reads(
+    ranges: Iterable[tuple[int, int]],
+    max_count: int = MAX_REGISTERS_PER_READ,
+    max_gap: int | None = None,
+) -> list[ReadBlock]:
+    """Funde faixas (endereço, quantidade) em blocos contíguos de até `max_count` registradores.
+
+    Faixas sobrepostas ou adjacentes sempre são fundidas. Faixas separadas por um
+    intervalo são fundidas enquanto o bloco resultante couber em `max_count` e o
+    intervalo não passar de `max_gap` (None = qualquer intervalo). Ler alguns
+    registradores a mais custa bem menos que uma ida e volta extra ao gateway.
+    Faixas maiores que `max_count` são divididas.
+    """
+    if max_count < 1 or max_count > MAX_REGISTERS_PER_READ:
+        raise ValueError(f"max_count deve estar entre 1 e {MAX_REGISTERS_PER_READ}")
+    spans = sorted((int(a), int(a) + int(c)) for a, c in ranges if int(c) > 0)
+    blocks: list[ReadBlock] = []
+    cur_start: int | None = None
+    cur_end = 0
+    for start, end in spans:
+        if cur_start is not None:
+            gap = start - cur_end
+            fits = max(end, cur_end) - cur_start <= max_count
+            if gap <= 0 or (fits and (max_gap is None or gap <= max_gap)):
+                cur_end = max(cur_end, end)
+                continue
+        if cur_start is not None:
+            blocks.extend(_split(cur_start, cur_end, max_count))
+        cur_start, cur_end = start, end
+    if cur_start is not None:
+        blocks.extend(_split(cur_start, cur_end, max_count))
+    return blocks
+
+
+def _split(start: int, end: int, max_count: int) -> list[ReadBlock]:
+    return [ReadBlock(a, min(max_count, end - a)) for a in range(start, end, max_count)]
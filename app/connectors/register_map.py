@@ -0,0 +1,158 @@
+"""Mapas de registradores declarativos com decodificação vetorizada (NumPy).
+
+Um `RegisterMap` descreve as métricas de um medidor (endereço, tipo, ordem das
+words, escala). `compile()` gera um `CompiledDecoder` que converte o quadro de
+registradores lido (blocos do plano de leitura concatenados) em todas as métricas
+de uma vez: os índices de cada campo são pré-calculados e cada grupo de tipo é
+decodificado com uma única operação vetorizada, inclusive para lotes de quadros.
+
+Formato declarativo (ex: `Device.config["register_map"]`):
+
+    [{"name": "voltage", "address": 0, "type": "u16", "scale": 0.1},
+     {"name": "energy_wh", "address": 3, "type": "u32", "word_order": "big"}]
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Iterable, Sequence
+import numpy as np
+from .read_plan import plan_reads, MAX_REGISTERS_PER_READ
+
+
+REGISTER_TYPES = {"u16": 1, "i16": 1, "u32": 2, "i32": 2, "float32": 2}
+WORD_ORDERS = ("big", "little")  # big: word alta primeiro; little: word baixa primeiro
+
+
+@dataclass(frozen=True)
+class RegisterField:
+    name: str
+    address: int
+    type: str = "u16"
+    word_order: str = "big"
+    scale: float = 1.0
+
+    def __post_init__(self):
+        if self.type not in REGISTER_TYPES:
+            raise ValueError(f"tipo de registrador inválido para '{self.name}': {self.type}")
+        if self.word_order not in WORD_ORDERS:
+            raise ValueError(f"word_order inválido para '{self.name}': {self.word_order}")
+        if self.address < 0:
+            raise ValueError(f"endereço inválido para '{self.name}': {self.address}")
+
+    @property
+    def words(self) -> int:
+        return REGISTER_TYPES[self.type]
+
+
+@dataclass(frozen=True)
+class RegisterMap:
+    name: str
+    fields: tuple[RegisterField, ...]
+    max_gap: int | None = None
+
+    @classmethod
+    def from_config(cls, name: str, fields: Iterable[dict[str, Any]], max_gap: int | None = None) -> RegisterMap:
+        """Cria o mapa a partir da forma declarativa (lista de dicts)."""
+        parsed = []
+        for f in fields:
+            parsed.append(RegisterField(
+                name=str(f["name"]),
+                address=int(f["address"]),
+                type=str(f.get("type", "u16")),
+                word_order=str(f.get("word_order", "big")),
+                scale=float(f.get("scale", 1.0)),
+            ))
+        if not parsed:
+            raise ValueError("register_map vazio")
+        return cls(name=name, fields=tuple(parsed), max_gap=max_gap)
+
+    def input_blocks(self, base_address: int = 0) -> list[tuple[int, int]]:
+        """Blocos (endereço, quantidade) a ler, já agrupados pelo planejador."""
+        blocks = plan_reads(((f.address, f.words) for f in self.fields), MAX_REGISTERS_PER_READ, self.max_gap)
+        return [(base_address + b.address, b.count) for b in blocks]
+
+    def compile(self) -> CompiledDecoder:
+        return CompiledDecoder(self)
+
+
+class CompiledDecoder:
+    """Decodificador pré-calculado de um `RegisterMap`.
+
+    O quadro de entrada é a concatenação dos blocos de `input_blocks()` na ordem.
+    """
+
+    def __init__(self, regmap: RegisterMap):
+        self.regmap = regmap
+        blocks = regmap.input_blocks()
+        self.frame_length = sum(c for _, c in blocks)
+        frame_offset: dict[int, int] = {}
+        pos = 0
+        for address, count in blocks:
+            for i in range(count):
+                frame_offset[address + i] = pos + i
+            pos += count
+
+        self.names: list[str] = []
+        groups: dict[str, dict[str, list]] = {}
+        for f in regmap.fields:
+            g = groups.setdefault(f.type, {"out": [], "hi": [], "lo": [], "scale": []})
+            first = frame_offset[f.address]
+            if f.words == 2:
+                second = frame_offset[f.address + 1]
+                hi, lo = (first, second) if f.word_order == "big" else (second, first)
+            else:
+                hi, lo = first, first
+            g["out"].append(len(self.names))
+            g["hi"].append(hi)
+            g["lo"].append(lo)
+            g["scale"].append(f.scale)
+            self.names.append(f.name)
+
+        self._groups = [
+            (
+                rtype,
+                np.asarray(g["out"], dtype=np.intp),
+                np.asarray(g["hi"], dtype=np.intp),
+                np.asarray(g["lo"], dtype=np.intp),
+                np.asarray(g["scale"], dtype=np.float64),
+            )
+            for rtype, g in groups.items()
+        ]
+
+    def decode_many(self, frames: np.ndarray) -> np.ndarray:
+        """Decodifica um lote de quadros (N x frame_length, uint16) em uma matriz N x métricas (float64)."""
+        regs = np.asarray(frames, dtype=np.uint16)
+        if regs.ndim == 1:
+            regs = regs.reshape(1, -1)
+        if regs.shape[1] < self.frame_length:
+            raise ValueError(f"quadro com {regs.shape[1]} registradores; esperado {self.frame_length}")
+        out = np.empty((regs.shape[0], len(self.names)), dtype=np.float64)
+        for rtype, idx_out, hi, lo, scale in self._groups:
+            if rtype == "u16":
+                raw = regs[:, hi].astype(np.float64)
+            elif rtype == "i16":
+                raw = regs[:, hi].view(np.int16).astype(np.float64)
+            else:
+                # words -> uint32 nativo; float32/i32 reinterpretam os mesmos bits
+                words = (regs[:, hi].astype(np.uint32) << 16) | regs[:, lo].astype(np.uint32)
+                if rtype == "float32":
+                    raw = words.view(np.float32).astype(np.float64)
+                elif rtype == "i32":
+                    raw = words.view(np.int32).astype(np.float64)
+                else:
+                    raw = words.astype(np.float64)
+            out[:, idx_out] = raw * scale
+        return out
+
+    def decode(self, frame: Sequence[int] | np.ndarray) -> dict[str, float]:
+        """Decodifica um único quadro em {métrica: valor}."""
+        row = self.decode_many(np.asarray(frame, dtype=np.uint16).reshape(1, -1))[0]
+        return dict(zip(self.names, row.tolist()))
+
+
+def read_frame(client: Any, regmap: RegisterMap, base_address: int = 0) -> np.ndarray:
+    """Lê todos os blocos do mapa e devolve o quadro concatenado (uint16)."""
+    parts = [
+        np.asarray(client.read_input_registers(address=address, count=count), dtype=np.uint16)
+        for address, count in regmap.input_blocks(base_address)
+    ]
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
@@ -1,26 +1,157 @@
 from __future__ import annotations
-from typing import Any
+import threading
+import time
+from typing import Any, Iterable
 import tinytuya
 
 
+# Endpoint de status em lote da Tuya Cloud: até 20 device_ids por chamada
+TUYA_BATCH_STATUS_URL = "/v1.0/iot-03/devices/status"
+TUYA_STATUS_BATCH_SIZE = 20
+
+# Códigos padrão de tomadas/medidores Tuya -> (métrica, escala)
+TUYA_METRIC_CODES: dict[str, tuple[str, float]] = {
+    "cur_voltage": ("voltage", 0.1),
+    "cur_current": ("current", 0.001),
+    "cur_power": ("power", 0.1),
+    "add_ele": ("energy_added_kwh", 0.001),
+    "switch_1": ("switch", 1.0),
+    "switch": ("switch", 1.0),
+}
+
+# DPS numéricos (protocolo local) -> código equivalente na nuvem
+TUYA_DPS_CODES: dict[str, str] = {
+    "1": "switch_1",
+    "17": "add_ele",
+    "18": "cur_current",
+    "19": "cur_power",
+    "20": "cur_voltage",
+}
+
+
+class TuyaCloudError(RuntimeError):
+    pass
+
+
+def map_tuya_status(status: dict[str, Any], dps_map: dict[str, Any] | None = None) -> dict[str, float]:
+    """Converte o status Tuya ({código ou DPS: valor}) em métricas.
+
+    `dps_map` (ex: `Device.config["dps_map"]`) sobrescreve ou estende o mapa padrão:
+    {"cur_power": {"metric": "power", "scale": 0.1}, "101": {"metric": "temperature"}}.
+    Códigos sem mapeamento e valores não numéricos são ignorados; booleanos viram 1.0/0.0.
+    """
+    out: dict[str, float] = {}
+    for code, value in status.items():
+        key = str(code)
+        custom = (dps_map or {}).get(key)
+        if custom is not None:
+            metric, scale = custom["metric"], float(custom.get("scale", 1.0))
+        else:
+            mapped = TUYA_METRIC_CODES.get(TUYA_DPS_CODES.get(key, key))
+            if mapped is None:
+                continue
+            metric, scale = mapped
+        if isinstance(value, bool):
+            out[metric] = 1.0 if value else 0.0
+        elif isinstance(value, (int, float)):
+            out[metric] = float(value) * scale
+    return out
+
+
 class TuyaAPIClient:
-    def __init__(self, api_region: str, api_key: str, api_secret: str, api_uid: str):
+    def __init__(
+        self,
+        api_region: str,
+        api_key: str,
+        api_secret: str,
+        api_uid: str,
+        token_ttl: float = 3600.0,
+        device_list_ttl: float = 600.0,
+        rate_limiter: Any | None = None,
+    ):
+        """
+        Args:
+            token_ttl: Validade assumida do token (s); renovado antes de expirar (a Tuya emite 7200 s)
+            device_list_ttl: Tempo (s) que a lista de dispositivos fica em cache
+            rate_limiter: Objeto com `acquire()` chamado antes de cada requisição (ex: `TokenBucket`)
+        """
         self.client = tinytuya.Cloud(
             apiRegion=api_region,
             apiKey=api_key,
             apiSecret=api_secret,
             apiDeviceID=api_uid,
         )
+        self.token_ttl = token_ttl
+        self.device_list_ttl = device_list_ttl
+        self.rate_limiter = rate_limiter
+        self._token_at = time.monotonic()
+        self._devices: list[dict[str, Any]] | None = None
+        self._devices_at = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.token_refreshes = 0
+        self.device_list_hits = 0
+
+    def _call(self, fn, *args, **kwargs):
+        with self._lock:
+            if time.monotonic() - self._token_at >= self.token_ttl:
+                self._refresh_token()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        self.requests += 1
+        return fn(*args, **kwargs)
 
-    def list_devices(self) -> list[dict[str, Any]]:
-        data = self.client.getdevices()
-        return data or []
+    def _refresh_token(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        self.requests += 1
+        self.client._gettoken()
+        self._token_at = time.monotonic()
+        self.token_refreshes += 1
+        if not self.client.token:
+            raise TuyaCloudError(f"falha ao renovar token Tuya: {self.client.error}")
+
+    def list_devices(self, force: bool = False) -> list[dict[str, Any]]:
+        """Lista de dispositivos da conta, em cache por `device_list_ttl` segundos."""
+        if not force and self._devices is not None and time.monotonic() - self._devices_at < self.device_list_ttl:
+            self.device_list_hits += 1
+            return self._devices
+        data = self._call(self.client.getdevices)
+        if isinstance(data, dict) and data.get("Error"):
+            raise TuyaCloudError(str(data.get("Payload") or data.get("Error")))
+        self._devices = data or []
+        self._devices_at = time.monotonic()
+        return self._devices
 
     def get_status(self, device_id: str) -> dict[str, Any]:
-        status = self.client.getstatus(device_id)
+        status = self._call(self.client.getstatus, device_id)
         return status or {}
 
+    def get_status_batch(self, device_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Status de vários dispositivos, `TUYA_STATUS_BATCH_SIZE` por requisição.
+
+        Retorna {device_id: {código: valor}}; dispositivos ausentes na resposta ficam de fora.
+        """
+        ids = list(dict.fromkeys(device_ids))
+        out: dict[str, dict[str, Any]] = {}
+        for i in range(0, len(ids), TUYA_STATUS_BATCH_SIZE):
+            chunk = ids[i:i + TUYA_STATUS_BATCH_SIZE]
+            resp = self._call(self.client.cloudrequest, TUYA_BATCH_STATUS_URL, query={"device_ids": ",".join(chunk)})
+            if not resp or not resp.get("success"):
+                msg = (resp or {}).get("msg") or (resp or {}).get("Payload") or "sem resposta"
+                raise TuyaCloudError(f"status em lote falhou ({len(chunk)} dispositivos): {msg}")
+            for item in resp.get("result") or []:
+                out[item["id"]] = {s["code"]: s.get("value") for s in item.get("status") or []}
+        return out
+
     def get_energy_data(self, device_id: str) -> dict[str, Any]:
         # Placeholder genérico; alguns dispositivos Tuya expõem dps específicos (p.ex 101, 102)
         return self.get_status(device_id)
 
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "token_refreshes": self.token_refreshes,
+            "device_list_cached": self._devices is not None,
+            "device_list_hits": self.device_list_hits,
+        }
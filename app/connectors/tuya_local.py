@@ -0,0 +1,58 @@
+"""Cliente Tuya pela rede local (protocolo LAN do tinytuya, porta 6668).
+
+Cada `TuyaLocalSession` mantém o socket do dispositivo aberto entre leituras
+(`persist=True`), então uma leitura custa uma troca de quadros na LAN em vez de
+uma chamada à nuvem. Requer o `local_key` e o IP do dispositivo.
+"""
+from __future__ import annotations
+import threading
+from typing import Any
+import tinytuya
+
+
+class TuyaLocalError(ConnectionError):
+    pass
+
+
+class TuyaLocalSession:
+    def __init__(
+        self,
+        tuya_id: str,
+        address: str,
+        local_key: str,
+        version: float = 3.3,
+        port: int = 6668,
+        timeout: float = 2.0,
+    ):
+        self.tuya_id = tuya_id
+        self.address = address
+        self.port = port
+        self.device = tinytuya.Device(
+            tuya_id,
+            address=address,
+            local_key=local_key,
+            version=float(version),
+            persist=True,
+            connection_timeout=timeout,
+            connection_retry_limit=1,
+            connection_retry_delay=0,
+            port=port,
+        )
+        # o recv já bloqueia até a resposta; a espera fixa de 10 ms após o envio só soma latência
+        self.device.set_sendWait(None)
+        self._lock = threading.Lock()
+
+    def status(self) -> dict[str, Any]:
+        """Lê os DPS do dispositivo ({"18": 123, ...}); levanta `TuyaLocalError` se não responder."""
+        with self._lock:
+            data = self.device.status()
+            if not data or "Error" in data or "dps" not in data:
+                # socket possivelmente quebrado: a próxima leitura reconecta
+                self.device.close()
+                err = (data or {}).get("Error", "sem resposta")
+                raise TuyaLocalError(f"Tuya local {self.address}:{self.port} ({self.tuya_id}): {err}")
+            return data["dps"]
+
+    def close(self):
+        with self._lock:
+            self.device.close()
@@ -5,9 +5,60 @@ class Settings(BaseSettings):
     app_name: str = "Energy Meter Master"
     api_prefix: str = "/api"
     database_url: str = "sqlite:///./data/app.db"
+    sqlite_profile: str = "default"  # default | timeseries (WAL, pragmas e measurements clusterizada)
+    sqlite_mmap_size: int = 256 * 2**20  # perfil timeseries: bytes mapeados em memória
+    sqlite_cache_size_kib: int = 64 * 1024  # perfil timeseries: cache de páginas por conexão
     enable_forwarding: bool = True
     forwarder_url: str | None = None
     scheduler_timezone: str = "UTC"
+    poll_interval_default: float = 30.0
+    poll_jitter: float = 0.1
+    poll_dispatch_workers: int = 8
+    poll_overlap_policy: str = "skip"  # skip | coalesce | queue
+    device_registry_resync: float = 0.0  # recarga completa do registro de dispositivos a cada N s (0 = desligado)
+    embedded_poller: bool = False  # True: a API também coleta (processo único); senão use `python -m app.worker`
+    worker_lease_ttl: float = 30.0  # validade do heartbeat/leases de um worker de coleta (s)
+    worker_rebalance_interval: float = 10.0  # heartbeat + redistribuição de dispositivos (s)
+    worker_registry_resync: float = 60.0  # no worker, alterações feitas pela API chegam por recarga periódica (s)
+    measurement_partitioning: str = "none"  # none | monthly (uma tabela/partição por mês)
+    measurement_retention_days: float = 0  # com partições: apaga meses inteiros mais antigos que N dias (0 = guarda tudo)
+    rollups_enabled: bool = True  # agregados de 1 min/15 min/1 h/1 dia mantidos na gravação (timerange, demand)
+    rollup_refresh_interval: float = 30.0  # recálculo dos trechos pendentes dos rollups (s)
+    energy_timezone: str = "UTC"  # fuso dos dias e meses de consumo (ex: America/Sao_Paulo)
+    energy_tariff_kwh: float = 0.65  # R$/kWh padrão; por dispositivo: config["tariff_kwh"]
+    energy_max_power_kw: float = 1000.0  # salto de contador acima disso (média no intervalo) = troca de medidor; por dispositivo: config["max_power_kw"]
+    energy_refresh_interval: float = 60.0  # recálculo das energias por hora/dia/mês (s)
+    cold_tier_after_days: float = 0  # move meses fechados há mais de N dias para arquivos colunares (0 = desligado)
+    cold_tier_dir: str = "./data/cold"  # segmentos frios (.npy mapeados em memória nas consultas)
+    cold_tier_format: str = "npy"  # npy (arquivos em COLD_TIER_DIR) | gorilla (blocos comprimidos no banco, sem perdas)
+    cold_tier_interval: float = 3600.0  # intervalo do job de tiering (s)
+    drive_spool_dir: str = "./data/drive_spool"  # medições aguardando envio ao Google Drive (CSV local, só acréscimo)
+    drive_segment_rows: int = 50000  # linhas por segmento .csv.gz enviado ao Drive
+    drive_segment_age: float = 300.0  # fecha e envia o segmento após N s mesmo incompleto
+    drive_upload_interval: float = 30.0  # ciclo da thread de envio ao Drive (s); com erro, recuo exponencial
+    measurement_layout: str = "rows"  # rows (uma linha por métrica) | snapshot (uma linha por leitura do dispositivo)
+    ingest_queue_max: int = 10000  # medições aceitas e ainda não gravadas; acima disso POST /ingest responde 429
+    ingest_batch_size: int = 500  # linhas por commit da fila de ingestão
+    ingest_flush_interval: float = 0.2  # espera máxima (s) de uma medição aceita antes de ir ao banco
+    telemetry_history: int = 500
+    breaker_failure_threshold: int = 3
+    breaker_backoff_initial: float = 30.0
+    breaker_backoff_max: float = 1800.0
+    deadband_enabled: bool = True
+    deadband_max_silence: float = 300.0  # heartbeat: grava cada métrica ao menos a cada N s
+    modbus_tcp_max_concurrency: int = 100
+    modbus_tcp_per_gateway_concurrency: int = 1
+    tuya_api_region: str = "us"
+    tuya_api_key: str | None = None
+    tuya_api_secret: str | None = None
+    tuya_api_uid: str | None = None
+    tuya_rate_limit: float = 10.0  # requisições/s por conta Tuya
+    tuya_rate_burst: int = 20
+    tuya_token_ttl: float = 3600.0
+    tuya_device_list_ttl: float = 600.0
+    tuya_local_max_concurrency: int = 32
+    tuya_local_timeout: float = 2.0
+    tuya_local_retry_after: float = 60.0  # após falha na LAN, lê pela nuvem por este tempo (s)
 
     class Config:
         env_file = ".env"
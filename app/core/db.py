@@ -1,13 +1,45 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
 from .config import settings
+from . import sqlite_profile
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(settings.database_url, connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {})
+def make_engine(url: str, profile: str = "default", **kwargs):
+    """Engine do banco; em SQLite aplica o perfil (`SQLITE_PROFILE`, ver `sqlite_profile.py`)."""
+    is_sqlite = url.startswith("sqlite")
+    engine = create_engine(url, connect_args={"check_same_thread": False} if is_sqlite else {}, **kwargs)
+    if is_sqlite:
+        sqlite_profile.apply_profile(engine, profile, settings.sqlite_mmap_size, settings.sqlite_cache_size_kib)
+    return engine
+
+
+def init_db(bind=None, profile: str | None = None):
+    """Cria as tabelas que faltam; no perfil timeseries, `measurements` nasce clusterizada; prepara partições e rollups."""
+    from ..services.partitions import partitions
+    from ..services.energy import energy
+    from ..services.rollups import rollups
+
+    bind = bind or engine
+    profile = profile or settings.sqlite_profile
+    if profile == "timeseries" and bind.dialect.name == "sqlite":
+        sqlite_profile.create_clustered_tables(bind)
+    if partitions.enabled(bind) and bind.dialect.name == "postgresql":
+        # tabela-mãe particionada antes do create_all (que criaria a comum); `devices` antes, pela FK
+        Base.metadata.create_all(bind=bind, tables=[t for t in Base.metadata.sorted_tables if t.name != "measurements"])
+        partitions.create_parent(bind)
+    Base.metadata.create_all(bind=bind)
+    sqlite_profile.warn_if_unclustered(bind, profile)
+    partitions.init(bind)
+    rollups.init(bind)
+    energy.init(bind)
+
+
+engine = make_engine(settings.database_url, settings.sqlite_profile)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -19,4 +51,14 @@ def get_db():
         db.close()
 
 
-
+def insert_ignore(db: Session, table, rows: list[dict]) -> int:
+    """INSERT ... ON CONFLICT DO NOTHING (SQLite/PostgreSQL); retorna quantas linhas entraram."""
+    if not rows:
+        return 0
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(db.get_bind().dialect.name)
+    if dialect is None:
+        raise RuntimeError(f"INSERT ... ON CONFLICT não suportado no banco {db.get_bind().dialect.name}")
+    inserted = 0
+    for i in range(0, len(rows), 500):  # limite de parâmetros por instrução
+        inserted += db.execute(dialect.insert(table).values(rows[i:i + 500]).on_conflict_do_nothing()).rowcount
+    return inserted
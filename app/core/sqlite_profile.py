@@ -0,0 +1,216 @@
+"""Perfil "timeseries" do SQLite: pragmas de escrita contínua e tabela de medições clusterizada.
+
+`SQLITE_PROFILE=timeseries` aplica, em cada conexão nova (evento `connect` do engine):
+
+- `journal_mode=WAL`: leitores não bloqueiam o escritor e cada commit é um append no WAL;
+- `synchronous=NORMAL`: sem fsync por commit (no WAL continua consistente; uma queda de
+  energia pode perder só as últimas transações);
+- `mmap_size`, `cache_size`, `temp_store=MEMORY` e `busy_timeout` para leituras de intervalo
+  e vários processos (API e workers) no mesmo arquivo.
+
+Num banco novo, `measurements` é criada como tabela WITHOUT ROWID com chave primária
+(device_id, metric, timestamp, id): as linhas ficam gravadas na ordem da chave, a
+consulta de série de uma métrica lê páginas contíguas e não há índices secundários
+para manter. Como WITHOUT ROWID não tem AUTOINCREMENT, os ids vêm de
+`measurement_id_seq`, reservados em bloco na mesma transação do INSERT (a mesma
+sequência numera as partições mensais, ver `services/partitions.py`).
+
+Bancos existentes continuam com a tabela antiga (com aviso no log) até a migração:
+
+    python -m app.core.sqlite_profile migrate                  # usa DATABASE_URL
+    python -m app.core.sqlite_profile migrate --database-url sqlite:///./data/app.db
+"""
+from __future__ import annotations
+import argparse
+import logging
+import weakref
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+logger = logging.getLogger("pieng.audit")
+
+PROFILES = ("default", "timeseries")
+
+CLUSTERED_MEASUREMENTS_DDL = """
+CREATE TABLE {name} (
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    metric VARCHAR(100) NOT NULL,
+    timestamp DATETIME NOT NULL,
+    id INTEGER NOT NULL,
+    value FLOAT,
+    extra JSON,
+    PRIMARY KEY (device_id, metric, timestamp, id)
+) WITHOUT ROWID
+"""
+SEQUENCE_DDL = "CREATE TABLE IF NOT EXISTS measurement_id_seq (id INTEGER PRIMARY KEY CHECK (id = 1), next INTEGER NOT NULL)"
+
+_clustered: weakref.WeakKeyDictionary[Engine, bool] = weakref.WeakKeyDictionary()
+_sequenced: weakref.WeakKeyDictionary[Engine, bool] = weakref.WeakKeyDictionary()
+
+
+def apply_profile(engine: Engine, profile: str, mmap_size: int = 256 * 2**20, cache_size_kib: int = 64 * 1024):
+    """Registra os pragmas do perfil nas conexões do engine (só SQLite; "default" não muda nada)."""
+    if profile not in PROFILES:
+        raise ValueError(f"perfil SQLite desconhecido: {profile} (use {', '.join(PROFILES)})")
+    if engine.dialect.name != "sqlite" or profile == "default":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cur.execute(f"PRAGMA cache_size={-int(cache_size_kib)}")  # negativo = KiB
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.close()
+
+
+def _table_sql(conn, name: str) -> str | None:
+    return conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": name}).scalar()
+
+
+def _engine(bind) -> Engine:
+    engine = bind.get_bind() if isinstance(bind, Session) else bind
+    return getattr(engine, "engine", engine)  # Connection -> Engine
+
+
+def is_clustered(bind) -> bool:
+    """True se `measurements` é a tabela WITHOUT ROWID."""
+    engine = _engine(bind)
+    if engine.dialect.name != "sqlite":
+        return False
+    cached = _clustered.get(engine)
+    if cached is None:
+        with engine.connect() as conn:
+            sql = _table_sql(conn, "measurements") or ""
+        cached = _clustered[engine] = "WITHOUT ROWID" in sql.upper()
+    return cached
+
+
+def uses_id_sequence(bind) -> bool:
+    """True se os ids de medição vêm de `measurement_id_seq` (tabela clusterizada ou partições)."""
+    engine = _engine(bind)
+    if engine.dialect.name != "sqlite":
+        return False
+    cached = _sequenced.get(engine)
+    if cached is None:
+        with engine.connect() as conn:
+            cached = _sequenced[engine] = _table_sql(conn, "measurement_id_seq") is not None
+    return cached
+
+
+def ensure_sequence(conn):
+    """Cria a sequência de ids, começando depois do maior id já gravado em `measurements`."""
+    if _table_sql(conn, "measurement_id_seq") is None:
+        conn.execute(text(SEQUENCE_DDL))
+        start = 1
+        if _table_sql(conn, "measurements") is not None:
+            start = conn.execute(text("SELECT COALESCE(MAX(id), 0) + 1 FROM measurements")).scalar_one()
+        conn.execute(text("INSERT INTO measurement_id_seq (id, next) VALUES (1, :n)"), {"n": start})
+    _sequenced.pop(conn.engine, None)
+
+
+def create_clustered_tables(engine: Engine):
+    """Cria `measurements` clusterizada e a sequência de ids se a tabela ainda não existir."""
+    with engine.begin() as conn:
+        if _table_sql(conn, "measurements") is None:
+            conn.execute(text(CLUSTERED_MEASUREMENTS_DDL.format(name="measurements")))
+            ensure_sequence(conn)
+    _clustered.pop(engine, None)
+
+
+def warn_if_unclustered(engine: Engine, profile: str):
+    if profile == "timeseries" and engine.dialect.name == "sqlite" and not is_clustered(engine):
+        logger.warning(
+            "SQLITE_PROFILE_UNMIGRATED | measurements ainda é tabela rowid; "
+            "rode `python -m app.core.sqlite_profile migrate` para a versão clusterizada"
+        )
+
+
+def allocate_ids(db: Session, count: int) -> int:
+    """Reserva `count` ids consecutivos na transação de `db`; retorna o primeiro."""
+    last = db.execute(
+        text("UPDATE measurement_id_seq SET next = next + :n WHERE id = 1 RETURNING next"), {"n": count}
+    ).scalar_one()
+    return last - count
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_measurement_ids(session: Session, _context, _instances):
+    """Medições adicionadas pelo ORM (`db.add`) também recebem ids da sequência."""
+    from ..models import Measurement
+
+    new = [o for o in session.new if isinstance(o, Measurement) and o.id is None]
+    if new and uses_id_sequence(session):
+        first = allocate_ids(session, len(new))
+        for i, obj in enumerate(new):
+            obj.id = first + i
+
+
+def migrate(engine: Engine, batch: int = 200_000) -> int:
+    """Copia `measurements` para a tabela clusterizada, na ordem da chave; retorna as linhas copiadas.
+
+    Roda numa transação só: se falhar no meio, o banco fica como estava. Precisa de
+    espaço livre para uma cópia da tabela.
+    """
+    with engine.begin() as conn:
+        sql = _table_sql(conn, "measurements")
+        if sql is None:
+            raise RuntimeError("tabela measurements não existe")
+        if "WITHOUT ROWID" in sql.upper():
+            return 0
+        conn.execute(text("DROP TABLE IF EXISTS measurements_clustered"))
+        conn.execute(text(CLUSTERED_MEASUREMENTS_DDL.format(name="measurements_clustered")))
+        copied = 0
+        last_id = conn.execute(text("SELECT MIN(id) - 1 FROM measurements")).scalar()
+        while last_id is not None:  # em blocos de id, para não materializar a tabela inteira no ORDER BY
+            copied += conn.execute(text(
+                "INSERT INTO measurements_clustered (device_id, metric, timestamp, id, value, extra) "
+                "SELECT device_id, metric, timestamp, id, value, extra FROM measurements "
+                "WHERE id > :last AND id <= :upto ORDER BY device_id, metric, timestamp, id"
+            ), {"last": last_id, "upto": last_id + batch}).rowcount
+            last_id = conn.execute(
+                text("SELECT MIN(id) - 1 FROM measurements WHERE id > :upto"), {"upto": last_id + batch}
+            ).scalar()
+        next_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) + 1 FROM measurements")).scalar_one()
+        conn.execute(text("DROP TABLE measurements"))  # leva junto os índices antigos
+        conn.execute(text("ALTER TABLE measurements_clustered RENAME TO measurements"))
+        conn.execute(text(SEQUENCE_DDL))
+        # com partições a sequência já existe e pode estar à frente
+        conn.execute(text(
+            "INSERT INTO measurement_id_seq (id, next) VALUES (1, :n) "
+            "ON CONFLICT (id) DO UPDATE SET next = MAX(next, excluded.next)"
+        ), {"n": next_id})
+    _clustered.pop(engine, None)
+    _sequenced.pop(engine, None)
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    logger.info(f"SQLITE_PROFILE_MIGRATED | rows={copied}")
+    return copied
+
+
+def main():
+    from .config import settings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "status"])
+    parser.add_argument("--database-url", default=settings.database_url)
+    args = parser.parse_args()
+    if not args.database_url.startswith("sqlite"):
+        parser.error("o perfil timeseries é só para SQLite")
+    engine = create_engine(args.database_url)
+    if args.command == "status":
+        with engine.connect() as conn:
+            mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+        print(f"measurements clusterizada: {is_clustered(engine)}  journal_mode: {mode}")
+        return
+    copied = migrate(engine)
+    print(f"{copied} medições copiadas para a tabela clusterizada" if copied else "nada a migrar")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,30 @@
 from __future__ import annotations
+from datetime import datetime
+from typing import Callable, Iterable
+import numpy as np
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from . import models, schemas
+from .core import sqlite_profile
+from .core.config import settings
+from .services import snapshots
+from .services.cold_tier import cold_tier, to_us_array
+from .services.partitions import month_key, partitions
+from .services.energy import energy
+from .services.rollups import rollups
+
+
+# Chamados com o device_id após criar/alterar/remover um dispositivo (ex: registro em memória)
+_device_listeners: list[Callable[[int], None]] = []
+
+
+def on_device_change(callback: Callable[[int], None]):
+    _device_listeners.append(callback)
+
+
+def _device_changed(device_id: int):
+    for callback in _device_listeners:
+        callback(device_id)
 
 
 # Clients
@@ -28,6 +52,7 @@ def create_device(db: Session, data: schemas.DeviceCreate) -> models.Device:
     db.add(obj)
     db.commit()
     db.refresh(obj)
+    _device_changed(obj.id)
     return obj
 
 
@@ -47,17 +72,22 @@ def delete_device(db: Session, device_id: int) -> bool:
     if device:
         db.delete(device)
         db.commit()
+        _device_changed(device_id)
         return True
     return False
 
 
 def update_device(db: Session, device_id: int, data: dict) -> models.Device | None:
+    """Atualiza campos do dispositivo; levanta `ValueError` se o config resultante for inválido."""
     device = db.query(models.Device).filter(models.Device.id == device_id).first()
     if device:
+        if "config" in data or "device_type" in data:
+            schemas.validate_device_config(data.get("device_type", device.device_type), data.get("config", device.config))
         for key, value in data.items():
             setattr(device, key, value)
         db.commit()
         db.refresh(device)
+        _device_changed(device_id)
         return device
     return None
 
@@ -74,16 +104,208 @@ def create_measurement(db: Session, data: schemas.MeasurementCreate) -> models.M
         fields["timestamp"] = data.timestamp
     obj = models.Measurement(**fields)
     db.add(obj)
+    db.flush()
+    marked = [{"device_id": obj.device_id, "metric": obj.metric, "timestamp": obj.timestamp}]
+    rollups.mark(db, marked)
+    energy.mark(db, marked)
     db.commit()
     db.refresh(obj)
     return obj
 
 
+# (device_id, metric, timestamp, value) ou com `extra` no fim; timestamp None = agora
+MeasurementRow = tuple[int, str, datetime | None, float] | tuple[int, str, datetime | None, float, dict | None]
+
+
+def create_measurements_bulk(
+    db: Session,
+    rows: Iterable[MeasurementRow],
+    commit: bool = True,
+    return_ids: bool = False,
+) -> list[int] | int:
+    """Grava várias medições num único INSERT em lote (executemany) e numa transação.
+
+    Sem o `refresh` por linha do `create_measurement`. Retorna a quantidade gravada,
+    ou os ids na ordem das linhas com `return_ids=True` (INSERT ... RETURNING).
+
+    Com `MEASUREMENT_LAYOUT=snapshot` as medições do mesmo dispositivo e instante
+    viram um snapshot; as que têm `extra`, ou quando os ids são pedidos, ficam
+    no layout de linhas. Com `MEASUREMENT_PARTITIONING=monthly` cada linha vai
+    para a partição do seu mês. Os trechos afetados ficam pendentes para os rollups
+    e, se houver leituras de contador, para as energias por hora/dia/mês.
+    """
+    now = datetime.utcnow()
+    params = [
+        {"device_id": int(d), "metric": m, "timestamp": t or now, "value": float(v), "extra": extra[0] if extra else None}
+        for d, m, t, v, *extra in rows
+    ]
+    if not params:
+        return [] if return_ids else 0
+    as_rows = params
+    if settings.measurement_layout == "snapshot" and not return_ids:
+        as_rows = [p for p in params if p["extra"] is not None]
+        snapshots.insert_snapshots(db, [p for p in params if p["extra"] is None])
+    stmt = insert(models.Measurement)
+    if as_rows and partitions.enabled(db) and not partitions.routes_inserts(db):
+        # PostgreSQL: o banco roteia, mas a partição do mês tem de existir
+        partitions.ensure(db, {month_key(p["timestamp"]) for p in as_rows})
+    if as_rows and partitions.routes_inserts(db):
+        # SQLite particionado: cada linha na tabela do seu mês
+        ids = partitions.insert(db, as_rows)
+    elif as_rows and sqlite_profile.uses_id_sequence(db):
+        # tabela WITHOUT ROWID: ids reservados em bloco na sequência
+        first = sqlite_profile.allocate_ids(db, len(as_rows))
+        for i, p in enumerate(as_rows):
+            p["id"] = first + i
+        db.execute(stmt, as_rows)
+        ids = [p["id"] for p in as_rows]
+    elif return_ids:
+        result = db.execute(stmt.returning(models.Measurement.id, sort_by_parameter_order=True), as_rows)
+        ids = list(result.scalars())
+    elif as_rows:
+        db.execute(stmt, as_rows)
+    rollups.mark(db, params)
+    energy.mark(db, params)
+    if commit:
+        db.commit()
+    return ids if return_ids else len(params)
+
+
 def list_measurements(db: Session, device_id: int, metric: str | None = None, limit: int = 1000) -> list[models.Measurement]:
+    """Últimas `limit` medições (mais recentes primeiro), dos dois layouts, de todas as partições e da camada fria.
+
+    Valores vindos de snapshots e de segmentos frios são `Measurement` transitórios,
+    sem id; os das partições SQLite também são transitórios, com id.
+    """
     q = db.query(models.Measurement).filter(models.Measurement.device_id == device_id)
     if metric:
         q = q.filter(models.Measurement.metric == metric)
-    return q.order_by(models.Measurement.timestamp.desc()).limit(limit).all()
+    rows = q.order_by(models.Measurement.timestamp.desc()).limit(limit).all()
+    from_partitions = []
+    for table in reversed(partitions.read_tables(db)):  # da mais nova para a mais antiga
+        pq = select(table).where(table.c.device_id == device_id)
+        if metric:
+            pq = pq.where(table.c.metric == metric)
+        found = db.execute(pq.order_by(table.c.timestamp.desc()).limit(limit - len(from_partitions))).all()
+        from_partitions += [models.Measurement(**r._mapping) for r in found]
+        if len(from_partitions) >= limit:
+            break  # partições mais antigas não entram nas `limit` mais recentes
+    points = snapshots.read_points(db, device_id, [metric] if metric else None, newest_first=True, limit=limit)
+    cold = cold_tier.segments(db, device_id, [metric] if metric else None)
+    if not points and not from_partitions and not cold:
+        return rows
+    rows += from_partitions
+    rows += [models.Measurement(device_id=device_id, timestamp=ts, metric=m, value=v) for ts, m, v in points]
+    for m, segs in cold.items():
+        ts, values = cold_tier.latest(segs, limit)
+        rows += [
+            models.Measurement(device_id=device_id, timestamp=t, metric=m, value=v)
+            for t, v in zip(ts.astype("datetime64[us]").tolist(), values.tolist())
+        ]
+    rows.sort(key=lambda r: r.timestamp, reverse=True)
+    return rows[:limit]
+
+
+def _hot_series(
+    db: Session, device_id: int, metrics: list[str], start: datetime, end: datetime
+) -> tuple[dict[str, list[tuple[datetime, float]]], dict[str, list[tuple[datetime, float]]]]:
+    """Pontos em [start, end] (fora de ordem) e candidatos a ponto anterior a `start`, por métrica,
+    das tabelas, partições e snapshots (tudo menos a camada fria)."""
+    base = models.Measurement.__table__
+    in_range = [base] + partitions.read_tables(db, start, end)
+    series: dict[str, list[tuple[datetime, float]]] = {m: [] for m in metrics}
+    for t in in_range:
+        for metric, ts, value in db.execute(select(t.c.metric, t.c.timestamp, t.c.value).where(
+            t.c.device_id == device_id, t.c.metric.in_(metrics), t.c.timestamp >= start, t.c.timestamp <= end
+        )):
+            series[metric].append((ts, value))
+    for ts, metric, value in snapshots.read_points(db, device_id, metrics, start=start, end=end):
+        series[metric].append((ts, value))
+
+    earlier = [base] + list(reversed(partitions.read_tables(db, end=start)))  # partições da mais nova para a mais antiga
+    priors: dict[str, list[tuple[datetime, float]]] = {}
+    for metric in metrics:
+        candidates = priors[metric] = []
+        for t in earlier:
+            prior = db.execute(select(t.c.timestamp, t.c.value).where(
+                t.c.device_id == device_id, t.c.metric == metric, t.c.timestamp < start
+            ).order_by(t.c.timestamp.desc()).limit(1)).first()
+            if prior:
+                candidates.append(tuple(prior))
+                if t is not base:
+                    break
+        candidates += [(ts, v) for ts, _, v in snapshots.read_points(db, device_id, [metric], before=start, newest_first=True, limit=1)]
+    return series, priors
+
+
+def measurement_series(
+    db: Session, device_id: int, metrics: list[str], start: datetime, end: datetime
+) -> dict[str, list[tuple[datetime, float]]]:
+    """Séries (timestamp, valor) em ordem cronológica por métrica, dos dois layouts e da camada fria.
+
+    Cada série começa pelo último ponto anterior a `start` (o valor em vigor no
+    início, para séries em degrau) e vai até `end` inclusive. Só as partições
+    e os segmentos frios que cruzam o intervalo são lidos.
+    """
+    series, priors = _hot_series(db, device_id, metrics, start, end)
+    cold = cold_tier.segments(db, device_id, metrics)
+    for metric, points in series.items():
+        candidates = priors[metric]
+        segs = cold.get(metric)
+        if segs:
+            ts, values = cold_tier.scan(segs, start, end)
+            points += zip(ts.astype("datetime64[us]").tolist(), values.tolist())
+            prior = cold_tier.before(segs, start)
+            if prior:
+                candidates.append(prior)
+        points.sort(key=lambda p: p[0])
+        if candidates:
+            points.insert(0, max(candidates, key=lambda p: p[0]))
+    return series
+
+
+def measurement_arrays(db: Session, device_id: int, metric: str, start: datetime, end: datetime) -> tuple[np.ndarray, np.ndarray]:
+    """A série de `measurement_series` como arrays (timestamps datetime64[us], valores float64).
+
+    Os pontos frios saem dos segmentos mapeados em memória como fatias, sem
+    objetos Python; só as linhas quentes e o ponto anterior são convertidos, e a
+    junção é uma cópia contígua.
+    """
+    series, priors = _hot_series(db, device_id, [metric], start, end)
+    hot, candidates = series[metric], priors[metric]
+    segs = cold_tier.segments(db, device_id, [metric]).get(metric, [])
+    cold_ts, cold_values = cold_tier.scan(segs, start, end)
+    prior = cold_tier.before(segs, start)
+    if prior:
+        candidates.append(prior)
+    if candidates:
+        hot.append(max(candidates, key=lambda p: p[0]))
+    ts = np.concatenate([cold_ts, to_us_array([p[0] for p in hot])]).view("datetime64[us]")
+    values = np.concatenate([cold_values.astype(float), np.array([p[1] for p in hot], dtype=float)])
+    if hot:
+        order = np.argsort(ts, kind="stable")
+        ts, values = ts[order], values[order]
+    return ts, values
+
+
+def measurement_after(db: Session, device_id: int, metric: str, ts: datetime) -> tuple[datetime, float] | None:
+    """Primeiro ponto da métrica depois de `ts` (exclusivo), dos dois layouts, de todas as partições e da camada fria."""
+    base = models.Measurement.__table__
+    candidates = []
+    for t in [base] + partitions.read_tables(db, start=ts):  # partições da mais antiga para a mais nova
+        found = db.execute(select(t.c.timestamp, t.c.value).where(
+            t.c.device_id == device_id, t.c.metric == metric, t.c.timestamp > ts
+        ).order_by(t.c.timestamp.asc()).limit(1)).first()
+        if found:
+            candidates.append(tuple(found))
+            if t is not base:
+                break
+    # snapshots: o primeiro que tiver a métrica, lendo em blocos a partir de `ts`
+    candidates += [(t, v) for t, _, v in snapshots.read_points(db, device_id, [metric], start=ts, limit=2) if t > ts][:1]
+    cold = cold_tier.after(cold_tier.segments(db, device_id, [metric]).get(metric, []), ts)
+    if cold:
+        candidates.append(cold)
+    return min(candidates, key=lambda p: p[0]) if candidates else None
 
 
 # Alarm rules and events
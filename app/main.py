@@ -3,10 +3,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from .core.config import settings
-from .core.db import Base, engine
+from .core.db import engine, init_db
 from .routers import get_api_router
 from .services.scheduler import PollingScheduler
-from .services.pollers import poll_modbus_devices, poll_modbus_tcp_devices
+from .services.pollers import schedulable_devices, device_dispatchers, shutdown_pollers
+from .services.ingest_queue import ingest_queue
+from .services.drive_spool import drive_spool
+from .services.partitions import partitions
+from .services.cold_tier import cold_tier
+from .services.energy import energy
+from .services.rollups import rollups
 
 
 def create_app() -> FastAPI:
@@ -30,18 +36,34 @@ def create_app() -> FastAPI:
 
     app.include_router(get_api_router(), prefix=settings.api_prefix)
 
-    scheduler = PollingScheduler(timezone=settings.scheduler_timezone)
+    scheduler = PollingScheduler(
+        timezone=settings.scheduler_timezone,
+        jitter=settings.poll_jitter,
+        dispatch_workers=settings.poll_dispatch_workers,
+        overlap_policy=settings.poll_overlap_policy,
+    )
+    app.state.scheduler = scheduler
 
     @app.on_event("startup")
     def on_startup():
-        Base.metadata.create_all(bind=engine)
+        init_db()
+        drive_spool.start()  # segmentos do Drive que ficaram de uma execução anterior
+        if not settings.embedded_poller:
+            return  # coleta nos workers (`python -m app.worker`)
+        # cada dispositivo no seu intervalo (config["poll_interval"]), via fila de prazos
+        scheduler.schedule_devices(schedulable_devices, device_dispatchers())
+        partitions.schedule_retention(scheduler, engine)
+        rollups.schedule(scheduler, engine, settings.rollup_refresh_interval)
+        energy.schedule(scheduler, engine, settings.energy_refresh_interval)
+        cold_tier.schedule(scheduler, engine, settings.cold_tier_interval)
         scheduler.start()
-        scheduler.add_job(lambda: poll_modbus_devices(), seconds=30, id="poll_modbus")
-        scheduler.add_job(lambda: poll_modbus_tcp_devices(), seconds=30, id="poll_modbus_tcp")
 
     @app.on_event("shutdown")
     def on_shutdown():
         scheduler.shutdown()
+        shutdown_pollers()
+        ingest_queue.shutdown()  # grava as medições já aceitas
+        drive_spool.shutdown()  # fecha os segmentos abertos e tenta um último envio
 
     return app
 
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, JSON, Index
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, JSON, Index, LargeBinary
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from .core.db import Base
 
@@ -48,6 +48,133 @@ class Measurement(Base):
     )
 
 
+class MetricName(Base):
+    """Catálogo de métricas: nome -> id pequeno usado nos snapshots."""
+    __tablename__ = "metric_catalog"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # cabe em uint16 nos snapshots
+    name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+
+
+class MeasurementSnapshot(Base):
+    """Uma aquisição de um dispositivo: todas as métricas lidas no instante numa só linha.
+
+    `metric_ids` (uint16) e `values` (float64) são arrays little-endian empacotados,
+    na mesma ordem (ver `services/snapshots.py`).
+    """
+    __tablename__ = "measurement_snapshots"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[int] = mapped_column(ForeignKey("devices.id"))
+    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    metric_ids: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    values: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ix_snapshots_device_time", "device_id", "timestamp"),
+    )
+
+
+class MeasurementRollup(Base):
+    """Agregado de uma métrica num intervalo fixo (1 min, 15 min, 1 h ou 1 dia), da série em degrau.
+
+    `held_s` e `weighted` (soma de valor x segundos em vigor) dão a média ponderada
+    pelo tempo e a cobertura; `count` e `sum` são dos pontos gravados no intervalo.
+    Todas as colunas se combinam entre intervalos vizinhos (ver `services/rollups.py`).
+    """
+    __tablename__ = "measurement_rollups"
+
+    device_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(100), primary_key=True)
+    resolution: Mapped[int] = mapped_column(Integer, primary_key=True)  # segundos
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)  # início do intervalo
+    held_s: Mapped[float] = mapped_column(Float, nullable=False)
+    weighted: Mapped[float] = mapped_column(Float, nullable=False)
+    min: Mapped[float] = mapped_column(Float, nullable=False)
+    max: Mapped[float] = mapped_column(Float, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    sum: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+class RollupPending(Base):
+    """Trecho de um dispositivo cujos rollups precisam ser recalculados (gravado junto com as medições)."""
+    __tablename__ = "rollup_pending"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # já inclui a validade do último valor
+    metrics: Mapped[list] = mapped_column(JSON, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rollup_pending_device_start", "device_id", "start"),
+    )
+
+
+class EnergyDelta(Base):
+    """Energia importada/exportada por um dispositivo numa hora, dia ou mês, a partir dos contadores.
+
+    Horas começam em UTC; dias e meses são do fuso ENERGY_TIMEZONE (`bucket` é a
+    data local, sem fuso). Ver `services/energy.py`.
+    """
+    __tablename__ = "energy_deltas"
+
+    device_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    period: Mapped[str] = mapped_column(String(5), primary_key=True)  # hour | day | month
+    bucket: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    import_kwh: Mapped[float] = mapped_column(Float, nullable=False)
+    export_kwh: Mapped[float] = mapped_column(Float, nullable=False)
+    readings: Mapped[int] = mapped_column(Integer, nullable=False)  # leituras do contador no intervalo
+    resets: Mapped[int] = mapped_column(Integer, nullable=False)  # zeramentos/trocas de medidor detectados
+    covered_s: Mapped[float] = mapped_column(Float, nullable=False)  # segundos entre a primeira e a última leitura
+    gap_s: Mapped[float] = mapped_column(Float, nullable=False)  # segundos interpolados sobre falhas de leitura
+
+
+class EnergyPending(Base):
+    """Trecho de um dispositivo com leituras de contador novas, à espera do recálculo das energias."""
+    __tablename__ = "energy_pending"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class ColdSegment(Base):
+    """Mês fechado de uma métrica de um dispositivo, movido para a camada fria (`services/cold_tier.py`).
+
+    Formato npy: `path` é o prefixo dos arquivos `.ts.npy` (int64, µs desde 1970
+    UTC) e `.val.npy` relativo a COLD_TIER_DIR, e `sparse_index` guarda um
+    timestamp a cada `cold_tier.SPARSE_EVERY` pontos. Formato gorilla: `path` é a
+    chave dos blocos em `cold_blocks` e `sparse_index`, o primeiro timestamp de
+    cada bloco. Ambos int64 little-endian.
+    """
+    __tablename__ = "cold_segments"
+    __table_args__ = (Index("ux_cold_segments_device_metric_period", "device_id", "metric", "period", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    device_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    metric: Mapped[str] = mapped_column(String(100), nullable=False)
+    period: Mapped[str] = mapped_column(String(6), nullable=False)  # YYYYMM
+    start: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # primeiro ponto
+    end: Mapped[datetime] = mapped_column(DateTime, nullable=False)  # último ponto
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    dtype: Mapped[str] = mapped_column(String(8), nullable=False)  # dos valores: float32 | float64
+    format: Mapped[str] = mapped_column(String(8), default="npy", nullable=False)  # npy | gorilla
+    path: Mapped[str] = mapped_column(String(300), nullable=False)
+    sparse_index: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ColdBlock(Base):
+    """Bloco comprimido (`services/gorilla.py`) de um segmento frio no formato gorilla."""
+    __tablename__ = "cold_blocks"
+
+    path: Mapped[str] = mapped_column(String(300), primary_key=True)  # ColdSegment.path
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)  # bloco k = pontos k * BLOCK_SIZE ..
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+
 class AlarmRuleModel(Base):
     __tablename__ = "alarm_rules"
 
@@ -74,3 +201,35 @@ class AlarmEvent(Base):
     details: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     acknowledged: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
+
+
+class PollerWorker(Base):
+    """Processo de coleta (`python -m app.worker`); vivo enquanto o heartbeat estiver dentro do TTL do lease."""
+    __tablename__ = "poller_workers"
+
+    id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    hostname: Mapped[str] = mapped_column(String(200), nullable=False)
+    pid: Mapped[int] = mapped_column(Integer, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    devices: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
+class DeviceLease(Base):
+    """Dispositivo entregue a um worker de coleta até `expires_at` (renovado a cada heartbeat)."""
+    __tablename__ = "device_leases"
+
+    # sem FK: o lease de um dispositivo removido é apenas descartado no rebalanceamento
+    device_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    worker_id: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
+    acquired_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class PollerWorkerStatus(Base):
+    """Estado em memória de um worker de coleta (breakers, agenda, conexões), gravado a cada heartbeat para a API."""
+    __tablename__ = "poller_worker_status"
+
+    worker_id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    reported_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    status: Mapped[dict] = mapped_column(JSON, nullable=False)
@@ -3,9 +3,11 @@ from .clients import router as clients_router
 from .devices import router as devices_router
 from .ingest import router as ingest_router
 from .metrics import router as metrics_router
+from .energy import router as energy_router
 from .alarms import router as alarms_router
 from .dashboard import router as dashboard_router
 from .storage import router as storage_router
+from .polling import router as polling_router
 from ..core.config import settings
 
 
@@ -15,8 +17,10 @@ def get_api_router() -> APIRouter:
     api.include_router(devices_router)
     api.include_router(ingest_router)
     api.include_router(metrics_router)
+    api.include_router(energy_router)
     api.include_router(alarms_router)
     api.include_router(dashboard_router)
     api.include_router(storage_router)
+    api.include_router(polling_router)
     return api
 
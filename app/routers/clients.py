@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from ..core.db import get_db, Base, engine
+from ..core.db import get_db, init_db as create_tables
 from .. import crud, schemas, models
 
 
@@ -9,7 +9,7 @@ router = APIRouter(prefix="/clients", tags=["clients"])
 
 @router.on_event("startup")
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    create_tables()
 
 
 @router.get("")
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from ..core.db import get_db
 from .. import crud, schemas
+from ..core.config import settings
+from ..services.leases import worker_reports
+from ..services.pollers import device_health, reported_breakers
 
 
 router = APIRouter(prefix="/devices", tags=["devices"])
@@ -12,6 +15,28 @@ def list_devices(client_id: int | None = Query(default=None), db: Session = Depe
     return [schemas.DeviceRead.model_validate(d) for d in crud.list_devices(db, client_id)]
 
 
+def _reported_breakers(db: Session) -> dict | None:
+    """Com a coleta nos workers, os breakers vêm do último heartbeat de cada um (None: coleta neste processo)."""
+    if settings.embedded_poller:
+        return None
+    return reported_breakers(worker_reports(db, settings.worker_lease_ttl))
+
+
+@router.get("/health")
+def list_device_health(client_id: int | None = Query(default=None), db: Session = Depends(get_db)):
+    """Estado de saúde (circuit breaker) de cada dispositivo e do seu gateway."""
+    reported = _reported_breakers(db)
+    return [device_health(d, reported) for d in crud.list_devices(db, client_id)]
+
+
+@router.get("/{device_id}/health")
+def get_device_health(device_id: int, db: Session = Depends(get_db)):
+    device = crud.get_device(db, device_id)
+    if device is None:
+        return {"error": "Device not found"}
+    return device_health(device, _reported_breakers(db))
+
+
 @router.post("")
 def create_device(payload: schemas.DeviceCreate, db: Session = Depends(get_db)):
     obj = crud.create_device(db, payload)
@@ -26,7 +51,10 @@ def delete_device(device_id: int, db: Session = Depends(get_db)):
 
 @router.patch("/{device_id}")
 def update_device(device_id: int, payload: dict, db: Session = Depends(get_db)):
-    device = crud.update_device(db, device_id, payload)
+    try:
+        device = crud.update_device(db, device_id, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     if device:
         return schemas.DeviceRead.model_validate(device)
     return {"error": "Device not found"}
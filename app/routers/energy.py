@@ -0,0 +1,58 @@
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ..core.db import get_db
+from ..services.energy import PERIODS, energy
+
+
+router = APIRouter(prefix="/energy", tags=["energy"])
+
+
+def _row(r) -> dict:
+    return {
+        "bucket": r.bucket.isoformat(),
+        "import_kwh": r.import_kwh,
+        "export_kwh": r.export_kwh,
+        "net_kwh": r.import_kwh - r.export_kwh,
+        "readings": r.readings,
+        "resets": r.resets,
+        "covered_s": r.covered_s,
+        "gap_s": r.gap_s,
+    }
+
+
+@router.get("")
+def energy_deltas(
+    device_id: int,
+    period: str = Query(default="day"),  # hour, day, month
+    start_date: str | None = Query(default=None),
+    end_date: str | None = Query(default=None),
+    db: Session = Depends(get_db),
+):
+    """Energia importada/exportada por hora (UTC), dia ou mês (fuso ENERGY_TIMEZONE), dos contadores."""
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period deve ser {', '.join(PERIODS)}")
+    start = datetime.fromisoformat(start_date) if start_date else None
+    end = datetime.fromisoformat(end_date) if end_date else None
+    rows = energy.deltas(db, device_id, period, start, end)
+    return {"device_id": device_id, "period": period, "timezone": str(energy.tz), "data": [_row(r) for r in rows]}
+
+
+@router.get("/month")
+def energy_month(device_id: int, month: str | None = Query(default=None), db: Session = Depends(get_db)):  # YYYY-MM
+    """Consumo de um mês (padrão: o corrente) e o custo pela tarifa do dispositivo."""
+    try:
+        first = date.fromisoformat(f"{month}-01") if month else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month deve ser AAAA-MM")
+    row = energy.month(db, device_id, first)
+    tariff = energy.tariff(db, device_id)
+    if row is None:
+        return {"device_id": device_id, "month": month, "import_kwh": 0.0, "export_kwh": 0.0, "net_kwh": 0.0, "tariff_kwh": tariff, "cost_brl": 0.0}
+    return {
+        "device_id": device_id,
+        "month": row.bucket.strftime("%Y-%m"),
+        **_row(row),
+        "tariff_kwh": tariff,
+        "cost_brl": round(row.import_kwh * tariff, 2),
+    }
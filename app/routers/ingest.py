@@ -1,36 +1,28 @@
-from fastapi import APIRouter, Depends
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..core.db import get_db
-from .. import crud, schemas
+from .. import schemas
 from ..services.forwarder import Forwarder
 from ..core.config import settings
-from ..services.alarms import eval_operator
-from ..models import AlarmRuleModel
+from ..services.ingest_queue import ingest_queue
+from ..services.ingest_batch import BatchResult, validate_batch
 
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines")
+NDJSON_CHUNK = 5000  # linhas validadas por vez ao ler um corpo NDJSON
 
-@router.post("")
-async def ingest_payload(payload: schemas.MeasurementCreate, db: Session = Depends(get_db)):
-    obj = crud.create_measurement(db, payload)
-
-    # avaliar regras aplicáveis
-    device = crud.get_device(db, payload.device_id)
-    if device is not None:
-        rules = db.query(AlarmRuleModel).filter(
-            AlarmRuleModel.enabled == True,
-            AlarmRuleModel.metric == payload.metric,
-            (AlarmRuleModel.device_id == None) | (AlarmRuleModel.device_id == payload.device_id),
-            AlarmRuleModel.client_id == device.client_id,
-        ).all()
-        for r in rules:
-            try:
-                if eval_operator(r.operator, payload.value, r.threshold):
-                    crud.create_alarm_event(db, r.id, device.id, payload.metric, payload.value, details={"op": r.operator, "threshold": r.threshold})
-            except Exception:
-                # ignorar erro em regra individual para não interromper ingestão
-                pass
+
+@router.post("", status_code=202)
+async def ingest_payload(payload: schemas.MeasurementCreate):
+    # aceita e enfileira; a gravação e os alarmes ficam com a fila (em lote, group commit)
+    timestamp = payload.timestamp or datetime.utcnow()
+    if not ingest_queue.submit([(payload.device_id, payload.metric, timestamp, payload.value, payload.extra)]):
+        raise HTTPException(status_code=429, detail="fila de ingestão cheia", headers={"Retry-After": "1"})
 
     # encaminhar se habilitado
     if settings.enable_forwarding and settings.forwarder_url:
@@ -40,5 +32,100 @@ async def ingest_payload(payload: schemas.MeasurementCreate, db: Session = Depen
         except Exception:
             pass
 
-    return schemas.MeasurementRead.model_validate(obj)
+    return {"accepted": 1, "queued": ingest_queue.depth}
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"lote maior que a fila de ingestão ({ingest_queue.max_size} linhas)")
+
+
+def _validate_lines(db: Session, lines: list[bytes], start: int) -> BatchResult:
+    """Decodifica e valida linhas NDJSON (no threadpool: JSON, pandas e a consulta de dispositivos bloqueiam)."""
+    items = []
+    for raw in lines:
+        try:
+            items.append(json.loads(raw))
+        except ValueError:
+            items.append(None)  # recusado na validação, com o número da linha
+    return validate_batch(db, items, start=start)
+
+
+def _validate_body(db: Session, raw: bytes) -> BatchResult:
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="corpo JSON inválido")
+    return validate_batch(db, body if isinstance(body, list) else [body])
+
+
+async def _read_ndjson(request: Request, db: Session) -> BatchResult:
+    """Lê o corpo em streaming; cada `NDJSON_CHUNK` linhas são validadas no threadpool."""
+    total = BatchResult()
+    pending: list[bytes] = []
+    line_no = 0
+    buffer = b""
+
+    async def validate_pending():
+        lines = pending[:]
+        pending.clear()
+        total.merge(await run_in_threadpool(_validate_lines, db, lines, line_no - len(lines)))
+        if len(total.rows) > ingest_queue.max_size:  # não adianta ler o resto
+            raise _too_large()
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            if raw.strip():
+                pending.append(raw)
+                line_no += 1
+                if len(pending) >= NDJSON_CHUNK:
+                    await validate_pending()
+    if buffer.strip():
+        pending.append(buffer)
+        line_no += 1
+    if pending:
+        await validate_pending()
+    return total
+
+
+@router.post("/batch", status_code=202)
+async def ingest_batch(request: Request, db: Session = Depends(get_db)):
+    """Lote de medições: array JSON, bloco colunar (ou array deles) ou NDJSON.
+
+    Linhas inválidas são recusadas e contadas; as válidas entram na fila de uma vez
+    (tudo ou nada: 429 se não couberem).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        result = await _read_ndjson(request, db)
+    else:
+        result = await run_in_threadpool(_validate_body, db, await request.body())
+
+    if len(result.rows) > ingest_queue.max_size:
+        raise _too_large()
+    if not ingest_queue.submit(result.rows):
+        raise HTTPException(status_code=429, detail="fila de ingestão cheia", headers={"Retry-After": "1"})
+
+    if settings.enable_forwarding and settings.forwarder_url and result.rows:
+        fwd = Forwarder(settings.forwarder_url)
+        try:
+            await fwd.forward_batch([
+                {"device_id": d, "metric": m, "timestamp": ts.isoformat(), "value": v, "extra": extra}
+                for d, m, ts, v, extra in result.rows
+            ])
+        except Exception:
+            pass
+
+    return {
+        "received": result.received,
+        "accepted": len(result.rows),
+        "rejected": result.rejected,
+        "errors": result.errors,
+        "queued": ingest_queue.depth,
+    }
+
 
+@router.get("/queue")
+def ingest_queue_stats():
+    return ingest_queue.stats()
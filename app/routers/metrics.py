@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from ..core.db import get_db
-from .. import crud, schemas, models
+from .. import crud, schemas
 import pandas as pd
 from datetime import datetime, timedelta
-from ..services.analytics import compute_summary, linear_regression, six_sigma_params
+from ..services.analytics import align_step_held, compute_summary, linear_regression, six_sigma_params
+from ..services.energy import energy
+from ..services.rollups import rollups
 
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
@@ -45,55 +47,32 @@ def metrics_timerange(
     else:
         start = datetime.fromisoformat(start_date)
 
-    # Buscar measurements no intervalo
-    q = db.query(models.Measurement).filter(
-        models.Measurement.device_id == device_id,
-        models.Measurement.metric == metric,
-        models.Measurement.timestamp >= start,
-        models.Measurement.timestamp <= end
-    ).order_by(models.Measurement.timestamp.asc())
-
-    rows = q.all()
-
-    if not rows:
-        return {"data": [], "period": period, "start": start.isoformat(), "end": end.isoformat()}
-
-    # Converter para DataFrame para agregação
-    df = pd.DataFrame([
-        {"timestamp": r.timestamp, "value": r.value}
-        for r in rows
-    ])
-
     # Determinar frequência de resample baseado no período
     resample_freq = {
         "1h": "1min",
         "6h": "5min",
         "1d": "15min",
-        "1w": "1H",
-        "1m": "6H",
+        "1w": "1h",
+        "1m": "6h",
         "1y": "1D"
-    }.get(period, "1H")
-
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df.set_index('timestamp', inplace=True)
-
-    # Agregar dados
-    aggregated = df.resample(resample_freq).agg({
-        'value': ['mean', 'min', 'max', 'count']
-    }).reset_index()
+    }.get(period, "1h")
 
-    aggregated.columns = ['timestamp', 'mean', 'min', 'max', 'count']
+    # Série em degrau: média ponderada pelo tempo, intervalos sem gravação herdam o último valor
+    # (dos rollups mais grossos que servem à frequência; o resto das medições brutas)
+    aggregated = rollups.resample(db, device_id, metric, resample_freq, start, min(end, datetime.utcnow()))
+    if aggregated.empty:
+        return {"data": [], "period": period, "start": start.isoformat(), "end": end.isoformat()}
 
     result = []
     for _, row in aggregated.iterrows():
-        if row['count'] > 0:
-            result.append({
-                "timestamp": row['timestamp'].isoformat(),
-                "mean": float(row['mean']),
-                "min": float(row['min']),
-                "max": float(row['max']),
-                "count": int(row['count'])
-            })
+        result.append({
+            "timestamp": row['timestamp'].isoformat(),
+            "mean": float(row['mean']),
+            "min": float(row['min']),
+            "max": float(row['max']),
+            "count": int(row['count']),
+            "coverage": round(float(row['coverage']), 4)
+        })
 
     return {
         "data": result,
@@ -120,23 +99,12 @@ def demand_analysis(
     }
     start = end - period_map.get(period, timedelta(days=1))
 
-    # Buscar potência no período (aceita power, power_total, power_l1, etc)
-    q = db.query(models.Measurement).filter(
-        models.Measurement.device_id == device_id,
-        models.Measurement.metric == metric,
-        models.Measurement.timestamp >= start,
-        models.Measurement.timestamp <= end
-    ).order_by(models.Measurement.timestamp.asc())
-
-    rows = q.all()
-    if not rows:
+    # Potência no período (aceita power, power_total, power_l1, etc) em intervalos de
+    # 15 min (integração da demanda) sobre a série em degrau, dos rollups de 15 min
+    df = rollups.resample(db, device_id, metric, "15min", start, end)
+    if df.empty:
         return {"error": f"Sem dados de {metric} no período"}
-
-    df = pd.DataFrame([
-        {"timestamp": r.timestamp, "power": r.value}
-        for r in rows
-    ])
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df = df.rename(columns={"mean": "power"})
     df['hour'] = df['timestamp'].dt.hour
 
     # Classificação horária (pode ajustar conforme tarifa local)
@@ -144,6 +112,10 @@ def demand_analysis(
     # Fora-ponta: resto do dia
     df['tariff'] = df['hour'].apply(lambda h: 'peak' if 18 <= h < 21 else 'off_peak')
 
+    def _mean(part: pd.DataFrame) -> float:
+        # médias dos intervalos ponderadas pelo tempo coberto
+        return float((part['power'] * part['coverage']).sum() / part['coverage'].sum())
+
     # Cálculo de demandas
     peak_data = df[df['tariff'] == 'peak']
     off_peak_data = df[df['tariff'] == 'off_peak']
@@ -153,29 +125,28 @@ def demand_analysis(
         "start": start.isoformat(),
         "end": end.isoformat(),
         "peak": {
-            "max": float(peak_data['power'].max()) if len(peak_data) > 0 else 0,
-            "mean": float(peak_data['power'].mean()) if len(peak_data) > 0 else 0,
-            "samples": len(peak_data)
+            "max": float(peak_data['max'].max()) if len(peak_data) > 0 else 0,
+            "mean": _mean(peak_data) if len(peak_data) > 0 else 0,
+            "samples": int(peak_data['count'].sum())
         },
         "off_peak": {
-            "max": float(off_peak_data['power'].max()) if len(off_peak_data) > 0 else 0,
-            "mean": float(off_peak_data['power'].mean()) if len(off_peak_data) > 0 else 0,
-            "samples": len(off_peak_data)
+            "max": float(off_peak_data['max'].max()) if len(off_peak_data) > 0 else 0,
+            "mean": _mean(off_peak_data) if len(off_peak_data) > 0 else 0,
+            "samples": int(off_peak_data['count'].sum())
         },
         "overall": {
-            "max": float(df['power'].max()),
-            "mean": float(df['power'].mean()),
-            "min": float(df['power'].min())
+            "max": float(df['max'].max()),
+            "mean": _mean(df),
+            "min": float(df['min'].min())
         },
         "hourly_average": []
     }
 
     # Média por hora do dia
-    hourly = df.groupby('hour')['power'].mean().reset_index()
-    for _, row in hourly.iterrows():
+    for hour, part in df.groupby('hour'):
         result["hourly_average"].append({
-            "hour": int(row['hour']),
-            "power": float(row['power'])
+            "hour": int(hour),
+            "power": _mean(part)
         })
 
     return result
@@ -194,12 +165,14 @@ def metrics_summary(device_id: int, metric: str, limit: int = 1000, db: Session
 def metrics_linreg(device_id: int, x_metric: str, y_metric: str, limit: int = 1000, db: Session = Depends(get_db)):
     xs = crud.list_measurements(db, device_id=device_id, metric=x_metric, limit=limit)
     ys = crud.list_measurements(db, device_id=device_id, metric=y_metric, limit=limit)
-    # alinhar por ordem temporal (assumindo mesmo sampling)
-    xs_vals = [r.value for r in xs][::-1]
-    ys_vals = [r.value for r in ys][::-1]
-    n = min(len(xs_vals), len(ys_vals))
-    res = linear_regression(pd.Series(xs_vals[-n:]), pd.Series(ys_vals[-n:])) if n > 0 else {"slope":0.0,"intercept":0.0,"r2":0.0}
-    return res
+    if not xs or not ys:
+        return {"slope": 0.0, "intercept": 0.0, "r2": 0.0}
+    # alinhar por tempo: com deadband x e y são gravados em instantes diferentes
+    pairs = align_step_held(
+        pd.Series([r.value for r in xs], index=pd.DatetimeIndex([r.timestamp for r in xs])),
+        pd.Series([r.value for r in ys], index=pd.DatetimeIndex([r.timestamp for r in ys])),
+    )
+    return linear_regression(pairs["x"], pairs["y"])
 
 
 @router.get("/calculated")
@@ -224,9 +197,11 @@ def calculated_metrics(device_id: int, limit: int = 100, db: Session = Depends(g
     power_factor = (latest_power / apparent_power) if apparent_power > 0 else 0.0
     energy_kwh = latest_energy_wh / 1000.0
 
-    # Custo estimado (R$ 0,65/kWh - ajustar conforme tarifa)
-    cost_per_kwh = 0.65
-    estimated_cost = energy_kwh * cost_per_kwh
+    # Custo do mês corrente: energia importada no mês (deltas dos contadores) x tarifa do dispositivo
+    month = energy.month(db, device_id)
+    month_import_kwh = month.import_kwh if month else 0.0
+    cost_per_kwh = energy.tariff(db, device_id)
+    estimated_cost = month_import_kwh * cost_per_kwh
 
     # Médias das últimas leituras
     avg_voltage = sum(r.value for r in voltage_data) / len(voltage_data) if voltage_data else 0.0
@@ -244,6 +219,11 @@ def calculated_metrics(device_id: int, limit: int = 100, db: Session = Depends(g
             "power_factor": round(power_factor, 3),
             "estimated_cost_brl": round(estimated_cost, 2)
         },
+        "month": {
+            "import_kwh": round(month_import_kwh, 3),
+            "export_kwh": round(month.export_kwh if month else 0.0, 3),
+            "tariff_kwh": cost_per_kwh,
+        },
         "averages": {
             "voltage": round(avg_voltage, 2),
             "current": round(avg_current, 3),
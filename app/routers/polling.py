@@ -0,0 +1,114 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.db import engine, get_db
+from ..services.leases import cluster_status, worker_reports
+from ..services.cold_tier import cold_tier
+from ..services.energy import energy
+from ..services.partitions import partitions
+from ..services.rollups import rollups
+from ..services.pollers import tcp_pool_stats, rtu_bus_stats, tuya_stats, deadband_stats, registry_stats
+from ..services.telemetry import telemetry
+
+
+router = APIRouter(prefix="/polling", tags=["polling"])
+
+
+def _from_workers(db: Session, key: str) -> dict | None:
+    """Sem coleta neste processo (EMBEDDED_POLLER=false), o estado vem do último heartbeat de cada worker vivo."""
+    if settings.embedded_poller:
+        return None
+    return {
+        "source": "workers",
+        "workers": [
+            {"worker_id": r["worker_id"], "reported_at": r["reported_at"], "age_s": r["age_s"], **r["status"].get(key, {})}
+            for r in worker_reports(db, settings.worker_lease_ttl)
+        ],
+    }
+
+
+@router.get("/pool")
+def modbus_tcp_pool(db: Session = Depends(get_db)):
+    """Conexões persistentes por gateway Modbus TCP (host:porta) e seus contadores."""
+    return _from_workers(db, "pool") or {"gateways": tcp_pool_stats()}
+
+
+@router.get("/buses")
+def rtu_buses(db: Session = Depends(get_db)):
+    """Workers de barramento RS485 (uma porta serial cada): fila, transações e ocupação."""
+    return _from_workers(db, "buses") or {"buses": rtu_bus_stats()}
+
+
+@router.get("/tuya")
+def tuya_accounts(db: Session = Depends(get_db)):
+    """Tuya: contas na nuvem (requisições, tokens, token bucket), sessões locais e fallbacks."""
+    return _from_workers(db, "tuya") or tuya_stats()
+
+
+@router.get("/workers")
+def poller_workers(db: Session = Depends(get_db)):
+    """Workers de coleta (`python -m app.worker`): heartbeat, vivo/morto e dispositivos com lease."""
+    return {"embedded_poller": settings.embedded_poller, **cluster_status(db, settings.worker_lease_ttl)}
+
+
+@router.get("/registry")
+def device_registry(db: Session = Depends(get_db)):
+    """Registro de dispositivos em memória: planos de coleta compilados, configs inválidos e recargas."""
+    return _from_workers(db, "registry") or registry_stats()
+
+
+@router.get("/deadband")
+def deadband_filter(db: Session = Depends(get_db)):
+    """Report-by-exception: leituras recebidas dos pollers, gravadas e a redução obtida."""
+    return _from_workers(db, "deadband") or deadband_stats()
+
+
+@router.get("/schedule")
+def device_schedule(request: Request, db: Session = Depends(get_db)):
+    """Agenda por dispositivo: intervalo, execuções, prazos perdidos e atraso (médio, p95, máximo)."""
+    reported = _from_workers(db, "schedule")
+    if reported is not None:
+        workers = reported["workers"]
+        return {
+            **reported,
+            "total_runs": sum(w.get("total_runs", 0) for w in workers),
+            "total_missed": sum(w.get("total_missed", 0) for w in workers),
+        }
+    scheduler = getattr(request.app.state, "scheduler", None)
+    if scheduler is None:
+        return {"devices": [], "total_runs": 0, "total_missed": 0}
+    return scheduler.schedule_stats()
+
+
+@router.get("/telemetry")
+def polling_telemetry(request: Request, db: Session = Depends(get_db)):
+    """Histórico móvel: duração dos jobs e dos lotes, sobreposições, atraso de fila e latência por dispositivo."""
+    reported = _from_workers(db, "telemetry")
+    if reported is not None:
+        return reported
+    scheduler = getattr(request.app.state, "scheduler", None)
+    return (scheduler.telemetry if scheduler is not None else telemetry).snapshot()
+
+
+@router.get("/partitions")
+def measurement_partitions(db: Session = Depends(get_db)):
+    """Partições mensais de medições (MEASUREMENT_PARTITIONING) e a retenção configurada."""
+    return partitions.stats(db)
+
+
+@router.get("/rollups")
+def measurement_rollups():
+    """Rollups de medições: linhas por resolução, trechos pendentes e recálculos deste processo."""
+    return rollups.stats(engine)
+
+
+@router.get("/energy")
+def energy_engine():
+    """Energias por hora/dia/mês: linhas por período, trechos pendentes e recálculos deste processo."""
+    return energy.stats(engine)
+
+
+@router.get("/cold-tier")
+def measurement_cold_tier():
+    """Camada fria: segmentos colunares, pontos movidos e execuções do tiering neste processo."""
+    return cold_tier.stats(engine)
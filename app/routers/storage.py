@@ -1,11 +1,12 @@
 # app/routers/storage.py
 from fastapi import APIRouter, HTTPException
 from app.services.hybrid_storage import HybridStorage
+from app.services.drive_spool import drive_spool
 from app.schemas import MeasurementCreate
 from datetime import datetime
 import os
 
-router = APIRouter(prefix="/api/storage", tags=["storage"])
+router = APIRouter(prefix="/storage", tags=["storage"])
 
 @router.get("/status")
 async def get_storage_status():
@@ -164,4 +165,9 @@ async def get_measurements(device_id: int, metric: str, limit: int = 100):
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/spool")
+def drive_spool_stats():
+    """Spool do Google Drive: linhas abertas, segmentos pendentes e envios deste processo"""
+    return drive_spool.stats()
@@ -1,7 +1,8 @@
 from __future__ import annotations
 from datetime import datetime
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+from typing import Literal, Optional
+from .connectors.register_map import RegisterMap
 
 
 class ClientCreate(BaseModel):
@@ -19,6 +20,90 @@ class ClientRead(BaseModel):
         from_attributes = True
 
 
+# Config por tipo de dispositivo: validada no cadastro e compilada no registro de dispositivos.
+# Chaves desconhecidas são mantidas (extra="allow").
+class PolledDeviceConfig(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    poll_interval: Optional[float] = Field(default=None, gt=0)
+    deadband: dict[str, dict[str, float]] | bool | None = None
+    max_silence: Optional[float] = Field(default=None, gt=0)
+    tariff_kwh: Optional[float] = Field(default=None, ge=0)
+    max_power_kw: Optional[float] = Field(default=None, gt=0)
+
+
+class ModbusConfig(PolledDeviceConfig):
+    slave_id: int = Field(default=1, ge=0, le=247)
+    driver: Literal["generic", "pzem004t", "sdm630"] | None = None
+    base: int = Field(default=0, ge=0, le=65535)
+    count: int = Field(default=4, ge=1, le=125)
+    metrics: list[str] | None = None
+    register_map: list[dict] | None = None
+
+    @field_validator("register_map")
+    @classmethod
+    def _register_map(cls, v):
+        if v is not None:
+            try:
+                RegisterMap.from_config("custom", v)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"register_map inválido: {e!r}")
+        return v
+
+
+class ModbusTCPConfig(ModbusConfig):
+    host: str = "192.168.1.100"
+    port: int = Field(default=502, ge=1, le=65535)
+    timeout: float = Field(default=3.0, gt=0)
+    framer: Literal["socket", "rtu"] = "socket"
+
+
+class ModbusRTUConfig(ModbusConfig):
+    port: str = "COM3"
+    baudrate: int = Field(default=9600, gt=0)
+    timeout: float = Field(default=0.5, gt=0)
+
+
+class TuyaDpsField(BaseModel):
+    metric: str
+    scale: float = 1.0
+
+
+class TuyaConfig(PolledDeviceConfig):
+    tuya_id: str = Field(min_length=1)
+    address: Optional[str] = None
+    local_key: Optional[str] = None
+    version: float = 3.3
+    local_port: int = Field(default=6668, ge=1, le=65535)
+    mode: Literal["auto", "local", "cloud"] | None = None
+    dps_map: dict[str, TuyaDpsField] | None = None
+
+    @model_validator(mode="after")
+    def _check_local(self):
+        if self.mode == "local" and not (self.address and self.local_key):
+            raise ValueError('mode "local" exige address e local_key')
+        return self
+
+
+DEVICE_CONFIG_SCHEMAS: dict[str, type[PolledDeviceConfig]] = {
+    "modbus": ModbusRTUConfig,
+    "modbus_tcp": ModbusTCPConfig,
+    "tuya": TuyaConfig,
+}
+
+
+def validate_device_config(device_type: str, config: dict | None) -> PolledDeviceConfig | None:
+    """Valida o config do tipo (None para tipos sem poller); levanta `ValueError` se inválido."""
+    schema = DEVICE_CONFIG_SCHEMAS.get(device_type)
+    if schema is None:
+        return None
+    try:
+        return schema.model_validate(config or {})
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'config'}: {err['msg']}" for err in e.errors())
+        raise ValueError(f"config inválido para {device_type}: {errors}") from None
+
+
 class DeviceCreate(BaseModel):
     client_id: int
     name: str
@@ -26,6 +111,11 @@ class DeviceCreate(BaseModel):
     active: bool = True
     config: dict | None = None
 
+    @model_validator(mode="after")
+    def _check_config(self):
+        validate_device_config(self.device_type, self.config)
+        return self
+
 
 class DeviceRead(BaseModel):
     id: int
@@ -49,7 +139,7 @@ class MeasurementCreate(BaseModel):
 
 
 class MeasurementRead(BaseModel):
-    id: int
+    id: int | None  # None para valores gravados em snapshots
     device_id: int
     timestamp: datetime
     metric: str
@@ -1,7 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Callable, Any
+from typing import Callable, Any, Iterable
 import operator
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from ..models import AlarmEvent, AlarmRuleModel
 
 
 @dataclass
@@ -30,16 +34,64 @@ class AlarmEngine:
         return events
 
 
+_OPERATORS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
 def eval_operator(op: str, a: float, b: float) -> bool:
-    ops = {
-        ">": operator.gt,
-        "<": operator.lt,
-        ">=": operator.ge,
-        "<=": operator.le,
-        "==": operator.eq,
-        "!=": operator.ne,
-    }
-    if op not in ops:
+    if op not in _OPERATORS:
         raise ValueError(f"operador inválido: {op}")
-    return bool(ops[op](a, b))
+    return bool(_OPERATORS[op](a, b))
+
+
+
+def evaluate_alarm_rules(db: Session, rows: Iterable[tuple], device_clients: dict[int, int]) -> int:
+    """Avalia as regras ativas para um lote de medições e grava os eventos (sem commit).
 
+    Uma consulta de regras por lote (métricas e clientes presentes) e, para cada
+    regra, uma comparação vetorizada sobre os valores da métrica no lote. `rows` são
+    tuplas (device_id, metric, timestamp, value, ...) e `device_clients` mapeia
+    device_id -> client_id. Retorna quantos eventos foram gerados.
+    """
+    rows = list(rows)
+    if not rows or not device_clients:
+        return 0
+    metric_col = np.array([r[1] for r in rows], dtype=object)
+    rules = db.query(AlarmRuleModel).filter(
+        AlarmRuleModel.enabled == True,
+        AlarmRuleModel.metric.in_(set(metric_col.tolist())),
+        AlarmRuleModel.client_id.in_(set(device_clients.values())),
+    ).all()
+    if not rules:
+        return 0
+    devices = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    clients = np.fromiter((device_clients.get(r[0], -1) for r in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((r[3] for r in rows), dtype=np.float64, count=len(rows))
+    by_metric = {m: metric_col == m for m in {r.metric for r in rules}}
+    events = []
+    for r in rules:
+        op = _OPERATORS.get(r.operator)
+        if op is None:
+            continue  # regra malformada não interrompe a ingestão
+        mask = by_metric[r.metric] & (clients == r.client_id) & op(values, r.threshold)
+        if r.device_id is not None:
+            mask &= devices == r.device_id
+        for j in np.flatnonzero(mask).tolist():
+            events.append({
+                "rule_id": r.id,
+                "device_id": rows[j][0],
+                "timestamp": rows[j][2],
+                "metric": r.metric,
+                "value": rows[j][3],
+                "details": {"op": r.operator, "threshold": r.threshold},
+                "acknowledged": False,
+            })
+    if events:
+        db.execute(insert(AlarmEvent), events)
+    return len(events)
@@ -76,3 +76,120 @@ def six_sigma_params(series: pd.Series) -> dict[str, float]:
     
     return {"mean": mean_val, "std": std_val, "cpk": cpk}
 
+
+
+STEP_COMPONENTS = ["timestamp", "held_s", "weighted", "min", "max", "count", "sum"]
+
+
+def step_components(
+    timestamps,
+    values,
+    freq: str,
+    start,
+    end,
+    max_hold: float | None = None,
+) -> pd.DataFrame:
+    """Parcelas somáveis da agregação em degrau de `step_resample`, por intervalo.
+
+    held_s (segundos com valor conhecido), weighted (soma de valor x duração),
+    min, max, count e sum (dos pontos gravados no intervalo). Parcelas de
+    trechos vizinhos da mesma série se combinam somando/comparando coluna a
+    coluna (`finish_components`), o que permite guardá-las em rollups.
+    """
+    s = pd.Series(np.asarray(values, dtype=float), index=pd.DatetimeIndex(pd.to_datetime(timestamps)))
+    s = s.sort_index()
+    s = s[~s.index.duplicated(keep="last")]
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if s.empty or start >= end:
+        return pd.DataFrame(columns=STEP_COMPONENTS)
+
+    # pontos de quebra: gravações, bordas dos intervalos e fim da validade de cada valor
+    breaks = s.index.union(pd.date_range(start.floor(freq), end, freq=freq)).union([start])
+    if max_hold is not None:
+        breaks = breaks.union(s.index + pd.Timedelta(seconds=max_hold))
+    idx = breaks[(breaks >= start) & (breaks < end)]
+    full = s.index.union(idx)
+    held = s.reindex(full).ffill().reindex(idx)
+    if max_hold is not None:
+        recorded = pd.Series(s.index, index=s.index).reindex(full).ffill().reindex(idx)
+        held[(idx - pd.DatetimeIndex(recorded)) >= pd.Timedelta(seconds=max_hold)] = np.nan
+
+    edges = idx.append(pd.DatetimeIndex([end]))
+    dur = (edges[1:] - edges[:-1]).total_seconds().to_numpy()
+    known = held.notna().to_numpy()
+    frame = pd.DataFrame({
+        "bucket": idx.floor(freq),
+        "value": held.to_numpy(),
+        "weighted": np.where(known, held.to_numpy() * dur, 0.0),
+        "held_s": np.where(known, dur, 0.0),
+    })
+    g = frame.groupby("bucket")
+    out = pd.DataFrame({
+        "held_s": g["held_s"].sum(),
+        "weighted": g["weighted"].sum(),
+        "min": g["value"].min(),
+        "max": g["value"].max(),
+    })
+    inside = s[(s.index >= start) & (s.index < end)]
+    by_bucket = inside.groupby(inside.index.floor(freq))
+    out["count"] = by_bucket.size().reindex(out.index, fill_value=0)
+    out["sum"] = by_bucket.sum().reindex(out.index, fill_value=0.0)
+    out = out[out["held_s"] > 0]
+    return out.rename_axis("timestamp").reset_index()[STEP_COMPONENTS]
+
+
+def finish_components(parts: list[pd.DataFrame], freq: str) -> pd.DataFrame:
+    """Combina parcelas (`step_components` ou rollups) em intervalos de `freq`: mean, min, max, count e coverage."""
+    columns = ["timestamp", "mean", "min", "max", "count", "coverage"]
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    frame = pd.concat(parts, ignore_index=True)
+    g = frame.groupby(pd.DatetimeIndex(frame["timestamp"]).floor(freq))
+    out = pd.DataFrame({
+        "held_s": g["held_s"].sum(),
+        "weighted": g["weighted"].sum(),
+        "min": g["min"].min(),
+        "max": g["max"].max(),
+        "count": g["count"].sum().astype(int),
+    })
+    out = out[out["held_s"] > 0]
+    bucket_s = pd.Timedelta(freq).total_seconds()
+    out["mean"] = out["weighted"] / out["held_s"]
+    out["coverage"] = (out["held_s"] / bucket_s).clip(upper=1.0)
+    return out.rename_axis("timestamp").reset_index()[columns]
+
+
+def step_resample(
+    timestamps,
+    values,
+    freq: str,
+    start,
+    end,
+    max_hold: float | None = None,
+) -> pd.DataFrame:
+    """Agrega uma série gravada por exceção (deadband) reconstruindo o degrau.
+
+    Cada ponto vale até o próximo; por isso a média de um intervalo é ponderada
+    pelo tempo em que cada valor esteve em vigor, e intervalos sem nenhuma gravação
+    herdam o último valor. Pontos anteriores a `start` servem só de valor inicial.
+    Um valor deixa de valer `max_hold` segundos após a sua gravação (dispositivo
+    fora do ar: sem heartbeat não há como saber o valor).
+
+    Retorna colunas timestamp, mean, min, max, count (pontos gravados no intervalo)
+    e coverage (fração do intervalo com valor conhecido); intervalos sem valor
+    conhecido são omitidos.
+    """
+    return finish_components([step_components(timestamps, values, freq, start, end, max_hold)], freq)
+
+
+def align_step_held(x: pd.Series, y: pd.Series) -> pd.DataFrame:
+    """Alinha duas séries gravadas por exceção (índice temporal) carregando o último valor de cada uma.
+
+    Com deadband as métricas não são gravadas nos mesmos instantes; alinhar por
+    posição pareceria valores de momentos diferentes.
+    """
+    x = x[~x.index.duplicated(keep="last")].sort_index()
+    y = y[~y.index.duplicated(keep="last")].sort_index()
+    idx = x.index.union(y.index)
+    return pd.DataFrame({"x": x.reindex(idx).ffill(), "y": y.reindex(idx).ffill()}).dropna()
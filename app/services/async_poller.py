@@ -0,0 +1,172 @@
+"""Poller assíncrono para dispositivos Modbus TCP (EW11 e gateways RS485-TCP).
+
+Todos os dispositivos do ciclo são lidos em paralelo com o cliente assíncrono do
+pymodbus, limitados por um semáforo global e por um semáforo por gateway
+(host, porta) — um EW11 atende um único barramento RS485, então por padrão só uma
+transação por gateway fica em voo.
+
+O poller mantém um event loop próprio numa thread dedicada, para que as conexões
+do `AsyncModbusTCPConnectionPool` sobrevivam entre ciclos. Os semáforos também são
+do poller (criados uma vez, nesse loop): lotes do agendador despachados ao mesmo
+tempo dividem os mesmos limites em vez de cada um ter os seus.
+"""
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
+from ..connectors.drivers import input_blocks, decode_metrics
+from ..connectors.modbus import PrefetchedRegisters
+from ..connectors.modbus_pool import AsyncModbusTCPConnectionPool
+
+
+@dataclass
+class TCPDeviceTarget:
+    """Dados mínimos de um dispositivo `modbus_tcp`, desacoplados da sessão ORM."""
+    id: int
+    name: str
+    config: dict
+
+    @property
+    def host(self) -> str:
+        return self.config.get("host", "192.168.1.100")
+
+    @property
+    def port(self) -> int:
+        return int(self.config.get("port", 502))
+
+    @property
+    def slave_id(self) -> int:
+        return int(self.config.get("slave_id", 1))
+
+    @property
+    def timeout(self) -> float:
+        return float(self.config.get("timeout", 3.0))
+
+    @property
+    def framer(self) -> str:
+        """`socket` (Modbus TCP) ou `rtu` (RTU sobre TCP, EW11 em modo transparente)."""
+        return self.config.get("framer", "socket")
+
+    @property
+    def gateway(self) -> tuple[str, int]:
+        return (self.host, self.port)
+
+
+@dataclass
+class PollCycleReport:
+    """Resumo de um ciclo de coleta."""
+    started_at: datetime
+    polled: int = 0
+    failed: int = 0
+    skipped: int = 0
+    duration_s: float = 0.0
+    errors: dict[int, str] = field(default_factory=dict)
+    latencies: dict[int, float] = field(default_factory=dict)  # duração da leitura por device_id (s)
+
+    @property
+    def succeeded(self) -> int:
+        return self.polled - self.failed
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat(),
+            "polled": self.polled,
+            "failed": self.failed,
+            "succeeded": self.succeeded,
+            "skipped": self.skipped,
+            "duration_s": round(self.duration_s, 3),
+            "errors": self.errors,
+        }
+
+
+class AsyncModbusTCPPoller:
+    def __init__(self, max_concurrency: int = 100, per_gateway_concurrency: int = 1):
+        """
+        Args:
+            max_concurrency: Máximo de dispositivos lidos simultaneamente no ciclo
+            per_gateway_concurrency: Máximo de transações simultâneas por (host, porta)
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.per_gateway_concurrency = max(1, int(per_gateway_concurrency))
+        self.pool = AsyncModbusTCPConnectionPool(concurrency=self.per_gateway_concurrency)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        # criados no loop do poller, no primeiro `poll` (ver `_semaphores`)
+        self._global_sem: asyncio.Semaphore | None = None
+        self._gateway_sems: dict[tuple[str, int], asyncio.Semaphore] = {}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._global_sem, self._gateway_sems = None, {}  # os do loop anterior não servem no novo
+                self._thread = threading.Thread(target=self._loop.run_forever, name="modbus-tcp-poller", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run_cycle(self, targets: list[TCPDeviceTarget]) -> tuple[PollCycleReport, dict[int, dict[str, float]]]:
+        """Executa `poll` no event loop do poller (chamável de qualquer thread)."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.poll(targets), loop).result()
+
+    def pool_stats(self) -> list[dict[str, Any]]:
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return []
+        return asyncio.run_coroutine_threadsafe(self._pool_stats(), loop).result(timeout=5)
+
+    async def _pool_stats(self) -> list[dict[str, Any]]:
+        return self.pool.stats()
+
+    def shutdown(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self.pool.close_all)
+            loop.call_soon_threadsafe(loop.stop)
+
+    async def read_device(self, target: TCPDeviceTarget) -> dict[str, float]:
+        """Lê todos os blocos do driver pela conexão compartilhada do gateway e decodifica as métricas."""
+        snapshot = PrefetchedRegisters()
+        for address, count in input_blocks(target.config):
+            regs = await self.pool.read_input_registers(
+                target.host, target.port, target.slave_id, address, count, timeout=target.timeout, framer=target.framer
+            )
+            snapshot.add_block(address, regs)
+        return decode_metrics(target.config, snapshot)
+
+    def _semaphores(self, gateway: tuple[str, int]) -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        """Semáforos global e do gateway, compartilhados por todos os `poll` em andamento (no loop do poller)."""
+        if self._global_sem is None:
+            self._global_sem = asyncio.Semaphore(self.max_concurrency)
+        gw_sem = self._gateway_sems.get(gateway)
+        if gw_sem is None:
+            gw_sem = self._gateway_sems[gateway] = asyncio.Semaphore(self.per_gateway_concurrency)
+        return self._global_sem, gw_sem
+
+    async def poll(self, targets: list[TCPDeviceTarget]) -> tuple[PollCycleReport, dict[int, dict[str, float]]]:
+        """Lê todos os dispositivos de uma vez; retorna o relatório do ciclo e as métricas por device_id."""
+        report = PollCycleReport(started_at=datetime.utcnow())
+        t0 = time.perf_counter()
+        results: dict[int, dict[str, float]] = {}
+
+        async def run(target: TCPDeviceTarget):
+            global_sem, gw_sem = self._semaphores(target.gateway)
+            async with gw_sem:
+                async with global_sem:
+                    started = time.perf_counter()
+                    try:
+                        results[target.id] = await self.read_device(target)
+                    except Exception as e:
+                        report.failed += 1
+                        report.errors[target.id] = str(e)
+                    report.latencies[target.id] = time.perf_counter() - started
+
+        report.polled = len(targets)
+        await asyncio.gather(*(run(t) for t in targets))
+        report.duration_s = time.perf_counter() - t0
+        return report, results
@@ -0,0 +1,191 @@
+"""Circuit breaker para medidores e gateways inacessíveis.
+
+Estados:
+- closed: leituras normais; falhas consecutivas são contadas
+- open: após `failure_threshold` falhas seguidas o alvo é pulado até o fim do backoff
+- half_open: terminado o backoff, uma única leitura de prova é liberada; sucesso
+  fecha o circuito, falha reabre com backoff dobrado (até `backoff_max`)
+
+Um breaker por dispositivo (`device:<id>`) e um por gateway/barramento
+(`gateway:<host>:<porta>`, `port:<serial>`), para que um EW11 desligado ou um
+medidor morto não consuma o timeout completo a cada ciclo.
+
+O breaker de gateway recebe o resultado de cada dispositivo atrás dele
+(`record_member`) e conta uma falha só quando todos os dispositivos conhecidos do
+gateway falharam desde o último sucesso de qualquer um deles, independentemente de
+como o scheduler agrupou as leituras: um medidor morto atrás de um EW11 saudável
+abre só o breaker do próprio medidor.
+"""
+from __future__ import annotations
+import threading
+import time
+from datetime import datetime
+from typing import Any
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, key: str, failure_threshold: int = 3, backoff_initial: float = 30.0, backoff_max: float = 1800.0):
+        self.key = key
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0  # aberturas seguidas sem sucesso (define o backoff)
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.total_failures = 0
+        self.total_successes = 0
+        self.skipped = 0
+        self.last_error: str | None = None
+        self.last_success_at: datetime | None = None
+        self.last_failure_at: datetime | None = None
+        self._members: dict[Any, float] = {}  # gateway: dispositivo -> última tentativa (monotonic)
+        self._failed_members: set = set()  # dispositivos que falharam desde o último sucesso do gateway
+        self._lock = threading.Lock()
+
+    def _backoff(self) -> float:
+        return min(self.backoff_max, self.backoff_initial * (2 ** max(0, self.trips - 1)))
+
+    def ready(self, now: float | None = None) -> bool:
+        """Como `allow`, mas sem alterar o estado (não consome a prova do half-open)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return now >= self.open_until
+            return not self.probe_in_flight
+
+    def note_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def allow(self, now: float | None = None) -> bool:
+        """Indica se o alvo pode ser lido agora; em half-open libera só uma prova."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now >= self.open_until:
+                self.state = HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.skipped += 1
+            return False
+
+    def release_probe(self):
+        """Devolve a prova do half-open liberada por `allow` sem que a leitura aconteça."""
+        with self._lock:
+            self.probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.trips = 0
+            self.probe_in_flight = False
+            self.total_successes += 1
+            self.last_success_at = datetime.utcnow()
+
+    def record_failure(self, error: str | None = None, now: float | None = None) -> bool:
+        """Registra uma falha; retorna True se o circuito abriu (ou reabriu) agora."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.consecutive_failures += 1
+            self.total_failures += 1
+            self.last_error = error
+            self.last_failure_at = datetime.utcnow()
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.trips += 1
+                self.state = OPEN
+                self.open_until = now + self._backoff()
+                return True
+            return False
+
+    def record_member(self, member: Any, ok: bool, error: str | None = None, now: float | None = None) -> bool:
+        """Resultado de um dispositivo atrás deste gateway; retorna True se o circuito abriu agora.
+
+        Dispositivos sem tentativa há mais de 2 x `backoff_max` deixam de contar (removidos
+        ou desativados), para não impedir para sempre a abertura do gateway.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._members[member] = now
+            for m, seen in list(self._members.items()):
+                if now - seen > 2 * self.backoff_max:
+                    del self._members[m]
+                    self._failed_members.discard(m)
+            if ok:
+                self._failed_members.clear()
+            else:
+                self._failed_members.add(member)
+                if not self._failed_members >= self._members.keys():
+                    # ainda há dispositivo sem falha: não é o gateway; libera a prova do half-open
+                    self.probe_in_flight = False
+                    return False
+                self._failed_members.clear()
+        if ok:
+            self.record_success()
+            return False
+        return self.record_failure(error, now)
+
+    def snapshot(self, now: float | None = None) -> dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return {
+                "key": self.key,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_s": round(max(0.0, self.open_until - now), 1) if self.state == OPEN else 0.0,
+                "backoff_s": self._backoff() if self.trips else 0.0,
+                "total_failures": self.total_failures,
+                "total_successes": self.total_successes,
+                "skipped": self.skipped,
+                "last_error": self.last_error,
+                "last_success_at": self.last_success_at.isoformat() if self.last_success_at else None,
+                "last_failure_at": self.last_failure_at.isoformat() if self.last_failure_at else None,
+            }
+
+
+class BreakerRegistry:
+    def __init__(self, failure_threshold: int = 3, backoff_initial: float = 30.0, backoff_max: float = 1800.0):
+        self.failure_threshold = failure_threshold
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            b = self._breakers.get(key)
+            if b is None:
+                b = self._breakers[key] = CircuitBreaker(key, self.failure_threshold, self.backoff_initial, self.backoff_max)
+            return b
+
+    def find(self, key: str) -> CircuitBreaker | None:
+        with self._lock:
+            return self._breakers.get(key)
+
+    def device(self, device_id: int) -> CircuitBreaker:
+        return self.get(f"device:{device_id}")
+
+    def gateway(self, host: str, port: int) -> CircuitBreaker:
+        return self.get(f"gateway:{host}:{port}")
+
+    def serial_port(self, port: str) -> CircuitBreaker:
+        return self.get(f"port:{port}")
+
+    def snapshot(self, prefix: str | None = None) -> list[dict[str, Any]]:
+        with self._lock:
+            breakers = [b for k, b in self._breakers.items() if prefix is None or k.startswith(prefix)]
+        return [b.snapshot() for b in breakers]
+
@@ -0,0 +1,460 @@
+"""Camada fria: meses fechados de medições em arquivos colunares mapeados em memória.
+
+Com `COLD_TIER_AFTER_DAYS` > 0, o job de tiering (agendado a cada COLD_TIER_INTERVAL no
+agendador de coleta) move, por dispositivo e métrica, cada mês que terminou há mais
+que N dias para um segmento em COLD_TIER_DIR:
+
+- `<prefixo>.ts.npy`: timestamps em µs desde 1970 (UTC, int64), em ordem;
+- `<prefixo>.val.npy`: valores em float32 (contadores de energia em float64, para as
+  diferenças de `services/energy.py` não perderem precisão);
+- `cold_segments`: uma linha por segmento, com o intervalo coberto e um índice esparso
+  (um timestamp a cada `SPARSE_EVERY` pontos).
+
+Com `COLD_TIER_FORMAT=gorilla` os segmentos novos vão para o próprio banco, em
+`cold_blocks`: blocos de `gorilla.BLOCK_SIZE` pontos comprimidos com delta-of-delta
+nos tempos e XOR nos valores (`services/gorilla.py`), em float64 sem perdas e com
+~5 bytes por ponto, contra dezenas por linha de `measurements` mais o índice. Serve
+a bancos na nuvem sem disco local compartilhado; a consulta decodifica só os blocos
+do intervalo (o índice esparso tem um timestamp por bloco). Os dois formatos
+convivem: segmentos antigos continuam no formato em que foram gravados até uma
+mescla de dados atrasados regravá-los.
+
+As linhas saem da tabela quente (ou da partição do mês) com DELETE ... RETURNING na
+mesma transação que registra o segmento: se a gravação dos arquivos ou o commit
+falhar, nada muda. Pontos atrasados que caem num mês já frio são mesclados num
+segmento novo na próxima execução (os arquivos têm nome único e o antigo só é
+apagado depois do commit). Linhas com `extra` e o layout de snapshots ficam na
+tabela quente.
+
+As consultas de `crud` juntam os segmentos às linhas quentes: o índice esparso
+localiza o bloco, `np.searchsorted` no bloco mapeado acha as bordas e o intervalo é
+uma fatia do arquivo, sem cópia e sem linha Python (`crud.measurement_arrays`).
+
+    python -m app.services.cold_tier run
+    python -m app.services.cold_tier status
+"""
+from __future__ import annotations
+import argparse
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable
+import numpy as np
+import pandas as pd
+from sqlalchemy import Text, cast, delete, func, insert, or_, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, object_session
+from .. import models
+from ..core.config import settings
+from . import gorilla
+from .partitions import month_bounds, month_key, partitions
+
+
+logger = logging.getLogger("pieng.audit")
+
+FORMATS = ("npy", "gorilla")
+SPARSE_EVERY = 1024  # pontos por entrada do índice esparso (npy; no gorilla, um por bloco)
+TS_DTYPE = np.dtype("<i8")
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def to_us(ts: datetime) -> int:
+    return (ts - _EPOCH) // _US
+
+
+def from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(us))
+
+
+def to_us_array(times) -> np.ndarray:
+    """datetimes -> µs int64 (pelo pandas: `np.array(..., dtype="datetime64[us]")` é ~15x mais lento)."""
+    return pd.DatetimeIndex(times).as_unit("us").asi8
+
+
+def value_dtype(metric: str) -> np.dtype:
+    """float32 para grandezas instantâneas; float64 para contadores (kWh acumulados passam de 7 dígitos)."""
+    return np.dtype("<f8") if "energy" in metric else np.dtype("<f4")
+
+
+def _empty(dtype=np.float64) -> tuple[np.ndarray, np.ndarray]:
+    return np.empty(0, dtype=TS_DTYPE), np.empty(0, dtype=dtype)
+
+
+class ColdTier:
+    def __init__(self, root: str, after_days: float = 0, fmt: str = "npy", max_open: int = 512):
+        """
+        Args:
+            root: Diretório dos segmentos
+            after_days: Move meses que terminaram há mais que isso (0 = tiering desligado; segmentos existentes continuam legíveis)
+            fmt: Formato dos segmentos novos: "npy" (arquivos em `root`) ou "gorilla" (blocos comprimidos em `cold_blocks`)
+            max_open: Segmentos mapeados em memória e blocos decodificados mantidos em cache (LRU)
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"formato da camada fria desconhecido: {fmt} (use {', '.join(FORMATS)})")
+        self.root = Path(root)
+        self.after_days = after_days
+        self.format = fmt
+        self.max_open = max_open
+        self._cache: OrderedDict[object, tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.rows_moved = 0
+        self.last_run: datetime | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    # -- armazenamento -------------------------------------------------------------
+
+    def _cached(self, key) -> tuple[np.ndarray, np.ndarray] | None:
+        with self._lock:
+            found = self._cache.get(key)
+            if found is not None:
+                self._cache.move_to_end(key)
+            return found
+
+    def _remember(self, key, arrays: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            self._cache[key] = arrays
+            while len(self._cache) > self.max_open:
+                self._cache.popitem(last=False)
+        return arrays
+
+    def _open(self, seg: models.ColdSegment) -> tuple[np.ndarray, np.ndarray]:
+        """(timestamps, valores) de um segmento npy, mapeados em memória."""
+        found = self._cached(seg.path)
+        if found is None:
+            base = self.root / seg.path
+            found = self._remember(seg.path, (
+                np.load(f"{base}.ts.npy", mmap_mode="r").view(np.ndarray),
+                np.load(f"{base}.val.npy", mmap_mode="r").view(np.ndarray),
+            ))
+        return found
+
+    def _blocks(self, seg: models.ColdSegment, first: int, last: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Blocos `first`..`last` de um segmento gorilla, decodificados; os que faltam no cache saem numa consulta."""
+        found = {k: self._cached((seg.path, k)) for k in range(first, last + 1)}
+        missing = [k for k, arrays in found.items() if arrays is None]
+        if missing:
+            B = models.ColdBlock
+            for k, data in object_session(seg).execute(select(B.seq, B.data).where(B.path == seg.path, B.seq.in_(missing))):
+                found[k] = self._remember((seg.path, k), gorilla.decode(data))
+        return [found[k] for k in range(first, last + 1)]
+
+    def _slice(self, seg: models.ColdSegment, i0: int, i1: int) -> tuple[np.ndarray, np.ndarray]:
+        """Pontos `i0`..`i1` (exclusivo) do segmento: fatia do arquivo (npy) ou dos blocos decodificados (gorilla)."""
+        if seg.format == "npy":
+            ts, values = self._open(seg)
+            return ts[i0:i1], values[i0:i1]
+        if i1 <= i0:
+            return _empty()
+        size = gorilla.BLOCK_SIZE
+        parts = self._blocks(seg, i0 // size, (i1 - 1) // size)
+        ts, values = parts[0] if len(parts) == 1 else (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+        offset = (i0 // size) * size
+        return ts[i0 - offset:i1 - offset], values[i0 - offset:i1 - offset]
+
+    def _store(self, db: Session, device_id: int, metric: str, period: str, ts: np.ndarray, values: np.ndarray) -> str:
+        """Grava os pontos com chave nova, no formato configurado; retorna a chave (`path`).
+
+        npy: dois arquivos (tmp + fsync + rename). gorilla: blocos em `cold_blocks`, na
+        transação de `db`.
+        """
+        rel = f"{device_id}/{period}-{_SAFE_RE.sub('_', metric)}-{secrets.token_hex(4)}"
+        if self.format == "gorilla":
+            db.execute(insert(models.ColdBlock), [
+                {"path": rel, "seq": k, "data": blob} for k, blob in enumerate(gorilla.encode_blocks(ts, values))
+            ])
+            return rel
+        base = self.root / rel
+        base.parent.mkdir(parents=True, exist_ok=True)
+        for suffix, arr in ((".ts.npy", ts), (".val.npy", values)):
+            tmp = f"{base}{suffix}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, f"{base}{suffix}")
+        return rel
+
+    def _discard(self, db: Session, fmt: str, rel: str):
+        """Apaga os blocos (gorilla, na transação de `db`) ou os arquivos (npy) de um segmento."""
+        if fmt == "gorilla":
+            db.execute(delete(models.ColdBlock).where(models.ColdBlock.path == rel))
+            return
+        with self._lock:
+            self._cache.pop(rel, None)
+        for suffix in (".ts.npy", ".val.npy"):
+            try:
+                os.unlink(f"{self.root / rel}{suffix}")
+            except FileNotFoundError:
+                pass
+
+    # -- leitura -----------------------------------------------------------------
+
+    def segments(self, db: Session, device_id: int, metrics: Iterable[str] | None = None) -> dict[str, list[models.ColdSegment]]:
+        """Segmentos do dispositivo por métrica, do mais antigo para o mais novo (uma consulta)."""
+        S = models.ColdSegment
+        q = select(S).where(S.device_id == device_id)
+        if metrics is not None:
+            q = q.where(S.metric.in_(list(metrics)))
+        found: dict[str, list[models.ColdSegment]] = {}
+        for seg in db.execute(q.order_by(S.metric, S.start)).scalars():
+            found.setdefault(seg.metric, []).append(seg)
+        return found
+
+    def _search(self, seg: models.ColdSegment, us: int, side: str) -> int:
+        """`np.searchsorted` nos timestamps do segmento, lendo só o trecho apontado pelo índice esparso."""
+        every = gorilla.BLOCK_SIZE if seg.format == "gorilla" else SPARSE_EVERY
+        b = int(np.searchsorted(np.frombuffer(seg.sparse_index, dtype=TS_DTYPE), us, side))
+        lo, hi = max(b - 1, 0) * every, min(b * every, seg.count)  # a resposta está em (lo, hi]
+        ts, _ = self._slice(seg, lo, hi)
+        return lo + int(np.searchsorted(ts, us, side))
+
+    def scan(self, segs: list[models.ColdSegment], start: datetime | None = None, end: datetime | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Pontos em [start, end] como (µs int64, valores); com um segmento npy só são fatias do arquivo, sem cópia."""
+        parts = []
+        for seg in segs:
+            if (end is not None and seg.start > end) or (start is not None and seg.end < start):
+                continue
+            i0 = self._search(seg, to_us(start), "left") if start is not None and seg.start < start else 0
+            i1 = self._search(seg, to_us(end), "right") if end is not None and seg.end > end else seg.count
+            if i1 > i0:
+                parts.append(self._slice(seg, i0, i1))
+        if not parts:
+            return _empty(segs[0].dtype if segs else np.float64)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def before(self, segs: list[models.ColdSegment], ts: datetime) -> tuple[datetime, float] | None:
+        """Último ponto antes de `ts` (exclusivo)."""
+        earlier = [s for s in segs if s.start < ts]
+        if not earlier:
+            return None
+        seg = earlier[-1]  # meses disjuntos: o ponto está no último que começa antes
+        i = self._search(seg, to_us(ts), "left") - 1
+        times, values = self._slice(seg, i, i + 1)
+        return from_us(times[0]), float(values[0])
+
+    def after(self, segs: list[models.ColdSegment], ts: datetime) -> tuple[datetime, float] | None:
+        """Primeiro ponto depois de `ts` (exclusivo)."""
+        later = [s for s in segs if s.end > ts]
+        if not later:
+            return None
+        seg = later[0]
+        i = self._search(seg, to_us(ts), "right")
+        times, values = self._slice(seg, i, i + 1)
+        return from_us(times[0]), float(values[0])
+
+    def latest(self, segs: list[models.ColdSegment], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Até `limit` pontos mais recentes, em ordem cronológica."""
+        parts, taken = [], 0
+        for seg in reversed(segs):
+            if taken >= limit:
+                break
+            n = min(limit - taken, seg.count)
+            parts.append(self._slice(seg, seg.count - n, seg.count))
+            taken += n
+        if not parts:
+            return _empty()
+        parts.reverse()
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    # -- tiering -----------------------------------------------------------------
+
+    def cutoff(self, now: datetime | None = None) -> datetime:
+        """Início do primeiro mês que ainda fica quente."""
+        return month_bounds(month_key((now or datetime.utcnow()) - timedelta(days=self.after_days)))[0]
+
+    @staticmethod
+    def _metrics(db: Session, table, device_id: int) -> list[str]:
+        """Métricas do dispositivo na tabela, pulando pelo índice (device_id, metric, timestamp)."""
+        found, last = [], ""
+        while True:
+            nxt = db.execute(select(func.min(table.c.metric)).where(table.c.device_id == device_id, table.c.metric > last)).scalar()
+            if nxt is None:
+                return found
+            found.append(nxt)
+            last = nxt
+
+    @staticmethod
+    def _movable(table) -> tuple:
+        """Linhas que vão para o segmento: com valor e sem `extra` (as demais ficam quentes)."""
+        # `extra` None vira JSON null ('null') na gravação pelo ORM/Core
+        return table.c.value.isnot(None), or_(table.c.extra.is_(None), cast(table.c.extra, Text) == "null")
+
+    def _move(self, db: Session, table, device_id: int, metric: str, period: str) -> int:
+        """Move um mês de uma métrica da tabela para o segmento (mesclando com o existente); faz commit."""
+        start, end = month_bounds(period)
+        rows = db.execute(delete(table).where(
+            table.c.device_id == device_id, table.c.metric == metric,
+            table.c.timestamp >= start, table.c.timestamp < end, *self._movable(table),
+        ).returning(table.c.timestamp, table.c.value)).all()
+        if not rows:
+            db.rollback()
+            return 0
+        # gorilla guarda float64 sem perdas; npy, float32 fora dos contadores
+        dtype = value_dtype(metric) if self.format == "npy" else np.dtype("<f8")
+        times, values = zip(*rows)
+        ts = to_us_array(times)
+        vals = np.asarray(values, dtype=dtype)
+        S = models.ColdSegment
+        old = db.execute(select(S).where(S.device_id == device_id, S.metric == metric, S.period == period)).scalar_one_or_none()
+        if old is not None:
+            old_ts, old_vals = self._slice(old, 0, old.count)
+            ts, vals = np.concatenate([old_ts, ts]), np.concatenate([old_vals.astype(dtype), vals])
+        order = np.argsort(ts, kind="stable")
+        ts, vals = np.ascontiguousarray(ts[order]), np.ascontiguousarray(vals[order])
+        rel = self._store(db, device_id, metric, period, ts, vals)
+        try:
+            seg = old or S(device_id=device_id, metric=metric, period=period)
+            replaced = (old.format, old.path) if old is not None else None
+            if replaced and replaced[0] == "gorilla":
+                self._discard(db, *replaced)
+            seg.start, seg.end = from_us(ts[0]), from_us(ts[-1])
+            seg.count, seg.dtype, seg.format, seg.path = len(ts), vals.dtype.name, self.format, rel
+            every = gorilla.BLOCK_SIZE if self.format == "gorilla" else SPARSE_EVERY
+            seg.sparse_index = ts[::every].tobytes()
+            db.add(seg)
+            db.commit()
+        except Exception:
+            db.rollback()
+            if self.format == "npy":
+                self._discard(db, "npy", rel)
+            raise
+        if replaced and replaced[0] == "npy":
+            self._discard(db, *replaced)  # arquivos antigos só depois do commit
+        return len(rows)
+
+    def tier(self, engine: Engine, now: datetime | None = None, devices: Iterable[int] | None = None) -> int:
+        """Move os meses fechados antes de `cutoff` para segmentos; retorna as linhas movidas."""
+        cutoff = self.cutoff(now)
+        moved = 0
+        with Session(engine) as db:
+            if devices is None:
+                devices = db.execute(select(models.Device.id).order_by(models.Device.id)).scalars().all()
+            tables = [models.Measurement.__table__] + partitions.read_tables(db, end=cutoff - _US)
+            for table in tables:
+                for device_id in sorted(devices):
+                    for metric in self._metrics(db, table, device_id):
+                        since = datetime.min
+                        while True:
+                            oldest = db.execute(select(func.min(table.c.timestamp)).where(
+                                table.c.device_id == device_id, table.c.metric == metric,
+                                table.c.timestamp >= since, *self._movable(table),
+                            )).scalar()
+                            if oldest is None or oldest >= cutoff:
+                                break
+                            period = month_key(oldest)
+                            moved += self._move(db, table, device_id, metric, period)
+                            since = month_bounds(period)[1]
+            self._drop_empty(db, cutoff)
+        self.runs += 1
+        self.rows_moved += moved
+        self.last_run = datetime.utcnow()
+        if moved:
+            logger.info(f"COLD_TIER_MOVED | rows={moved} | before={cutoff.isoformat()}")
+        return moved
+
+    def _drop_empty(self, db: Session, cutoff: datetime):
+        """Partições SQLite anteriores ao corte que ficaram vazias são apagadas."""
+        for table in partitions.read_tables(db, end=cutoff - _US):
+            if month_bounds(table.name[-6:])[1] <= cutoff and db.execute(select(1).select_from(table).limit(1)).first() is None:
+                db.execute(text(f"DROP TABLE IF EXISTS {table.name}"))
+                db.commit()
+                logger.info(f"PARTITION_DROPPED | partition={table.name} | reason=cold_tier")
+        partitions.existing(db, fresh=True)
+
+    def apply_retention(self, engine: Engine, retention_days: float, now: datetime | None = None) -> int:
+        """Apaga os segmentos de meses que terminaram há mais que `retention_days`; retorna quantos."""
+        if retention_days <= 0:
+            return 0
+        cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+        S = models.ColdSegment
+        with Session(engine) as db:
+            expired = [s for s in db.execute(select(S).where(S.end < cutoff)).scalars() if month_bounds(s.period)[1] <= cutoff]
+            files = [s.path for s in expired if s.format == "npy"]
+            for seg in expired:
+                if seg.format == "gorilla":
+                    self._discard(db, seg.format, seg.path)
+                db.delete(seg)
+            db.commit()
+            for rel in files:
+                self._discard(db, "npy", rel)
+        if expired:
+            logger.info(f"COLD_TIER_EXPIRED | segments={len(expired)} | retention_days={retention_days}")
+        return len(expired)
+
+    def run(self, engine: Engine, devices: Iterable[int] | None = None) -> int:
+        moved = self.tier(engine, devices=devices)
+        self.apply_retention(engine, settings.measurement_retention_days)
+        return moved
+
+    def schedule(self, scheduler, engine: Engine, seconds: float, devices: Callable[[], Iterable[int]] | None = None):
+        """Agenda `run` no `PollingScheduler`; `devices` restringe aos dispositivos deste processo (leases do worker)."""
+        if self.enabled:
+            scheduler.add_job(
+                lambda: self.run(engine, devices() if devices is not None else None),
+                seconds=seconds, id="cold_tier", overlap="skip",
+            )
+
+    def stats(self, engine: Engine) -> dict:
+        S, B = models.ColdSegment, models.ColdBlock
+        with Session(engine) as db:
+            segments, points, first, last = db.execute(select(func.count(), func.sum(S.count), func.min(S.start), func.max(S.end))).one()
+            by_format = db.execute(select(S.format, S.dtype, func.sum(S.count)).group_by(S.format, S.dtype)).all()
+            stored = db.execute(select(func.sum(func.length(B.data)))).scalar() or 0
+        stored += sum(n * (TS_DTYPE.itemsize + np.dtype(dtype).itemsize) for fmt, dtype, n in by_format if fmt == "npy")
+        return {
+            "enabled": self.enabled,
+            "after_days": self.after_days,
+            "format": self.format,
+            "dir": str(self.root),
+            "segments": segments,
+            "points": points or 0,
+            "bytes": stored,
+            "bytes_per_point": round(stored / points, 2) if points else None,
+            "oldest": first.isoformat() if first else None,
+            "newest": last.isoformat() if last else None,
+            "runs": self.runs,
+            "rows_moved": self.rows_moved,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+cold_tier = ColdTier(settings.cold_tier_dir, settings.cold_tier_after_days, settings.cold_tier_format)
+
+
+def main():
+    from ..core.db import engine, init_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--after-days", type=float, default=None, help="sobrepõe COLD_TIER_AFTER_DAYS (run)")
+    args = parser.parse_args()
+    init_db()
+    if args.command == "status":
+        for key, value in cold_tier.stats(engine).items():
+            print(f"{key}: {value}")
+        return
+    if args.after_days is not None:
+        cold_tier.after_days = args.after_days
+    if not cold_tier.enabled:
+        parser.error("tiering desligado (COLD_TIER_AFTER_DAYS=0); use --after-days N")
+    t0 = time.perf_counter()
+    moved = cold_tier.run(engine)
+    print(f"{moved} medições movidas para {cold_tier.root} em {time.perf_counter() - t0:.1f} s (antes de {cold_tier.cutoff():%Y-%m-%d})")
+
+
+if __name__ == "__main__":
+    main()
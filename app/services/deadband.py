@@ -0,0 +1,155 @@
+"""Deadband / report-by-exception: grava só valores que mudaram de forma relevante.
+
+Cada métrica tem uma banda morta absoluta (`abs`, na unidade da métrica) e/ou
+percentual (`pct`, sobre o último valor gravado). Um valor novo é gravado quando
+sai da banda em relação ao último valor *gravado* (não ao último lido, para não
+acumular deriva) ou quando a métrica ficou `max_silence` segundos sem gravação
+(heartbeat). Entre dois pontos gravados a série é um degrau: o valor vale até o
+próximo ponto (ver `analytics.step_resample`).
+
+Configuração por dispositivo em `Device.config`:
+
+    "deadband": {"voltage*": {"abs": 1.0}, "power_total": {"pct": 5}, "frequency": {"abs": 0}},
+    "max_silence": 600
+
+As chaves aceitam curingas (fnmatch). Com `abs` e `pct` juntos vale a banda maior
+(o `abs` serve de piso para leituras próximas de zero). `{"abs": 0}` grava toda
+mudança e `"deadband": false` desliga o filtro para o dispositivo.
+
+`filter` só decide; o estado (último valor gravado) muda em `commit`, chamado depois
+que a gravação em lote deu certo. Se o insert falhar, a próxima leitura é comparada
+com o que de fato está no banco e nada some por ter sido "gravado" só na memória.
+"""
+from __future__ import annotations
+import threading
+import time
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Any
+
+
+@dataclass(frozen=True)
+class DeadbandRule:
+    abs: float | None = None
+    pct: float | None = None
+
+    @classmethod
+    def from_config(cls, raw: dict[str, Any]) -> DeadbandRule:
+        return cls(
+            abs=float(raw["abs"]) if raw.get("abs") is not None else None,
+            pct=float(raw["pct"]) if raw.get("pct") is not None else None,
+        )
+
+    def band(self, last: float) -> float:
+        """Meia-largura da banda em torno de `last`; com `abs` e `pct`, vale a maior (abs é o piso)."""
+        width = 0.0
+        if self.abs is not None:
+            width = self.abs
+        if self.pct is not None:
+            width = max(width, abs(last) * self.pct / 100.0)
+        return width
+
+    def exceeded(self, last: float, value: float) -> bool:
+        """True se `value` saiu da banda em torno de `last`."""
+        return abs(value - last) > self.band(last)
+
+
+# Bandas padrão por família de métrica (primeiro padrão que casar vence)
+DEFAULT_DEADBANDS: tuple[tuple[str, DeadbandRule], ...] = (
+    ("voltage*", DeadbandRule(abs=1.0, pct=1.0)),
+    ("current*", DeadbandRule(abs=0.05, pct=5.0)),
+    ("power_factor*", DeadbandRule(abs=0.02)),
+    ("*power*", DeadbandRule(abs=10.0, pct=5.0)),
+    ("frequency", DeadbandRule(abs=0.05)),
+    ("thd_*", DeadbandRule(abs=1.0)),
+    ("energy_wh", DeadbandRule(abs=50.0)),
+    ("*energy*", DeadbandRule(abs=0.05)),
+)
+
+
+def _match(rules: dict[str, DeadbandRule] | tuple, metric: str) -> DeadbandRule | None:
+    """Nome exato primeiro; depois o primeiro padrão que casar."""
+    if isinstance(rules, dict):
+        if metric in rules:
+            return rules[metric]
+        rules = tuple(rules.items())
+    for pattern, rule in rules:
+        if fnmatchcase(metric, pattern):
+            return rule
+    return None
+
+
+class DeadbandFilter:
+    def __init__(self, max_silence: float = 300.0, enabled: bool = True):
+        """
+        Args:
+            max_silence: Heartbeat padrão (s): tempo máximo sem gravar uma métrica
+            enabled: Se False, `filter` devolve todos os valores (comportamento anterior)
+        """
+        self.max_silence = max_silence
+        self.enabled = enabled
+        self._last: dict[tuple[int, str], tuple[float, float]] = {}  # (device, métrica) -> (valor, instante)
+        self._rules: dict[tuple[int, str], tuple[str, DeadbandRule | None]] = {}
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.stored = 0
+
+    def _rule(self, device_id: int, metric: str, cfg: dict) -> DeadbandRule | None:
+        raw = cfg.get("deadband") or {}
+        key = (device_id, metric)
+        cache_tag = repr(raw)
+        cached = self._rules.get(key)
+        if cached is not None and cached[0] == cache_tag:
+            return cached[1]
+        custom = {pattern: DeadbandRule.from_config(r) for pattern, r in raw.items()}
+        rule = _match(custom, metric) if custom else None
+        if rule is None:
+            rule = _match(DEFAULT_DEADBANDS, metric)
+        self._rules[key] = (cache_tag, rule)
+        return rule
+
+    def filter(self, device_id: int, values: dict[str, float], cfg: dict | None = None, now: float | None = None) -> dict[str, float]:
+        """Devolve o subconjunto de `values` que deve ser gravado (o estado muda só em `commit`)."""
+        cfg = cfg or {}
+        with self._lock:
+            self.seen += len(values)
+            if not self.enabled or cfg.get("deadband") is False:
+                return values
+            now = time.time() if now is None else now
+            max_silence = float(cfg.get("max_silence", self.max_silence))
+            out: dict[str, float] = {}
+            for metric, value in values.items():
+                last = self._last.get((device_id, metric))
+                if last is not None and now - last[1] < max_silence:
+                    rule = self._rule(device_id, metric, cfg)
+                    if rule is not None and not rule.exceeded(last[0], value):
+                        continue
+                out[metric] = value
+        return out
+
+    def commit(self, device_id: int, stored: dict[str, float], now: float | None = None):
+        """Registra como último valor gravado o que `filter` liberou e foi de fato gravado."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for metric, value in stored.items():
+                self._last[(device_id, metric)] = (value, now)
+            self.stored += len(stored)
+
+    def forget(self, device_id: int):
+        """Descarta o estado do dispositivo (a próxima leitura grava tudo)."""
+        with self._lock:
+            for key in [k for k in self._last if k[0] == device_id]:
+                del self._last[key]
+            for key in [k for k in self._rules if k[0] == device_id]:
+                del self._rules[key]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            seen, stored = self.seen, self.stored
+        return {
+            "enabled": self.enabled,
+            "max_silence_s": self.max_silence,
+            "values_seen": seen,
+            "values_stored": stored,
+            "reduction": round(1.0 - stored / seen, 4) if seen else 0.0,
+        }
@@ -0,0 +1,178 @@
+"""Registro de dispositivos em memória, com o plano de coleta de cada um já compilado.
+
+Na primeira consulta o registro carrega todos os dispositivos uma vez e compila
+cada um num `PollPlan`: config validado pelo schema do tipo (`schemas.DEVICE_CONFIG_SCHEMAS`),
+intervalo de leitura e o alvo do poller (`TCPDeviceTarget`, `RTUDeviceTarget`, ...)
+montado pelo builder registrado para o tipo. Daí em diante os ciclos só leem o
+registro; `crud.create_device/update_device/delete_device` marcam o dispositivo
+como alterado e a próxima consulta recarrega só os alterados (`WHERE id IN (...)`).
+
+Configs inválidos já gravados no banco (anteriores à validação no cadastro) são
+registrados uma vez no log de auditoria (`DEVICE_CONFIG_INVALID`) e ficam fora
+da agenda até serem corrigidos, em vez de falhar a cada ciclo.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.db import SessionLocal
+from .. import crud, models, schemas
+from .scheduler import ScheduledDevice
+
+
+logger = logging.getLogger("pieng.audit")
+
+
+@dataclass(frozen=True)
+class PollPlan:
+    device_id: int
+    client_id: int
+    name: str
+    device_type: str
+    active: bool
+    interval: float
+    config: dict  # config validado, com os padrões do schema preenchidos
+    target: Any  # alvo do poller do tipo
+
+
+Builder = Callable[[models.Device, dict], Any]
+
+
+class DeviceRegistry:
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, resync_seconds: float = 0.0):
+        """
+        Args:
+            session_factory: Fábrica de sessões do banco
+            resync_seconds: Recarga completa periódica (0 = só na primeira consulta), para
+                alterações feitas fora do `crud` (outro processo, SQL direto)
+        """
+        self.session_factory = session_factory
+        self.resync_seconds = resync_seconds
+        self._builders: dict[str, Builder] = {}
+        self._plans: dict[int, PollPlan] = {}
+        self._by_type: dict[str, dict[int, PollPlan]] = {}  # só os ativos
+        self._invalid: dict[int, tuple[str, str]] = {}  # device_id -> (device_type, erro)
+        self._dirty: set[int] = set()
+        self._loaded_at: float | None = None
+        self._lock = threading.RLock()
+        self.full_loads = 0
+        self.compiled = 0
+
+    def register_builder(self, device_type: str, builder: Builder):
+        """Define como montar o alvo do poller para `device_type` (recebe o Device e o config validado)."""
+        with self._lock:
+            self._builders[device_type] = builder
+            self._loaded_at = None  # planos existentes não têm alvo para o tipo novo
+
+    def invalidate(self, device_id: int | None = None):
+        """Marca um dispositivo como alterado (None: recarrega tudo na próxima consulta)."""
+        with self._lock:
+            if device_id is None:
+                self._loaded_at = None
+            else:
+                self._dirty.add(device_id)
+
+    def _compile(self, device: models.Device) -> PollPlan:
+        validated = schemas.validate_device_config(device.device_type, device.config)
+        config = validated.model_dump(exclude_none=True) if validated is not None else dict(device.config or {})
+        builder = self._builders.get(device.device_type)
+        target = builder(device, config) if builder is not None else None
+        interval = config.get("poll_interval") or settings.poll_interval_default
+        self.compiled += 1
+        return PollPlan(
+            device_id=device.id,
+            client_id=device.client_id,
+            name=device.name,
+            device_type=device.device_type,
+            active=bool(device.active),
+            interval=max(0.1, float(interval)),
+            config=config,
+            target=target,
+        )
+
+    def _apply(self, device_id: int, device: models.Device | None):
+        old = self._plans.pop(device_id, None)
+        if old is not None:
+            self._by_type.get(old.device_type, {}).pop(device_id, None)
+        self._invalid.pop(device_id, None)
+        if device is None:
+            return
+        try:
+            plan = self._plans[device_id] = self._compile(device)
+            if plan.active:
+                self._by_type.setdefault(plan.device_type, {})[device_id] = plan
+        except (ValueError, TypeError, KeyError) as e:
+            if device.active:
+                self._invalid[device_id] = (device.device_type, str(e))
+                logger.error(f"DEVICE_CONFIG_INVALID | device_id={device_id} | type={device.device_type} | error={e}")
+
+    def _refresh(self):
+        now = time.monotonic()
+        full = self._loaded_at is None or (self.resync_seconds > 0 and now - self._loaded_at >= self.resync_seconds)
+        if not full and not self._dirty:
+            return
+        db = self.session_factory()
+        try:
+            if full:
+                devices = crud.list_devices(db)
+                self._plans.clear()
+                self._by_type.clear()
+                self._invalid.clear()
+                self._dirty.clear()
+                for d in devices:
+                    self._apply(d.id, d)
+                self._loaded_at = now
+                self.full_loads += 1
+            else:
+                ids = set(self._dirty)
+                self._dirty.clear()
+                found = {d.id: d for d in db.query(models.Device).filter(models.Device.id.in_(ids))}
+                for device_id in ids:
+                    self._apply(device_id, found.get(device_id))
+        finally:
+            db.close()
+
+    def plans(self, device_type: str, device_ids: Iterable[int] | None = None) -> list[PollPlan]:
+        """Planos ativos e válidos do tipo (opcionalmente só os de `device_ids`)."""
+        with self._lock:
+            self._refresh()
+            of_type = self._by_type.get(device_type, {})
+            if device_ids is None:
+                return list(of_type.values())
+            return [of_type[i] for i in set(device_ids) if i in of_type]
+
+    def schedulable(self, device_types: Iterable[str]) -> list[ScheduledDevice]:
+        """Dispositivos ativos e válidos dos tipos com poller, com seus intervalos."""
+        kinds = set(device_types)
+        with self._lock:
+            self._refresh()
+            return [
+                ScheduledDevice(device_id=p.device_id, kind=p.device_type, interval=p.interval)
+                for kind in kinds
+                for p in self._by_type.get(kind, {}).values()
+            ]
+
+    def get(self, device_id: int) -> PollPlan | None:
+        with self._lock:
+            self._refresh()
+            return self._plans.get(device_id)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "devices": len(self._plans),
+                "active_by_type": {kind: len(plans) for kind, plans in self._by_type.items()},
+                "invalid": {i: err for i, (_, err) in self._invalid.items()},
+                "pending_changes": len(self._dirty),
+                "full_loads": self.full_loads,
+                "compiled": self.compiled,
+            }
+
+
+registry = DeviceRegistry(resync_seconds=settings.device_registry_resync)
+crud.on_device_change(registry.invalidate)
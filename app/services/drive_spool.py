@@ -0,0 +1,302 @@
+"""Spool local das medições enviadas ao Google Drive, com envio em lotes em segundo plano.
+
+Gravar no Drive medição a medição custava listar a pasta, baixar o CSV do dia inteiro,
+acrescentar uma linha e subir tudo de novo: o dia ficava quadrático em bytes enviados.
+Aqui `append` só escreve uma linha CSV num arquivo local aberto em modo de acréscimo
+(um por dia da medição). Uma thread de envio:
+
+- fecha o segmento ao juntar `segment_rows` linhas ou após `segment_age` segundos
+  (`*.csv.part` -> `*.csv`);
+- comprime cada segmento fechado com gzip e sobe como um arquivo novo
+  `measurements_AAAA-MM-DD_<criação>_<token>.csv.gz` por upload retomável, guardando
+  o ID do arquivo no cache do conector; só então apaga o arquivo local;
+- com erro no Drive, mantém os arquivos e tenta de novo com recuo exponencial.
+
+O segmento enviado é reivindicado renomeando-o para `*.csv.up` (rename é atômico),
+então vários processos podem compartilhar o diretório. Arquivos `.part`/`.up` largados
+por um processo que morreu voltam à fila depois de `stale_after` segundos sem mudar; o
+envio é idempotente pelo nome, o que cobre um upload concluído mas não apagado localmente.
+Um `.part` vivo é fechado no máximo `segment_age` mais um ciclo da thread (com recuo)
+depois da última linha, então `stale_after` precisa ser maior que isso: senão o `.part`
+aberto de outro processo seria renomeado por baixo dele.
+
+As leituras (`GoogleDriveStorage.day_files`) juntam o CSV diário antigo e os segmentos.
+Cada `append` já chega ao arquivo (flush a cada chamada): um processo que cai não perde
+o que foi aceito, só atrasa o envio.
+"""
+from __future__ import annotations
+import csv
+import gzip
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from ..core.config import settings
+
+
+logger = logging.getLogger("pieng.audit")
+
+HEADER = ("device_id", "metric", "value", "timestamp")  # mesmas colunas do CSV diário antigo
+MAX_BACKOFF = 600.0  # ciclo máximo da thread de envio com erro no Drive (s)
+
+
+class _Segment:
+    """Arquivo `.part` aberto de um dia."""
+
+    def __init__(self, root: Path, day: str):
+        self.created = time.time()
+        stamp = datetime.utcfromtimestamp(self.created).strftime("%Y%m%dT%H%M%S")
+        self.name = f"measurements_{day}_{stamp}_{uuid.uuid4().hex[:8]}.csv"
+        self.path = root / f"{self.name}.part"
+        self.file = open(self.path, "a", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file, lineterminator="\n")
+        self.writer.writerow(HEADER)
+        self.rows = 0
+
+
+class DriveSpool:
+    def __init__(
+        self,
+        root: str | Path,
+        segment_rows: int = 50000,
+        segment_age: float = 300.0,
+        upload_interval: float = 30.0,
+        storage_factory: Callable[[], Any] | None = None,
+        stale_after: float | None = None,
+    ):
+        """
+        Args:
+            root: Diretório do spool
+            segment_rows: Linhas por segmento; cheio, fecha e entra na fila de envio
+            segment_age: Fecha o segmento após N s mesmo incompleto
+            upload_interval: Ciclo da thread de envio (s)
+            storage_factory: Cria o `GoogleDriveStorage` usado no envio (um com serviço
+                falso em testes); padrão autentica pelas variáveis de ambiente
+            stale_after: `.part`/`.up` sem mudar há mais que isso voltam à fila (s); precisa
+                passar de `segment_age` mais um ciclo da thread com recuo. Padrão: o dobro disso
+        """
+        live = segment_age + max(upload_interval, MAX_BACKOFF)  # vida máxima de um `.part` sem acréscimo
+        if stale_after is None:
+            stale_after = 2 * live
+        elif stale_after <= live:
+            raise ValueError(f"stale_after ({stale_after} s) precisa passar de segment_age + ciclo de envio ({live} s)")
+        self.root = Path(root)
+        self.segment_rows = segment_rows
+        self.segment_age = segment_age
+        self.upload_interval = upload_interval
+        self.storage_factory = storage_factory
+        self.stale_after = stale_after
+        self._storage = None
+        self._open: dict[str, _Segment] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._retries = 0
+        self._upload_lock = threading.Lock()
+        self.appended = 0
+        self.sealed = 0
+        self.uploaded = 0
+        self.uploaded_rows = 0
+        self.uploaded_bytes = 0
+        self.raw_bytes = 0
+        self.recovered = 0
+        self.errors = 0
+        self.last_error: str | None = None
+        self.last_upload: datetime | None = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="drive-uploader", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """Retoma o envio do que ficou no diretório de uma execução anterior."""
+        if self.root.exists() and any(self.root.glob("measurements_*.csv*")):
+            self._ensure_thread()
+
+    def append(self, device_id: int, metric: str, value: float, timestamp: datetime | None = None):
+        """Acrescenta uma medição ao segmento aberto do dia (sem `timestamp`, o instante atual em UTC)."""
+        self.append_many([(device_id, metric, value, timestamp or datetime.utcnow())])
+
+    def append_many(self, rows: Iterable[tuple]):
+        """Acrescenta `(device_id, metric, value, timestamp)` em ordem; um flush por chamada."""
+        touched: set[str] = set()
+        with self._lock:
+            if not self.root.exists():
+                self.root.mkdir(parents=True, exist_ok=True)
+            for device_id, metric, value, timestamp in rows:
+                day = timestamp.strftime("%Y-%m-%d")
+                seg = self._open.get(day)
+                if seg is None:
+                    seg = self._open[day] = _Segment(self.root, day)
+                seg.writer.writerow((device_id, metric, value, timestamp.isoformat()))
+                seg.rows += 1
+                self.appended += 1
+                touched.add(day)
+                if seg.rows >= self.segment_rows:
+                    self._seal(day)
+                    touched.discard(day)
+            for day in touched:
+                self._open[day].file.flush()
+            self._ensure_thread()
+
+    def _seal(self, day: str):
+        """Fecha o segmento do dia e o coloca na fila de envio (com `_lock`)."""
+        seg = self._open.pop(day)
+        seg.file.close()
+        os.replace(seg.path, self.root / seg.name)
+        self.sealed += 1
+        self._wake.set()
+
+    def seal(self, max_age: float | None = None) -> int:
+        """Fecha os segmentos abertos há mais de `max_age` s (None: todos)."""
+        now = time.time()
+        with self._lock:
+            due = [day for day, seg in self._open.items() if max_age is None or now - seg.created >= max_age]
+            for day in due:
+                self._seal(day)
+        return len(due)
+
+    def _recover(self):
+        """Devolve à fila `.part`/`.up` largados por processos que morreram."""
+        if not self.root.exists():
+            return
+        with self._lock:
+            mine = {seg.path for seg in self._open.values()}
+        cutoff = time.time() - self.stale_after
+        for path in list(self.root.glob("*.part")) + list(self.root.glob("*.up")):
+            try:
+                if path in mine or path.stat().st_mtime > cutoff:
+                    continue
+                os.replace(path, path.with_suffix(""))
+            except FileNotFoundError:
+                continue  # outro processo já recuperou ou enviou
+            self.recovered += 1
+            logger.warning(f"DRIVE_SPOOL_RECOVERED | file={path.name}")
+
+    def _get_storage(self):
+        if self._storage is None or self._storage.service is None:
+            if self.storage_factory is not None:
+                self._storage = self.storage_factory()
+            else:
+                from ..connectors.google_drive import GoogleDriveStorage
+                self._storage = GoogleDriveStorage()
+        return self._storage if self._storage.service is not None else None
+
+    def pending(self) -> list[Path]:
+        """Segmentos fechados aguardando envio, do mais antigo ao mais novo."""
+        if not self.root.exists():
+            return []
+        return sorted(self.root.glob("measurements_*.csv"))
+
+    def upload_pending(self) -> int:
+        """Envia os segmentos fechados; retorna quantos subiram. Para no primeiro erro."""
+        with self._upload_lock:
+            storage = self._get_storage()
+            if storage is None:
+                return 0
+            done = 0
+            for path in self.pending():
+                claimed = path.with_name(path.name + ".up")
+                try:
+                    os.replace(path, claimed)
+                    os.utime(claimed)  # o mtime marca a reivindicação para `_recover` dos outros processos
+                except FileNotFoundError:
+                    continue  # outro processo reivindicou
+                try:
+                    raw = claimed.read_bytes()
+                    payload = gzip.compress(raw, compresslevel=6)
+                    storage.upload_segment(f"{path.name}.gz", payload)
+                except Exception as e:
+                    os.replace(claimed, path)
+                    self.errors += 1
+                    self.last_error = str(e)
+                    logger.error(f"DRIVE_UPLOAD_FAILED | file={path.name} | error={e}")
+                    raise
+                claimed.unlink()
+                done += 1
+                self.uploaded += 1
+                self.uploaded_rows += raw.count(b"\n") - 1
+                self.raw_bytes += len(raw)
+                self.uploaded_bytes += len(payload)
+                self.last_upload = datetime.utcnow()
+                logger.info(f"DRIVE_UPLOAD | file={path.name}.gz | bytes={len(payload)} | raw_bytes={len(raw)}")
+            return done
+
+    def _run(self):
+        while True:
+            delay = self.upload_interval
+            if self._retries:
+                delay = min(MAX_BACKOFF, self.upload_interval * 2 ** self._retries)  # recuo após erro no Drive
+            self._wake.wait(delay)
+            self._wake.clear()
+            stopping = self._stopping
+            try:
+                self.seal(None if stopping else self.segment_age)
+                self._recover()
+                self.upload_pending()
+                self._retries = 0
+            except Exception:
+                self._retries += 1
+            if stopping:
+                return
+
+    def flush(self) -> int:
+        """Fecha os segmentos abertos e envia já tudo o que está pendente (backup manual)."""
+        self.seal()
+        return self.upload_pending()
+
+    def shutdown(self, timeout: float | None = 30.0) -> bool:
+        """Fecha os segmentos abertos, tenta um último envio e encerra a thread.
+
+        O que não subir fica no diretório e vai no próximo início.
+        """
+        self._stopping = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"DRIVE_SPOOL_SHUTDOWN_TIMEOUT | pending={len(self.pending())}")
+                return False
+        self._thread = None
+        self.seal()
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        pending = self.pending()
+        with self._lock:
+            open_rows = sum(seg.rows for seg in self._open.values())
+        return {
+            "dir": str(self.root),
+            "segment_rows": self.segment_rows,
+            "segment_age_s": self.segment_age,
+            "upload_interval_s": self.upload_interval,
+            "open_rows": open_rows,
+            "pending_segments": len(pending),
+            "pending_bytes": sum(p.stat().st_size for p in pending if p.exists()),
+            "appended": self.appended,
+            "sealed": self.sealed,
+            "uploaded": self.uploaded,
+            "uploaded_rows": self.uploaded_rows,
+            "uploaded_bytes": self.uploaded_bytes,
+            "compression_ratio": self.raw_bytes / self.uploaded_bytes if self.uploaded_bytes else None,
+            "recovered": self.recovered,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_upload": self.last_upload.isoformat() if self.last_upload else None,
+        }
+
+
+drive_spool = DriveSpool(
+    settings.drive_spool_dir,
+    segment_rows=settings.drive_segment_rows,
+    segment_age=settings.drive_segment_age,
+    upload_interval=settings.drive_upload_interval,
+)
@@ -0,0 +1,418 @@
+"""Energia por hora, dia e mês a partir dos contadores acumulados dos medidores.
+
+Os medidores gravam contadores que só crescem (`energy_import_kwh`/`energy_export_kwh`
+do SDM630, `energy_wh` do PZEM-004T, `energy_added_kwh` da Tuya...). Aqui eles viram
+deltas por intervalo em `energy_deltas`, então o consumo de um mês é uma leitura pela
+chave primária:
+
+- a energia entre duas leituras é distribuída entre as horas proporcionalmente ao
+  tempo (interpolação linear do contador), inclusive sobre falhas de leitura, que
+  ficam registradas em `gap_s`;
+- contador que volta (zeramento ou troca de medidor) conta a leitura nova como
+  energia desde zero se ela for plausível no intervalo, senão o passo vale zero;
+  um salto para cima acima de ENERGY_MAX_POWER_KW também é tratado como troca de
+  medidor (`resets`);
+- importação e exportação vêm dos registradores separados do SDM630 quando
+  existem; com um contador só, cada passo vai para importação ou exportação pelo
+  sinal da potência (`power_total` ou `power`) em vigor no meio do intervalo.
+
+Como os rollups, a manutenção é incremental: a gravação de leituras de contador
+registra o trecho em `energy_pending` (mesma transação) e `refresh`, agendado no
+agendador de coleta, recalcula as horas afetadas (da leitura anterior ao trecho
+até a seguinte, o que cobre dados atrasados) e, a partir delas, dias e meses.
+
+    python -m app.services.energy rebuild [--device-id N]
+    python -m app.services.energy status
+"""
+from __future__ import annotations
+import argparse
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .. import models
+from ..core.config import settings
+from .partitions import partitions
+from .rollups import HOLD_LIMIT_S, ceil_to, floor_to, hold_limit
+
+
+logger = logging.getLogger("pieng.audit")
+
+REGISTERS = ("energy_import_kwh", "energy_export_kwh")
+# contador único -> escala para kWh, em ordem de preferência
+COUNTERS = (("energy_kwh", 1.0), ("energy_wh", 0.001), ("energy_added_kwh", 1.0), ("energy_total_kwh", 1.0))
+POWER = ("power_total", "power")
+COUNTER_METRICS = frozenset(REGISTERS) | {m for m, _ in COUNTERS}
+PERIODS = ("hour", "day", "month")
+CHUNK = timedelta(days=7)  # recálculo em blocos (backfill de histórico longo)
+_HOUR = 3600
+_EPOCH = pd.Timestamp(0)
+
+
+def _seconds(timestamps) -> np.ndarray:
+    return (pd.DatetimeIndex(timestamps) - _EPOCH).total_seconds().to_numpy()
+
+
+def counter_steps(t: np.ndarray, v: np.ndarray, max_power_kw: float) -> tuple[np.ndarray, np.ndarray]:
+    """Energia (kWh) de cada passo entre leituras consecutivas e onde houve descontinuidade.
+
+    Contador que volta: a leitura nova é a energia desde o zeramento se couber no
+    intervalo à potência máxima; senão (medidor trocado) o passo vale zero. Salto
+    acima da potência máxima: também troca de medidor, passo zero.
+    """
+    d = np.diff(v)
+    plausible = max_power_kw * np.diff(t) / 3600.0
+    backwards = d < 0
+    jump = d > plausible
+    steps = np.where(backwards, np.where(v[1:] <= plausible, v[1:], 0.0), np.where(jump, 0.0, d))
+    return steps, backwards | jump
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+class EnergyEngine:
+    def __init__(self, tz: str = "UTC", max_power_kw: float = 1000.0, gap_s: float = HOLD_LIMIT_S, tariff_kwh: float = 0.65):
+        """
+        Args:
+            tz: Fuso dos dias e meses (as horas são UTC)
+            max_power_kw: Potência acima da qual um salto do contador é troca de medidor
+            gap_s: Intervalo entre leituras acima do qual a energia é contada como interpolada
+                (dispositivos com `max_silence` próprio usam `hold_limit` da sua configuração)
+            tariff_kwh: Tarifa padrão (R$/kWh) para o custo
+        """
+        self.tz = ZoneInfo(tz)
+        self.max_power_kw = max_power_kw
+        self.gap_s = gap_s
+        self.tariff_kwh = tariff_kwh
+        self.refreshes = 0
+        self.buckets_written = 0
+        self.last_refresh: datetime | None = None
+
+    # -- fuso --------------------------------------------------------------------
+
+    def local_date(self, utc: datetime) -> date:
+        return utc.replace(tzinfo=timezone.utc).astimezone(self.tz).date()
+
+    def utc_start(self, day: date) -> datetime:
+        """Início (UTC, sem fuso) do dia local."""
+        return datetime(day.year, day.month, day.day, tzinfo=self.tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _config(self, db: Session, device_id: int) -> dict:
+        return db.execute(select(models.Device.config).where(models.Device.id == device_id)).scalar() or {}
+
+    def tariff(self, db: Session, device_id: int) -> float:
+        return float(self._config(db, device_id).get("tariff_kwh") or self.tariff_kwh)
+
+    # -- gravação ----------------------------------------------------------------
+
+    def mark(self, db: Session, params: list[dict]):
+        """Registra os trechos com leituras de contador novas (na transação de `db`)."""
+        spans: dict[int, list[datetime]] = {}
+        for p in params:
+            if p["metric"] not in COUNTER_METRICS:
+                continue
+            span = spans.get(p["device_id"])
+            if span is None:
+                spans[p["device_id"]] = [p["timestamp"], p["timestamp"]]
+            else:
+                span[0] = min(span[0], p["timestamp"])
+                span[1] = max(span[1], p["timestamp"])
+        if spans:
+            db.execute(insert(models.EnergyPending), [{"device_id": d, "start": a, "end": b} for d, (a, b) in spans.items()])
+
+    def _queue_history(self, db: Session, device_id: int | None = None) -> int:
+        """Marca como pendente todo o histórico de contadores (backfill ou rebuild)."""
+        spans: dict[int, list[datetime]] = {}
+        for t in [models.Measurement.__table__] + partitions.read_tables(db):
+            q = select(t.c.device_id, func.min(t.c.timestamp), func.max(t.c.timestamp)).where(
+                t.c.metric.in_(COUNTER_METRICS)
+            ).group_by(t.c.device_id)
+            if device_id is not None:
+                q = q.where(t.c.device_id == device_id)
+            for d, lo, hi in db.execute(q):
+                span = spans.setdefault(d, [lo, hi])
+                span[0], span[1] = min(span[0], lo), max(span[1], hi)
+        snap = models.MeasurementSnapshot
+        if db.execute(select(models.MetricName.id).where(models.MetricName.name.in_(COUNTER_METRICS)).limit(1)).first():
+            q = select(snap.device_id, func.min(snap.timestamp), func.max(snap.timestamp)).group_by(snap.device_id)
+            if device_id is not None:
+                q = q.where(snap.device_id == device_id)
+            for d, lo, hi in db.execute(q):
+                span = spans.setdefault(d, [lo, hi])
+                span[0], span[1] = min(span[0], lo), max(span[1], hi)
+        if spans:
+            db.execute(insert(models.EnergyPending), [{"device_id": d, "start": a, "end": b} for d, (a, b) in spans.items()])
+        return len(spans)
+
+    def init(self, engine: Engine):
+        """Banco com leituras de contador e sem energias calculadas: enfileira o backfill."""
+        with Session(engine) as db:
+            if db.execute(select(models.EnergyDelta.device_id).limit(1)).first() is not None:
+                return
+            if db.execute(select(models.EnergyPending.id).limit(1)).first() is not None:
+                return
+            devices = self._queue_history(db)
+            db.commit()
+        if devices:
+            logger.info(f"ENERGY_BACKFILL_QUEUED | devices={devices}")
+
+    # -- cálculo -----------------------------------------------------------------
+
+    def _hours(self, db: Session, device_id: int, a: datetime, b: datetime) -> tuple[datetime, datetime, pd.DataFrame] | None:
+        """Energias por hora de todas as horas influenciadas pelas leituras de [a, b]."""
+        from .. import crud  # crud importa este módulo
+
+        probe = crud.measurement_series(db, device_id, list(REGISTERS) + [m for m, _ in COUNTERS], a, b)
+        registers = bool(probe["energy_import_kwh"])
+        if registers:
+            counters = [(m, 1.0) for m in REGISTERS if probe[m]]
+        else:
+            counters = [(m, scale) for m, scale in COUNTERS if probe[m]][:1]
+        if not counters:
+            return None
+        # da leitura anterior a `a` até a seguinte a `b`: são as que mudam de passo
+        lo = min(probe[m][0][0] for m, _ in counters)
+        after = [crud.measurement_after(db, device_id, m, b) for m, _ in counters]
+        hi = max([probe[m][-1][0] for m, _ in counters] + [p[0] for p in after if p])
+        h0, h1 = floor_to(lo, _HOUR), max(ceil_to(hi, _HOUR), floor_to(lo, _HOUR) + timedelta(hours=1))
+
+        series = crud.measurement_series(db, device_id, [m for m, _ in counters] + list(POWER), h0, h1)
+        for m, _ in counters:
+            nxt = crud.measurement_after(db, device_id, m, h1)
+            if nxt:
+                series[m].append(nxt)
+        cfg = self._config(db, device_id)
+        max_power_kw = float(cfg.get("max_power_kw") or self.max_power_kw)
+        gap_s = hold_limit(cfg, self.gap_s)
+        edges = np.arange(_seconds([h0])[0], _seconds([h1])[0] + 1, _HOUR)
+
+        def cumulative(metric: str, scale: float):
+            points = sorted(dict(series[metric]).items())  # um valor por instante
+            t = _seconds([p[0] for p in points])
+            v = np.array([p[1] for p in points], dtype=float) * scale
+            steps, breaks = counter_steps(t, v, max_power_kw)
+            return t, steps, breaks
+
+        t, steps, breaks = cumulative(*counters[0])
+        if registers:
+            imports = steps
+            if len(counters) == 2:
+                export_t, export_steps, export_breaks = cumulative(*counters[1])
+            else:
+                export_t, export_steps, export_breaks = t[:0], steps[:0], breaks[:0]
+        else:
+            # contador único: sinal da potência em vigor no meio de cada passo
+            power = next((series[m] for m in POWER if series[m]), [])
+            mid = (t[:-1] + t[1:]) / 2
+            if power:
+                pt = _seconds([p[0] for p in power])
+                pv = np.array([p[1] for p in power], dtype=float)
+                idx = np.searchsorted(pt, mid, side="right") - 1
+                exporting = (idx >= 0) & (pv[np.clip(idx, 0, None)] < 0)
+            else:
+                exporting = np.zeros(len(mid), dtype=bool)
+            imports = np.where(exporting, 0.0, steps)
+            export_t, export_steps, export_breaks = t, np.where(exporting, steps, 0.0), np.zeros(len(mid), dtype=bool)
+
+        def per_bucket(t: np.ndarray, steps: np.ndarray) -> np.ndarray:
+            if len(t) < 2:
+                return np.zeros(len(edges) - 1)
+            return np.diff(np.interp(edges, t, np.concatenate(([0.0], np.cumsum(steps)))))
+
+        dt = np.diff(t)
+        frame = pd.DataFrame({
+            "bucket": pd.to_datetime(edges[:-1], unit="s"),
+            "import_kwh": per_bucket(t, imports),
+            "export_kwh": per_bucket(export_t, export_steps),
+            "readings": np.diff(np.searchsorted(t, edges, side="left")),
+            "resets": (
+                np.diff(np.searchsorted(t[1:][breaks], edges, side="left"))
+                + np.diff(np.searchsorted(export_t[1:][export_breaks], edges, side="left"))
+            ),
+            "covered_s": per_bucket(t, dt),
+            "gap_s": per_bucket(t, np.where(dt > gap_s, dt, 0.0)),
+        })
+        frame = frame[(frame["covered_s"] > 0) | (frame["readings"] > 0)]
+        return h0, h1, frame
+
+    def _replace(self, db: Session, device_id: int, period: str, lo: datetime, hi: datetime, rows: list[dict]) -> int:
+        E = models.EnergyDelta
+        db.execute(delete(E).where(E.device_id == device_id, E.period == period, E.bucket >= lo, E.bucket < hi))
+        if rows:
+            db.execute(insert(E), [{"device_id": device_id, "period": period, **r} for r in rows])
+        return len(rows)
+
+    def _sum(self, db: Session, device_id: int, period: str, lo: datetime, hi: datetime, key) -> list[dict]:
+        """Soma as linhas de `period` em [lo, hi) agrupadas por `key(bucket)`."""
+        E = models.EnergyDelta
+        totals: dict[datetime, dict] = {}
+        for row in db.execute(select(E).where(
+            E.device_id == device_id, E.period == period, E.bucket >= lo, E.bucket < hi
+        )).scalars():
+            acc = totals.setdefault(key(row.bucket), dict.fromkeys(("import_kwh", "export_kwh", "readings", "resets", "covered_s", "gap_s"), 0))
+            for col in acc:
+                acc[col] += getattr(row, col)
+        return [{"bucket": bucket, **acc} for bucket, acc in sorted(totals.items())]
+
+    def _recompute(self, db: Session, device_id: int, a: datetime, b: datetime) -> int:
+        hours = self._hours(db, device_id, a, b)
+        if hours is None:
+            return 0
+        h0, h1, frame = hours
+        rows = [
+            {**r, "bucket": r["bucket"].to_pydatetime(), "readings": int(r["readings"]), "resets": int(r["resets"])}
+            for r in frame.to_dict("records")
+        ]
+        written = self._replace(db, device_id, "hour", h0, h1, rows)
+
+        first_day, last_day = self.local_date(h0), self.local_date(h1 - timedelta(hours=1))
+        day_lo, day_hi = datetime.combine(first_day, datetime.min.time()), datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+        days = self._sum(
+            db, device_id, "hour", self.utc_start(first_day), self.utc_start(last_day + timedelta(days=1)),
+            lambda hour: datetime.combine(self.local_date(hour), datetime.min.time()),
+        )
+        written += self._replace(db, device_id, "day", day_lo, day_hi, days)
+
+        month_lo = datetime.combine(_month_start(first_day), datetime.min.time())
+        month_hi = datetime.combine(_next_month(last_day), datetime.min.time())
+        months = self._sum(db, device_id, "day", month_lo, month_hi, lambda day: day.replace(day=1))
+        written += self._replace(db, device_id, "month", month_lo, month_hi, months)
+        return written
+
+    def refresh(self, engine: Engine, time_budget: float | None = 5.0, batch: int = 5000, owns: Callable[[int], bool] | None = None) -> int:
+        """Processa os trechos pendentes; retorna os intervalos gravados (o que sobrar do orçamento fica pendente).
+
+        Com `owns`, só os dispositivos deste processo (workers com leases): cada trecho é
+        processado por um worker só.
+        """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        written = 0
+        with Session(engine) as db:
+            q = select(models.EnergyPending).order_by(models.EnergyPending.id).limit(batch)
+            if owns is not None:
+                mine = [d for d in db.execute(select(models.EnergyPending.device_id).distinct()).scalars() if owns(d)]
+                if not mine:
+                    return 0
+                q = q.where(models.EnergyPending.device_id.in_(mine))
+            pending = db.execute(q).scalars().all()
+            if not pending:
+                return 0
+            spans: dict[int, list[tuple[datetime, datetime]]] = defaultdict(list)
+            for p in pending:
+                spans[p.device_id].append((p.start, p.end))
+            pending_ids = [p.id for p in pending]
+            db.rollback()
+
+            left: list[dict] = []
+            for device_id, device_spans in spans.items():
+                for a, b in sorted(device_spans):
+                    while a <= b and (deadline is None or time.monotonic() < deadline):
+                        c = min(a + CHUNK, b)
+                        written += self._recompute(db, device_id, a, c)
+                        db.commit()
+                        if c == b:
+                            a = b + timedelta(microseconds=1)
+                        else:
+                            a = c
+                    if a <= b:
+                        left.append({"device_id": device_id, "start": a, "end": b})
+
+            db.execute(delete(models.EnergyPending).where(models.EnergyPending.id.in_(pending_ids)))
+            if left:
+                db.execute(insert(models.EnergyPending), left)
+            db.commit()
+        self.refreshes += 1
+        self.buckets_written += written
+        self.last_refresh = datetime.utcnow()
+        if left:
+            logger.info(f"ENERGY_REFRESH_PARTIAL | buckets={written} | pending={len(left)}")
+        return written
+
+    def rebuild(self, engine: Engine, device_id: int | None = None) -> int:
+        """Recalcula as energias de todo o histórico de contadores (de um dispositivo ou de todos)."""
+        with Session(engine) as db:
+            E = models.EnergyDelta
+            db.execute(delete(E).where(E.device_id == device_id) if device_id is not None else delete(E))
+            self._queue_history(db, device_id)
+            db.commit()
+        written = 0
+        while True:
+            written += self.refresh(engine, time_budget=None)
+            with Session(engine) as db:
+                if db.execute(select(models.EnergyPending.id).limit(1)).first() is None:
+                    break
+        logger.info(f"ENERGY_REBUILT | device_id={device_id} | buckets={written}")
+        return written
+
+    def schedule(self, scheduler, engine: Engine, seconds: float, owns: Callable[[int], bool] | None = None):
+        """Agenda `refresh` no `PollingScheduler`; `owns` restringe aos dispositivos deste processo (leases do worker)."""
+        scheduler.add_job(lambda: self.refresh(engine, owns=owns), seconds=seconds, id="energy_refresh", overlap="skip")
+
+    # -- leitura -----------------------------------------------------------------
+
+    def deltas(self, db: Session, device_id: int, period: str, start: datetime | None = None, end: datetime | None = None) -> list[models.EnergyDelta]:
+        """Energias de `period` com início em [start, end) (horas em UTC; dias e meses em data local)."""
+        E = models.EnergyDelta
+        q = select(E).where(E.device_id == device_id, E.period == period)
+        if start is not None:
+            q = q.where(E.bucket >= start)
+        if end is not None:
+            q = q.where(E.bucket < end)
+        return db.execute(q.order_by(E.bucket)).scalars().all()
+
+    def month(self, db: Session, device_id: int, month: date | None = None) -> models.EnergyDelta | None:
+        """Energia de um mês (padrão: o mês local corrente) — uma leitura pela chave primária."""
+        month = _month_start(month or self.local_date(datetime.utcnow()))
+        return db.get(models.EnergyDelta, (device_id, "month", datetime.combine(month, datetime.min.time())))
+
+    def stats(self, engine: Engine) -> dict:
+        E, P = models.EnergyDelta, models.EnergyPending
+        with Session(engine) as db:
+            rows = dict(db.execute(select(E.period, func.count()).group_by(E.period)).all())
+            pending, oldest = db.execute(select(func.count(), func.min(P.start))).one()
+        return {
+            "timezone": str(self.tz),
+            "rows": {p: rows.get(p, 0) for p in PERIODS},
+            "pending": pending,
+            "oldest_pending": oldest.isoformat() if oldest else None,
+            "refreshes": self.refreshes,
+            "buckets_written": self.buckets_written,
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+        }
+
+
+energy = EnergyEngine(settings.energy_timezone, settings.energy_max_power_kw, tariff_kwh=settings.energy_tariff_kwh)
+
+
+def main():
+    from ..core.db import engine, init_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "refresh", "status"])
+    parser.add_argument("--device-id", type=int, default=None, help="só este dispositivo (rebuild)")
+    args = parser.parse_args()
+    init_db()
+    if args.command == "rebuild":
+        print(f"{energy.rebuild(engine, args.device_id)} intervalos recalculados")
+    elif args.command == "refresh":
+        print(f"{energy.refresh(engine, time_budget=None)} intervalos recalculados")
+    else:
+        for key, value in energy.stats(engine).items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,5 +14,10 @@ class Forwarder:
             r = await client.post(f"{self.base_url}/api/ingest", json=payload)
             return {"forwarded": r.status_code < 300, "status": r.status_code}
 
-
-
+    async def forward_batch(self, items: list[dict]) -> dict:
+        """Encaminha um lote de medições ao `POST /api/ingest/batch` do slave (array JSON)."""
+        if not self.base_url:
+            return {"forwarded": False, "reason": "no_base_url"}
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.post(f"{self.base_url}/api/ingest/batch", json=items)
+            return {"forwarded": r.status_code < 300, "status": r.status_code}
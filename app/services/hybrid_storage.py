@@ -1,18 +1,25 @@
 # app/services/hybrid_storage.py
 import os
-import io
-import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from app.core.db import SessionLocal
 from app.models import Measurement
 from app.connectors.google_drive import GoogleDriveStorage
+from app.services.drive_spool import DriveSpool, drive_spool
+
+BACKUP_CHUNK = 5000  # linhas lidas do SQLite e acrescentadas ao spool por vez no backup
 
 class HybridStorage:
-    def __init__(self):
+    def __init__(self, gdrive: Optional[GoogleDriveStorage] = None, spool: Optional[DriveSpool] = None):
+        """
+        Args:
+            gdrive: Conector do Drive (ex: com serviço falso em testes); padrão autentica pelo ambiente
+            spool: Spool local de envio ao Drive; padrão o `drive_spool` do processo
+        """
         self.db = SessionLocal()
-        self.gdrive = GoogleDriveStorage()
-        self.use_gdrive = self._check_gdrive_config()
+        self.gdrive = gdrive or GoogleDriveStorage()
+        self.spool = spool or drive_spool
+        self.use_gdrive = self.gdrive.service is not None if gdrive else self._check_gdrive_config()
     
     def _check_gdrive_config(self) -> bool:
         """Verificar se Google Drive está configurado"""
@@ -49,13 +56,13 @@ class HybridStorage:
             print(f"❌ Erro ao salvar no SQLite: {e}")
             self.db.rollback()
         
-        # 2. Salvar no Google Drive (se configurado)
+        # 2. Google Drive (se configurado): só uma linha no spool local; o envio é em lotes
         if self.use_gdrive:
             try:
-                if self.gdrive.save_measurement(device_id, metric, value, timestamp):
-                    success_count += 1
+                self.spool.append(device_id, metric, value, timestamp)
+                success_count += 1
             except Exception as e:
-                print(f"❌ Erro ao salvar no Google Drive: {e}")
+                print(f"❌ Erro ao enfileirar para o Google Drive: {e}")
         
         return success_count > 0
     
@@ -106,20 +113,25 @@ class HybridStorage:
             return False
         
         try:
-            # Buscar todas as medições do SQLite
-            measurements = self.db.query(Measurement).all()
+            # Medições do SQLite em blocos para o spool; os segmentos sobem no flush
+            query = self.db.query(
+                Measurement.device_id, Measurement.metric, Measurement.value, Measurement.timestamp
+            ).filter(Measurement.value.isnot(None)).yield_per(BACKUP_CHUNK)
             
             success_count = 0
-            for measurement in measurements:
-                if self.gdrive.save_measurement(
-                    measurement.device_id,
-                    measurement.metric,
-                    measurement.value,
-                    measurement.timestamp
-                ):
-                    success_count += 1
+            chunk = []
+            for row in query:
+                chunk.append(tuple(row))
+                if len(chunk) >= BACKUP_CHUNK:
+                    self.spool.append_many(chunk)
+                    success_count += len(chunk)
+                    chunk = []
+            if chunk:
+                self.spool.append_many(chunk)
+                success_count += len(chunk)
+            self.spool.flush()
             
-            print(f"✅ Backup realizado: {success_count}/{len(measurements)} medições")
+            print(f"✅ Backup realizado: {success_count} medições")
             return success_count > 0
             
         except Exception as e:
@@ -137,12 +149,8 @@ class HybridStorage:
             all_measurements = []
             for day in range(30):
                 date = datetime.now() - timedelta(days=day)
-                filename = f"measurements_{date.strftime('%Y-%m-%d')}.csv"
-                
-                file_id = self.gdrive._get_file_id(filename)
-                if file_id:
-                    content = self.gdrive.service.files().get_media(fileId=file_id).execute()
-                    df = pd.read_csv(io.BytesIO(content))
+                for file in self.gdrive.day_files(date):
+                    df = self.gdrive.read_file(file)
                     all_measurements.extend(df.to_dict('records'))
             
             # Salvar no SQLite
@@ -174,7 +182,8 @@ class HybridStorage:
             "sqlite": "connected",
             "google_drive": "not_configured",
             "hybrid_mode": False,
-            "last_backup": None
+            "last_backup": None,
+            "drive_spool": self.spool.stats()
         }
         
         # Verificar SQLite
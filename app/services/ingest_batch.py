@@ -0,0 +1,150 @@
+"""Validação vetorizada de lotes de medições (`POST /ingest/batch`).
+
+Aceita objetos em dois formatos, misturáveis num mesmo lote:
+
+    {"device_id": 1, "metric": "power_total", "value": 1520.5, "timestamp": "2024-05-01T12:00:00Z"}
+    {"device_id": 1, "metric": "voltage_l1", "timestamps": [...], "values": [...]}   # colunar
+
+Os objetos são achatados em colunas e validados de uma vez com pandas/NumPy
+(números finitos, timestamps ISO 8601 ou epoch em segundos, dispositivo
+existente numa única consulta), em vez de um `MeasurementCreate` por linha.
+Linhas inválidas são recusadas individualmente; as válidas seguem para a fila.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterable
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from .. import models
+
+
+MAX_METRIC_LENGTH = 100  # models.Measurement.metric
+MAX_ERRORS_REPORTED = 50
+
+
+@dataclass
+class BatchResult:
+    rows: list[tuple] = field(default_factory=list)  # (device_id, metric, timestamp, value, extra)
+    received: int = 0
+    rejected: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def reject(self, index: int, error: str, count: int = 1):
+        self.rejected += count
+        if len(self.errors) < MAX_ERRORS_REPORTED:
+            self.errors.append({"index": index, "error": error})
+
+    def merge(self, other: BatchResult):
+        self.rows.extend(other.rows)
+        self.received += other.received
+        self.rejected += other.rejected
+        self.errors.extend(other.errors[:MAX_ERRORS_REPORTED - len(self.errors)])
+
+
+def _to_timestamps(raw: list) -> np.ndarray:
+    """ISO 8601 (com ou sem fuso) ou epoch em segundos -> datetime64 UTC ingênuo; inválidos viram NaT."""
+    series = pd.Series(raw, dtype=object)
+    out = pd.Series(pd.NaT, index=series.index, dtype="datetime64[us]")
+    is_num = series.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+    if is_num.any():
+        out[is_num] = pd.to_datetime(series[is_num].astype("float64"), unit="s", errors="coerce").astype("datetime64[us]")
+    is_str = series.map(lambda v: isinstance(v, str))
+    if is_str.any():
+        parsed = pd.to_datetime(series[is_str], utc=True, errors="coerce", format="ISO8601")
+        out[is_str] = parsed.dt.tz_localize(None).astype("datetime64[us]")
+    return out.to_numpy(copy=True)
+
+
+def validate_batch(db: Session, items: Iterable[Any], start: int = 0) -> BatchResult:
+    """Achata e valida `items`; `start` desloca os índices informados nos erros (NDJSON em partes)."""
+    result = BatchResult()
+    device_col: list = []
+    metric_col: list = []
+    ts_col: list = []
+    value_col: list = []
+    extra_col: list = []
+    index_col: list[int] = []
+
+    for i, item in enumerate(items, start):
+        if not isinstance(item, dict):
+            result.received += 1
+            result.reject(i, "esperado um objeto JSON")
+            continue
+        if "values" in item:
+            values = item.get("values")
+            timestamps = item.get("timestamps")
+            if not isinstance(values, list):
+                result.received += 1
+                result.reject(i, "values deve ser uma lista")
+                continue
+            result.received += len(values)
+            if timestamps is None:
+                timestamps = [None] * len(values)
+            if not isinstance(timestamps, list) or len(timestamps) != len(values):
+                result.reject(i, "timestamps e values com tamanhos diferentes", len(values))
+                continue
+            n = len(values)
+            device_col.extend([item.get("device_id")] * n)
+            metric_col.extend([item.get("metric")] * n)
+            ts_col.extend(timestamps)
+            value_col.extend(values)
+            extra_col.extend([item.get("extra")] * n)
+            index_col.extend([i] * n)
+        else:
+            result.received += 1
+            device_col.append(item.get("device_id"))
+            metric_col.append(item.get("metric"))
+            ts_col.append(item.get("timestamp"))
+            value_col.append(item.get("value"))
+            extra_col.append(item.get("extra"))
+            index_col.append(i)
+
+    if not value_col:
+        return result
+
+    def numeric(col: list) -> np.ndarray:
+        # bool é int em Python, mas não é medição
+        return pd.to_numeric(
+            pd.Series([None if isinstance(v, bool) else v for v in col], dtype=object), errors="coerce"
+        ).to_numpy(dtype="float64")
+
+    values = numeric(value_col)
+    devices = numeric(device_col)
+    timestamps = _to_timestamps(ts_col)
+    missing_ts = np.fromiter((t is None for t in ts_col), dtype=bool, count=len(ts_col))
+    timestamps[missing_ts] = np.datetime64(datetime.utcnow(), "us")
+    metrics = pd.Series(metric_col, dtype=object)
+    extra_ok = np.fromiter((e is None or isinstance(e, dict) for e in extra_col), dtype=bool, count=len(extra_col))
+
+    checks = [
+        (~np.isfinite(devices) | (devices != np.floor(devices)), "device_id inválido"),
+        (~metrics.map(lambda m: isinstance(m, str) and 0 < len(m) <= MAX_METRIC_LENGTH).to_numpy(dtype=bool), "metric inválida"),
+        (~np.isfinite(values), "value deve ser um número finito"),
+        (np.isnat(timestamps), "timestamp inválido"),
+        (~extra_ok, "extra deve ser um objeto"),
+    ]
+    bad = np.zeros(len(values), dtype=bool)
+    for mask, error in checks:
+        new = mask & ~bad
+        for j in np.flatnonzero(new):
+            result.reject(index_col[j], error)
+        bad |= new
+
+    ok = np.flatnonzero(~bad)
+    if len(ok):
+        wanted = {int(d) for d in np.unique(devices[ok])}
+        known = {d for (d,) in db.query(models.Device.id).filter(models.Device.id.in_(wanted))}
+        unknown = np.isin(devices, list(wanted - known)) & ~bad
+        for j in np.flatnonzero(unknown):
+            result.reject(index_col[j], "dispositivo inexistente")
+        ok = np.flatnonzero(~(bad | unknown))
+
+    ts_list = timestamps[ok].astype("datetime64[us]").tolist()  # -> datetime
+    result.rows = [
+        (int(devices[j]), metric_col[j], ts, float(values[j]), extra_col[j])
+        for j, ts in zip(ok.tolist(), ts_list)
+    ]
+    result.errors.sort(key=lambda e: e["index"])
+    return result
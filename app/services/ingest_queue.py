@@ -0,0 +1,252 @@
+"""Fila de ingestão em memória com gravação em grupo (write-behind).
+
+`POST /ingest` só valida e enfileira a medição: a resposta (202) sai assim que
+ela foi aceita, sem esperar o banco. Uma thread de gravação junta o que chegou
+e grava em lotes — um INSERT em lote, a avaliação de alarmes do lote e um único
+commit — quando acumula `batch_size` linhas ou quando a mais antiga espera
+`flush_interval` segundos, o que vier primeiro.
+
+A fila é limitada (`max_size`): cheia, `submit` recusa e a rota responde 429
+com `Retry-After`, empurrando a pressão de volta para o cliente em vez de
+crescer a memória sem limite. No desligamento `shutdown` grava o que resta.
+
+Um lote com erro volta para a frente da fila e é tentado de novo (`max_retries`).
+Esgotadas as tentativas, ele é dividido ao meio e cada metade é gravada na sua
+própria transação, recursivamente, até isolar as linhas que falham sozinhas: só
+elas são descartadas (e contadas em `dropped`), não o lote inteiro.
+
+Aceitar antes de gravar tem um custo: o que estiver na fila se perde se o
+processo morrer sem desligamento limpo (no máximo `max_size` linhas ou
+`flush_interval` segundos de dados).
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Sequence
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.db import SessionLocal
+from .. import crud, models
+from .alarms import evaluate_alarm_rules
+
+
+logger = logging.getLogger("pieng.audit")
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_retries: int = 3,
+    ):
+        """
+        Args:
+            max_size: Linhas aceitas e ainda não gravadas; acima disso `submit` recusa
+            batch_size: Linhas por transação
+            flush_interval: Espera máxima (s) de uma linha na fila antes de gravar
+            max_retries: Tentativas de um lote com erro antes de dividi-lo e descartar só
+                as linhas que falham sozinhas
+        """
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.max_retries = max_retries
+        self._rows: deque[tuple] = deque()
+        self._oldest: float | None = None  # monotonic da linha mais antiga na fila
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._inflight = 0
+        self._retries = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.dropped = 0
+        self.alarm_events = 0
+        self.batches = 0
+        self.errors = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows: Sequence[tuple]) -> bool:
+        """Enfileira linhas `(device_id, metric, timestamp, value[, extra])`; tudo ou nada.
+
+        Retorna False (nada enfileirado) se não houver espaço para todas.
+        """
+        if not rows:
+            return True
+        with self._cond:
+            if len(self._rows) + self._inflight + len(rows) > self.max_size:
+                self.rejected += len(rows)
+                return False
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self.accepted += len(rows)
+            self._ensure_thread()
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    @property
+    def depth(self) -> int:
+        """Linhas aceitas ainda não gravadas (na fila ou no lote em gravação)."""
+        with self._cond:
+            return len(self._rows) + self._inflight
+
+    def _take(self) -> list[tuple] | None:
+        """Espera um lote cheio, o prazo da linha mais antiga ou o desligamento."""
+        with self._cond:
+            while True:
+                if self._rows:
+                    due = self._oldest + self.flush_interval
+                    if self._retries:
+                        due += min(5.0, 0.5 * 2 ** self._retries)  # recuo após erro no banco
+                    if self._stopping or len(self._rows) >= self.batch_size or time.monotonic() >= due:
+                        n = min(self.batch_size, len(self._rows))
+                        batch = [self._rows.popleft() for _ in range(n)]
+                        self._inflight = n
+                        self._oldest = time.monotonic() if self._rows else None
+                        return batch
+                    self._cond.wait(max(0.0, due - time.monotonic()))
+                elif self._stopping:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _write(self, batch: list[tuple]) -> tuple[int, int, int]:
+        """Grava o lote e avalia os alarmes numa transação; retorna (gravadas, descartadas, eventos)."""
+        db = self.session_factory()
+        try:
+            device_ids = {r[0] for r in batch}
+            device_clients = dict(
+                db.query(models.Device.id, models.Device.client_id).filter(models.Device.id.in_(device_ids))
+            )
+            rows = [r for r in batch if r[0] in device_clients]
+            unknown = len(batch) - len(rows)
+            if unknown:
+                logger.warning(
+                    f"INGEST_UNKNOWN_DEVICE | rows={unknown} | device_ids={sorted(device_ids - device_clients.keys())}"
+                )
+            written = crud.create_measurements_bulk(db, rows, commit=False)
+            events = evaluate_alarm_rules(db, rows, device_clients)
+            db.commit()
+            return written, unknown, events
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _salvage(self, batch: list[tuple], error: Exception) -> tuple[int, int, int, int]:
+        """Grava as metades de um lote que falhou, cada uma na sua transação, até isolar as linhas ruins.
+
+        Retorna (gravadas, desconhecidas, eventos, com erro); só as linhas que falham
+        sozinhas ficam de fora.
+        """
+        if len(batch) == 1:
+            device_id, metric, timestamp = batch[0][:3]
+            logger.error(f"INGEST_DROPPED | device_id={device_id} | metric={metric} | timestamp={timestamp} | error={error}")
+            return 0, 0, 0, 1
+        totals = [0, 0, 0, 0]
+        mid = len(batch) // 2
+        for half in (batch[:mid], batch[mid:]):
+            try:
+                result = (*self._write(half), 0)
+            except Exception as e:
+                result = self._salvage(half, e)
+            totals = [a + b for a, b in zip(totals, result)]
+        return tuple(totals)
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            failed = 0
+            try:
+                written, unknown, events = self._write(batch)
+            except Exception as e:
+                self.errors += 1
+                with self._cond:
+                    self._retries += 1
+                    if self._retries <= self.max_retries and not self._stopping:
+                        # volta para a frente da fila, na ordem original
+                        self._inflight = 0
+                        self._rows.extendleft(reversed(batch))
+                        self._oldest = time.monotonic()
+                        logger.warning(f"INGEST_RETRY | rows={len(batch)} | attempt={self._retries} | error={e}")
+                        continue
+                # tentativas esgotadas: o lote continua em `_inflight` enquanto é dividido
+                written, unknown, events, failed = self._salvage(batch, e)
+                logger.warning(f"INGEST_SALVAGED | rows={len(batch)} | written={written} | dropped={failed} | error={e}")
+            with self._cond:
+                self._inflight = 0
+                self._retries = 0
+                self.written += written
+                self.dropped += unknown + failed
+                self.alarm_events += events
+                self.batches += 1
+                self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Grava já o que está na fila e espera terminar; False se o prazo acabar antes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._rows:
+                self._oldest = time.monotonic() - self.flush_interval  # vence o prazo agora
+                self._ensure_thread()
+                self._cond.notify_all()
+            while self._rows or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float | None = 30.0) -> bool:
+        """Grava o que resta e encerra a thread de gravação."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.error(f"INGEST_SHUTDOWN_TIMEOUT | pending={self.depth}")
+                return False
+        self._thread = None
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "depth": len(self._rows) + self._inflight,
+                "max_size": self.max_size,
+                "batch_size": self.batch_size,
+                "flush_interval_s": self.flush_interval,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "written": self.written,
+                "dropped": self.dropped,
+                "alarm_events": self.alarm_events,
+                "batches": self.batches,
+                "errors": self.errors,
+            }
+
+
+ingest_queue = IngestQueue(
+    max_size=settings.ingest_queue_max,
+    batch_size=settings.ingest_batch_size,
+    flush_interval=settings.ingest_flush_interval,
+)
@@ -0,0 +1,254 @@
+"""Distribuição de dispositivos entre workers de coleta por leases no banco.
+
+Cada worker registra um heartbeat em `poller_workers` e detém os dispositivos
+que aparecem em seu nome em `device_leases` até `expires_at`. A cada rodada de
+`rebalance` o worker:
+
+1. renova o heartbeat e os próprios leases (`expires_at = agora + ttl`);
+2. calcula, por rendezvous hashing sobre os workers vivos, quais dispositivos
+   são seus — todos os workers chegam à mesma partição sem coordenação, e a
+   entrada ou saída de um worker só move ~1/N dos dispositivos;
+3. libera os leases que não são mais seus e reivindica os seus que estão livres,
+   expirados ou com dono morto (UPDATE condicional: só um worker vence).
+
+Um worker que morre para de renovar; depois de `ttl` segundos seus leases
+expiram e os demais redistribuem os dispositivos na rodada seguinte. Um
+dispositivo ainda preso ao lease vigente de outro worker só troca de dono
+quando este o libera, então nunca há dois workers lendo o mesmo medidor.
+
+Junto com o heartbeat o worker grava em `poller_worker_status` o seu estado em
+memória (breakers, agenda, conexões, telemetria; ver `pollers.worker_status`): a
+API, que não coleta, serve esses dados por `worker_reports`.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+from ..core.db import SessionLocal, insert_ignore
+from .. import models
+
+
+logger = logging.getLogger("pieng.audit")
+
+
+def _score(worker_id: str, device_id: int) -> int:
+    digest = hashlib.blake2b(f"{worker_id}:{device_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def rendezvous_owner(device_id: int, workers: Iterable[str]) -> str | None:
+    """Worker de maior peso para o dispositivo (highest random weight)."""
+    return max(workers, key=lambda w: _score(w, device_id), default=None)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeaseManager:
+    def __init__(
+        self,
+        worker_id: str | None = None,
+        ttl: float = 30.0,
+        session_factory: Callable[[], Session] = SessionLocal,
+        status: Callable[[], dict] | None = None,
+    ):
+        """
+        Args:
+            worker_id: Identificador único do worker (padrão: host-pid-aleatório)
+            ttl: Validade (s) do heartbeat e dos leases; o rebalanceamento deve rodar bem antes disso
+            status: Estado em memória do worker, gravado em `poller_worker_status` a cada heartbeat
+        """
+        self.worker_id = worker_id or default_worker_id()
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.status = status
+        self.owned: set[int] = set()
+        self.live_workers: list[str] = []
+        self.renewed_at: float | None = None  # monotonic da última rodada bem-sucedida
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.claimed = 0
+        self.released = 0
+
+    def _heartbeat(self, db: Session, now: datetime):
+        values = {"heartbeat_at": now, "devices": len(self.owned)}
+        updated = db.execute(
+            update(models.PollerWorker).where(models.PollerWorker.id == self.worker_id).values(**values)
+        ).rowcount
+        if not updated:
+            db.execute(insert(models.PollerWorker).values(
+                id=self.worker_id, hostname=socket.gethostname(), pid=os.getpid(), started_at=now, **values,
+            ))
+        db.execute(
+            update(models.DeviceLease)
+            .where(models.DeviceLease.worker_id == self.worker_id)
+            .values(expires_at=now + timedelta(seconds=self.ttl))
+        )
+        if self.status is not None:
+            self._report(db, now)
+
+    def _report(self, db: Session, now: datetime):
+        try:
+            # ida e volta por JSON: chaves int viram str e datetimes viram texto, como a coluna guardará
+            status = json.loads(json.dumps(self.status(), default=str))
+        except Exception:
+            logger.exception(f"WORKER_STATUS_ERROR | worker={self.worker_id}")
+            return
+        S = models.PollerWorkerStatus
+        if not db.execute(update(S).where(S.worker_id == self.worker_id).values(reported_at=now, status=status)).rowcount:
+            db.execute(insert(S).values(worker_id=self.worker_id, reported_at=now, status=status))
+
+    def rebalance(self, device_ids: Iterable[int]) -> set[int]:
+        """Renova o heartbeat, redistribui e devolve os device_ids que este worker deve ler."""
+        devices = set(device_ids)
+        with self._lock:
+            db = self.session_factory()
+            try:
+                now = datetime.utcnow()
+                expires = now + timedelta(seconds=self.ttl)
+                self._heartbeat(db, now)
+                db.commit()
+
+                alive_since = now - timedelta(seconds=self.ttl)
+                live = sorted(db.scalars(
+                    select(models.PollerWorker.id).where(models.PollerWorker.heartbeat_at >= alive_since)
+                ))
+                if self.worker_id not in live:
+                    live.append(self.worker_id)
+                mine = {d for d in devices if rendezvous_owner(d, live) == self.worker_id}
+
+                # libera o que não é mais seu (inclusive dispositivos removidos)
+                held = set(db.scalars(select(models.DeviceLease.device_id).where(models.DeviceLease.worker_id == self.worker_id)))
+                release = held - mine
+                if release:
+                    db.execute(delete(models.DeviceLease).where(
+                        models.DeviceLease.worker_id == self.worker_id,
+                        models.DeviceLease.device_id.in_(release),
+                    ))
+                    self.released += len(release)
+
+                # reivindica: sem lease, expirado ou de worker morto
+                wanted = mine - held
+                if wanted:
+                    leased = set(db.scalars(select(models.DeviceLease.device_id).where(models.DeviceLease.device_id.in_(wanted))))
+                    # se outro worker inserir antes, a linha dele prevalece
+                    self.claimed += insert_ignore(db, models.DeviceLease.__table__, [
+                        {"device_id": d, "worker_id": self.worker_id, "acquired_at": now, "expires_at": expires}
+                        for d in sorted(wanted - leased)
+                    ])
+                    if leased:
+                        self.claimed += db.execute(
+                            update(models.DeviceLease)
+                            .where(
+                                models.DeviceLease.device_id.in_(leased),
+                                or_(models.DeviceLease.expires_at < now, models.DeviceLease.worker_id.not_in(live)),
+                            )
+                            .values(worker_id=self.worker_id, acquired_at=now, expires_at=expires)
+                        ).rowcount
+
+                # limpeza: workers mortos há muito tempo e leases órfãos (dispositivo removido)
+                stale = now - timedelta(seconds=10 * self.ttl)
+                db.execute(delete(models.PollerWorker).where(models.PollerWorker.heartbeat_at < stale))
+                db.execute(delete(models.PollerWorkerStatus).where(models.PollerWorkerStatus.reported_at < stale))
+                db.execute(delete(models.DeviceLease).where(models.DeviceLease.expires_at < stale))
+                db.commit()
+
+                self.owned = set(db.scalars(
+                    select(models.DeviceLease.device_id).where(models.DeviceLease.worker_id == self.worker_id)
+                )) & devices
+                self.live_workers = live
+                self.renewed_at = time.monotonic()
+                self.rounds += 1
+                return set(self.owned)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def owns(self, device_id: int) -> bool:
+        """True se o dispositivo cabe a este worker na partição da última rodada.
+
+        Vale também para dispositivos sem poller (ex: ingestão pela API), que não têm
+        lease: serve para dividir entre os workers as tarefas de manutenção por
+        dispositivo (rollups, energias) sem que dois façam o mesmo trabalho.
+        """
+        return rendezvous_owner(device_id, self.live_workers) == self.worker_id
+
+    @property
+    def expired(self) -> bool:
+        """True se os leases podem ter expirado (nenhuma renovação dentro do TTL): outro worker pode ter assumido."""
+        return self.renewed_at is None or time.monotonic() - self.renewed_at >= self.ttl
+
+    def release_all(self):
+        """Entrega todos os leases e remove o worker (desligamento limpo: handover imediato)."""
+        with self._lock:
+            db = self.session_factory()
+            try:
+                db.execute(delete(models.DeviceLease).where(models.DeviceLease.worker_id == self.worker_id))
+                db.execute(delete(models.PollerWorker).where(models.PollerWorker.id == self.worker_id))
+                db.execute(delete(models.PollerWorkerStatus).where(models.PollerWorkerStatus.worker_id == self.worker_id))
+                db.commit()
+                self.released += len(self.owned)
+                self.owned = set()
+            finally:
+                db.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "ttl_s": self.ttl,
+            "devices": len(self.owned),
+            "live_workers": len(self.live_workers),
+            "rounds": self.rounds,
+            "claimed": self.claimed,
+            "released": self.released,
+        }
+
+
+def cluster_status(db: Session, ttl: float) -> dict[str, Any]:
+    """Workers registrados (vivos ou não) e quantos dispositivos cada um detém."""
+    now = datetime.utcnow()
+    counts: dict[str, int] = {}
+    for worker_id, expires_at in db.execute(select(models.DeviceLease.worker_id, models.DeviceLease.expires_at)):
+        if expires_at >= now:
+            counts[worker_id] = counts.get(worker_id, 0) + 1
+    workers = [
+        {
+            "worker_id": w.id,
+            "hostname": w.hostname,
+            "pid": w.pid,
+            "started_at": w.started_at.isoformat(),
+            "heartbeat_age_s": round((now - w.heartbeat_at).total_seconds(), 1),
+            "alive": (now - w.heartbeat_at).total_seconds() <= ttl,
+            "leased_devices": counts.get(w.id, 0),
+        }
+        for w in db.scalars(select(models.PollerWorker).order_by(models.PollerWorker.started_at))
+    ]
+    return {"workers": workers, "leased_devices": sum(counts.values())}
+
+
+def worker_reports(db: Session, ttl: float) -> list[dict[str, Any]]:
+    """Último estado gravado por cada worker vivo (heartbeat dentro do TTL), do mais recente ao mais antigo."""
+    now = datetime.utcnow()
+    S, W = models.PollerWorkerStatus, models.PollerWorker
+    rows = db.execute(
+        select(S.worker_id, S.reported_at, S.status)
+        .join(W, W.id == S.worker_id)
+        .where(W.heartbeat_at >= now - timedelta(seconds=ttl))
+        .order_by(S.reported_at.desc())
+    )
+    return [
+        {"worker_id": worker_id, "reported_at": reported_at.isoformat(), "age_s": round((now - reported_at).total_seconds(), 1), "status": status}
+        for worker_id, reported_at, status in rows
+    ]
@@ -0,0 +1,369 @@
+"""Partições mensais de medições, com retenção por DROP da partição inteira.
+
+Com `MEASUREMENT_PARTITIONING=monthly` as medições novas vão para uma tabela
+por mês (`measurements_202405`, ...):
+
+- SQLite: tabelas comuns com o mesmo esquema de `measurements` (clusterizadas no
+  perfil timeseries). `crud.create_measurements_bulk` separa as linhas por mês e
+  grava cada grupo na sua partição (criada na hora, se faltar); as consultas de
+  `crud` leem só as partições que cruzam o intervalo pedido, mais a tabela
+  `measurements` original, que guarda o que foi gravado antes do particionamento.
+  Os ids vêm de `measurement_id_seq` e continuam únicos entre as tabelas.
+- PostgreSQL: particionamento nativo (`PARTITION BY RANGE (timestamp)`). As
+  inserções e consultas continuam em `measurements`; o banco roteia e poda as
+  partições. Aqui só se criam as partições dos meses (a do mês seguinte com
+  antecedência) e se aplicam as retenções.
+
+Retenção (`MEASUREMENT_RETENTION_DAYS`): uma partição cujo mês terminou antes do
+corte é apagada com DROP TABLE, sem DELETE linha a linha e sem índice para
+reorganizar. O agendador de coleta (API com poller embutido ou `app.worker`)
+aplica a retenção de hora em hora; também:
+
+    python -m app.services.partitions list
+    python -m app.services.partitions retention
+    python -m app.services.partitions migrate     # move o legado para partições
+"""
+from __future__ import annotations
+import argparse
+import logging
+import re
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Iterable
+from sqlalchemy import JSON, Column, DateTime, Float, Integer, MetaData, String, Table, insert, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from ..core import sqlite_profile
+from ..core.config import settings
+
+
+logger = logging.getLogger("pieng.audit")
+
+BASE_TABLE = "measurements"
+_NAME_RE = re.compile(r"^measurements_(\d{4})(\d{2})$")
+
+SQLITE_PARTITION_DDL = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER NOT NULL PRIMARY KEY,
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    timestamp DATETIME NOT NULL,
+    metric VARCHAR(100) NOT NULL,
+    value FLOAT,
+    extra JSON
+)
+"""
+SQLITE_PARTITION_INDEX = "CREATE INDEX IF NOT EXISTS ix_{name}_device_metric_time ON {name} (device_id, metric, timestamp)"
+
+POSTGRES_PARENT_DDL = (
+    "CREATE SEQUENCE IF NOT EXISTS measurements_id_seq",
+    """
+    CREATE TABLE measurements (
+        id INTEGER NOT NULL DEFAULT nextval('measurements_id_seq'),
+        device_id INTEGER NOT NULL REFERENCES devices (id),
+        timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        metric VARCHAR(100) NOT NULL,
+        value DOUBLE PRECISION,
+        extra JSON,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+    """,
+    "CREATE INDEX ix_measurements_device_metric_time ON measurements (device_id, metric, timestamp)",
+    "ALTER SEQUENCE measurements_id_seq OWNED BY measurements.id",
+)
+
+
+def month_key(ts: datetime) -> str:
+    return f"{ts.year:04d}{ts.month:02d}"
+
+
+def month_bounds(key: str) -> tuple[datetime, datetime]:
+    """[início, fim) do mês da partição."""
+    start = datetime(int(key[:4]), int(key[4:]), 1)
+    end = datetime(start.year + (start.month == 12), start.month % 12 + 1, 1)
+    return start, end
+
+
+def partition_name(key: str) -> str:
+    return f"{BASE_TABLE}_{key}"
+
+
+class PartitionManager:
+    def __init__(self, mode: str = "none", retention_days: float = 0, refresh_seconds: float = 60.0):
+        """
+        Args:
+            mode: "none" (tabela única) ou "monthly"
+            retention_days: Apaga partições cujo mês terminou há mais que isso (0 = guarda tudo)
+            refresh_seconds: Validade da lista de partições em cache (outro processo pode criar ou apagar)
+        """
+        if mode not in ("none", "monthly"):
+            raise ValueError(f"particionamento desconhecido: {mode} (use none ou monthly)")
+        self.mode = mode
+        self.retention_days = retention_days
+        self.refresh_seconds = refresh_seconds
+        self._metadata = MetaData()
+        self._tables: dict[str, Table] = {}
+        self._known: weakref.WeakKeyDictionary[Engine, tuple[float, set[str]]] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _engine(bind) -> Engine:
+        engine = bind.get_bind() if isinstance(bind, Session) else bind
+        return getattr(engine, "engine", engine)
+
+    def enabled(self, bind) -> bool:
+        return self.mode == "monthly" and self._engine(bind).dialect.name in ("sqlite", "postgresql")
+
+    def table(self, key: str) -> Table:
+        """Tabela Core da partição SQLite (para INSERT/SELECT)."""
+        with self._lock:
+            t = self._tables.get(key)
+            if t is None:
+                t = self._tables[key] = Table(
+                    partition_name(key), self._metadata,
+                    Column("id", Integer, primary_key=True),
+                    Column("device_id", Integer),
+                    Column("timestamp", DateTime),
+                    Column("metric", String(100)),
+                    Column("value", Float),
+                    Column("extra", JSON),
+                )
+            return t
+
+    # -- catálogo ------------------------------------------------------------
+
+    def _scan(self, conn) -> set[str]:
+        if conn.dialect.name == "sqlite":
+            names = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars()
+        else:
+            names = conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :base"
+            ), {"base": BASE_TABLE}).scalars()
+        return {m.group(1) + m.group(2) for m in map(_NAME_RE.match, names) if m}
+
+    def existing(self, bind, fresh: bool = False) -> list[str]:
+        """Meses com partição, em ordem (`YYYYMM`)."""
+        engine = self._engine(bind)
+        cached = self._known.get(engine)
+        if fresh or cached is None or time.monotonic() - cached[0] >= self.refresh_seconds:
+            if isinstance(bind, Session):
+                keys = self._scan(bind.connection())
+            else:
+                with engine.connect() as conn:
+                    keys = self._scan(conn)
+            self._known[engine] = cached = (time.monotonic(), keys)
+        return sorted(cached[1])
+
+    def _forget(self, bind):
+        self._known.pop(self._engine(bind), None)
+
+    # -- criação ---------------------------------------------------------------
+
+    def ensure(self, db: Session, keys: Iterable[str]):
+        """Cria as partições que faltam (na transação de `db`)."""
+        missing = set(keys) - set(self.existing(db))
+        if not missing:
+            return
+        missing -= set(self.existing(db, fresh=True))
+        if not missing:
+            return
+        conn = db.connection()
+        if conn.dialect.name == "sqlite" and not sqlite_profile.uses_id_sequence(conn):
+            sqlite_profile.ensure_sequence(conn)
+        for key in sorted(missing):
+            name = partition_name(key)
+            if conn.dialect.name == "sqlite":
+                if settings.sqlite_profile == "timeseries":
+                    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :n"), {"n": name}).first() is None:
+                        conn.execute(text(sqlite_profile.CLUSTERED_MEASUREMENTS_DDL.format(name=name)))
+                else:
+                    conn.execute(text(SQLITE_PARTITION_DDL.format(name=name)))
+                    conn.execute(text(SQLITE_PARTITION_INDEX.format(name=name)))
+            else:
+                start, end = month_bounds(key)
+                try:
+                    with db.begin_nested():
+                        conn.execute(text(
+                            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {BASE_TABLE} "
+                            f"FOR VALUES FROM ('{start.isoformat(' ')}') TO ('{end.isoformat(' ')}')"
+                        ))
+                except Exception as e:
+                    # mês coberto pela partição legada (ver `migrate`): o banco já roteia para ela
+                    logger.warning(f"PARTITION_SKIPPED | partition={name} | error={e}")
+                    continue
+            logger.info(f"PARTITION_CREATED | partition={name}")
+        self._forget(db)
+
+    def init(self, engine: Engine):
+        """Prepara o banco: tabela-mãe particionada (PostgreSQL novo), sequência de ids (SQLite) e partições do mês atual e do próximo."""
+        if not self.enabled(engine):
+            return
+        with engine.begin() as conn:
+            if engine.dialect.name == "sqlite":
+                if not sqlite_profile.uses_id_sequence(conn):
+                    sqlite_profile.ensure_sequence(conn)
+            elif not self._is_partitioned_pg(conn):
+                logger.warning(
+                    "PARTITION_UNMIGRATED | measurements não é particionada; "
+                    "rode `python -m app.services.partitions migrate`"
+                )
+                return
+        now = datetime.utcnow()
+        with Session(engine) as db:
+            self.ensure(db, {month_key(now), month_key(now + timedelta(days=32))})
+            db.commit()
+
+    @staticmethod
+    def _is_partitioned_pg(conn) -> bool:
+        return conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :base"
+        ), {"base": BASE_TABLE}).first() is not None
+
+    def create_parent(self, engine: Engine):
+        """PostgreSQL novo: cria `measurements` já particionada (antes do `create_all`)."""
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT to_regclass(:base)"), {"base": BASE_TABLE}).scalar()
+            if exists is None:
+                for ddl in POSTGRES_PARENT_DDL:
+                    conn.execute(text(ddl))
+
+    # -- escrita e leitura --------------------------------------------------------
+
+    def routes_inserts(self, bind) -> bool:
+        """True se a aplicação escolhe a tabela de cada linha (SQLite); no PostgreSQL o banco roteia."""
+        return self.enabled(bind) and self._engine(bind).dialect.name == "sqlite"
+
+    def insert(self, db: Session, params: list[dict]) -> list[int]:
+        """SQLite: grava cada linha na partição do seu mês, com ids da sequência; retorna os ids."""
+        by_key: dict[str, list[dict]] = {}
+        for p in params:
+            by_key.setdefault(month_key(p["timestamp"]), []).append(p)
+        self.ensure(db, by_key)
+        first = sqlite_profile.allocate_ids(db, len(params))
+        for i, p in enumerate(params):
+            p["id"] = first + i
+        for key, rows in by_key.items():
+            db.execute(insert(self.table(key)), rows)
+        return [p["id"] for p in params]
+
+    def read_tables(self, db: Session, start: datetime | None = None, end: datetime | None = None) -> list[Table]:
+        """Partições SQLite que cruzam [start, end], da mais antiga para a mais nova (poda por mês)."""
+        if not self.enabled(db) or db.get_bind().dialect.name != "sqlite":
+            return []
+        lo = month_key(start) if start is not None else None
+        hi = month_key(end) if end is not None else None
+        return [
+            self.table(k) for k in self.existing(db)
+            if (lo is None or k >= lo) and (hi is None or k <= hi)
+        ]
+
+    # -- retenção ----------------------------------------------------------------
+
+    def expired(self, bind, now: datetime | None = None) -> list[str]:
+        if not self.enabled(bind) or self.retention_days <= 0:
+            return []
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        return [k for k in self.existing(bind, fresh=True) if month_bounds(k)[1] <= cutoff]
+
+    def apply_retention(self, engine: Engine, now: datetime | None = None) -> list[str]:
+        """Apaga (DROP) as partições inteiramente anteriores ao corte; retorna os meses apagados."""
+        dropped = self.expired(engine, now)
+        for key in dropped:
+            with engine.begin() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {partition_name(key)}"))
+            logger.info(f"PARTITION_DROPPED | partition={partition_name(key)} | retention_days={self.retention_days}")
+        if dropped:
+            self._forget(engine)
+        return dropped
+
+    def schedule_retention(self, scheduler, engine: Engine, seconds: float = 3600.0):
+        """Agenda `apply_retention` no `PollingScheduler` (só se houver retenção configurada)."""
+        if self.enabled(engine) and self.retention_days > 0:
+            scheduler.add_job(lambda: self.apply_retention(engine), seconds=seconds, id="partition_retention", overlap="skip")
+
+    def stats(self, bind) -> dict:
+        return {
+            "mode": self.mode,
+            "retention_days": self.retention_days,
+            "partitions": [partition_name(k) for k in self.existing(bind)] if self.enabled(bind) else [],
+        }
+
+    # -- migração ----------------------------------------------------------------
+
+    def migrate(self, engine: Engine) -> int:
+        """Leva o que está fora das partições para dentro delas.
+
+        SQLite: copia as linhas de `measurements` para as partições do mês e esvazia
+        a tabela. PostgreSQL: renomeia a tabela para `measurements_legacy`, cria a
+        tabela-mãe particionada e anexa a antiga como partição até o fim do mês
+        do último dado. A partição legada fica fora da retenção automática
+        (`DROP TABLE measurements_legacy` quando não for mais necessária).
+        """
+        if engine.dialect.name == "sqlite":
+            moved = 0
+            with Session(engine) as db:
+                months = db.execute(text("SELECT DISTINCT strftime('%Y%m', timestamp) FROM measurements")).scalars().all()
+                self.ensure(db, months)
+                for key in months:
+                    start, end = month_bounds(key)
+                    moved += db.execute(text(
+                        f"INSERT INTO {partition_name(key)} (id, device_id, timestamp, metric, value, extra) "
+                        "SELECT id, device_id, timestamp, metric, value, extra FROM measurements "
+                        "WHERE timestamp >= :start AND timestamp < :end ORDER BY device_id, metric, timestamp"
+                    ), {"start": start, "end": end}).rowcount
+                db.execute(text("DELETE FROM measurements"))  # sem WHERE: o SQLite esvazia a tabela de uma vez
+                db.commit()
+            with engine.connect() as conn:
+                conn.execute(text("VACUUM"))
+            logger.info(f"PARTITION_MIGRATED | rows={moved}")
+            return moved
+
+        with engine.begin() as conn:
+            if self._is_partitioned_pg(conn):
+                return 0
+            last = conn.execute(text("SELECT MAX(timestamp) FROM measurements")).scalar()
+            upper = month_bounds(month_key(max(last or datetime.utcnow(), datetime.utcnow())))[1]
+            conn.execute(text("ALTER TABLE measurements RENAME TO measurements_legacy"))
+            for (index,) in conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'measurements_legacy' AND indexname LIKE 'ix_measurements%'"
+            )).all():
+                conn.execute(text(f"ALTER INDEX {index} RENAME TO {index.replace('ix_measurements', 'ix_measurements_legacy', 1)}"))
+            for ddl in POSTGRES_PARENT_DDL:
+                conn.execute(text(ddl))
+            conn.execute(text(
+                f"ALTER TABLE measurements ATTACH PARTITION measurements_legacy "
+                f"FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat(' ')}')"
+            ))
+        self._forget(engine)
+        logger.info(f"PARTITION_MIGRATED | legacy_until={upper.isoformat()}")
+        return -1
+
+
+partitions = PartitionManager(settings.measurement_partitioning, settings.measurement_retention_days)
+
+
+def main():
+    from ..core.db import engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["list", "retention", "migrate"])
+    args = parser.parse_args()
+    if not partitions.enabled(engine):
+        parser.error("particionamento desligado (MEASUREMENT_PARTITIONING=monthly) ou banco sem suporte")
+    if args.command == "list":
+        for key in partitions.existing(engine, fresh=True):
+            start, end = month_bounds(key)
+            print(f"{partition_name(key)}  {start:%Y-%m-%d} .. {end:%Y-%m-%d}")
+    elif args.command == "retention":
+        dropped = partitions.apply_retention(engine)
+        print(f"apagadas: {', '.join(map(partition_name, dropped))}" if dropped else "nada a apagar")
+    else:
+        moved = partitions.migrate(engine)
+        print("tabela anexada como partição legada" if moved < 0 else f"{moved} medições movidas para partições")
+
+
+if __name__ == "__main__":
+    main()
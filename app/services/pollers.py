@@ -1,12 +1,20 @@
 from __future__ import annotations
 import logging
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable
 from sqlalchemy.orm import Session
+from ..core.config import settings
 from ..core.db import SessionLocal
-from .. import crud, schemas, models
-from ..connectors.modbus import ModbusRTUClient, ModbusTCPClient
-from ..connectors.pzem004t import read_pzem004t_metrics
-from ..connectors.eastron_sdm630 import read_sdm630_metrics
+from .. import crud, models
+from .async_poller import AsyncModbusTCPPoller, PollCycleReport, TCPDeviceTarget
+from .rtu_bus import RTUBusManager, RTUDeviceTarget
+from .tuya_poller import TuyaCloudPoller, TuyaCredentials, TuyaDeviceTarget, TuyaLocalPoller, TuyaPoller
+from .scheduler import ScheduledDevice
+from .circuit_breaker import BreakerRegistry, CircuitBreaker
+from .telemetry import telemetry
+from .deadband import DeadbandFilter
+from .device_registry import registry
 
 # Configurar logger de auditoria
 logger = logging.getLogger("pieng.audit")
@@ -16,91 +24,327 @@ if not logger.handlers:
     handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s"))
     logger.addHandler(handler)
 
+_tcp_poller = AsyncModbusTCPPoller(
+    max_concurrency=settings.modbus_tcp_max_concurrency,
+    per_gateway_concurrency=settings.modbus_tcp_per_gateway_concurrency,
+)
+_rtu_buses = RTUBusManager()
+_tuya = TuyaPoller(
+    cloud=TuyaCloudPoller(
+        rate=settings.tuya_rate_limit,
+        burst=settings.tuya_rate_burst,
+        token_ttl=settings.tuya_token_ttl,
+        device_list_ttl=settings.tuya_device_list_ttl,
+    ),
+    local=TuyaLocalPoller(
+        max_concurrency=settings.tuya_local_max_concurrency,
+        timeout=settings.tuya_local_timeout,
+        retry_after=settings.tuya_local_retry_after,
+    ),
+)
+breakers = BreakerRegistry(
+    failure_threshold=settings.breaker_failure_threshold,
+    backoff_initial=settings.breaker_backoff_initial,
+    backoff_max=settings.breaker_backoff_max,
+)
+deadband = DeadbandFilter(max_silence=settings.deadband_max_silence, enabled=settings.deadband_enabled)
 
-def poll_modbus_devices():
-    """Poller para dispositivos Modbus RTU (serial)."""
+
+def _store_values(rows: list[crud.MeasurementRow], device_id: int, values: dict[str, float], cfg: dict | None = None):
+    """Acumula as leituras que passaram pelo deadband (report-by-exception) para a gravação em lote do ciclo."""
+    now = datetime.utcnow()
+    stored = deadband.filter(device_id, values, cfg, now.replace(tzinfo=timezone.utc).timestamp())
+    rows.extend((device_id, k, now, v) for k, v in stored.items())
+
+
+def _commit_stored(rows: list[crud.MeasurementRow]):
+    """Confirma no deadband as leituras do ciclo depois que a gravação em lote deu certo."""
+    by_device: dict[int, dict[str, float]] = defaultdict(dict)
+    now: dict[int, datetime] = {}
+    for device_id, metric, timestamp, value in rows:
+        by_device[device_id][metric] = value
+        now[device_id] = timestamp
+    for device_id, stored in by_device.items():
+        deadband.commit(device_id, stored, now[device_id].replace(tzinfo=timezone.utc).timestamp())
+
+
+def _admit(targets: list, gateway_of: Callable[[Any], CircuitBreaker]) -> tuple[list, list]:
+    """Separa os alvos liberados pelos breakers (dispositivo e gateway) dos que serão pulados.
+
+    Só `allow` decide (é atômico): em half-open, de várias threads de despacho só uma
+    leva a prova. Se o gateway recusa, a prova já concedida pelo dispositivo é devolvida.
+    """
+    allowed, skipped = [], []
+    for t in targets:
+        dev_b, gw_b = breakers.device(t.id), gateway_of(t)
+        if dev_b.allow():
+            if gw_b.allow():
+                allowed.append(t)
+                continue
+            dev_b.release_probe()
+            dev_b.note_skipped()
+        skipped.append(t)
+    return allowed, skipped
+
+
+def _record_outcomes(targets: list, results: dict, report: PollCycleReport, gateway_of: Callable[[Any], CircuitBreaker]):
+    """Atualiza os breakers: o do gateway só falha quando todos os dispositivos dele falharam."""
+    for t in targets:
+        ok = t.id in results
+        error = report.errors.get(t.id)
+        dev_b = breakers.device(t.id)
+        if ok:
+            dev_b.record_success()
+        elif dev_b.record_failure(error):
+            logger.warning(f"BREAKER_OPEN | {dev_b.key} | retry_in={dev_b.snapshot()['retry_in_s']}s | error={error}")
+        gw_b = gateway_of(t)
+        if gw_b.record_member(t.id, ok, None if ok else f"todos os dispositivos sem resposta (último: {error})"):
+            logger.warning(f"BREAKER_OPEN | {gw_b.key} | retry_in={gw_b.snapshot()['retry_in_s']}s")
+
+
+def _tcp_gateway(t: TCPDeviceTarget) -> CircuitBreaker:
+    return breakers.gateway(t.host, t.port)
+
+
+def _rtu_port(t: RTUDeviceTarget) -> CircuitBreaker:
+    return breakers.serial_port(t.port)
+
+
+def poll_modbus_devices(device_ids: Iterable[int] | None = None) -> PollCycleReport:
+    """Poller para dispositivos Modbus RTU (serial).
+
+    As leituras são enfileiradas no worker da porta serial de cada dispositivo (ver
+    `RTUBusManager`): a porta fica aberta entre ciclos e portas diferentes são lidas
+    em paralelo. `device_ids` restringe o ciclo a um subconjunto (agendamento por
+    dispositivo).
+    """
     db: Session = SessionLocal()
     try:
-        devices = crud.list_devices(db)
-        for d in devices:
-            if d.device_type != "modbus" or not d.active:
-                continue
-            cfg = d.config or {}
-            try:
-                with ModbusRTUClient(
-                    port=cfg.get("port", "COM3"),
-                    slave_id=int(cfg.get("slave_id", 1)),
-                    baudrate=int(cfg.get("baudrate", 9600)),
-                    timeout=float(cfg.get("timeout", 0.5)),
-                ) as client:
-                    if cfg.get("driver") == "pzem004t":
-                        values = read_pzem004t_metrics(client, base_address=int(cfg.get("base", 0)))
-                        for k in ["voltage", "current", "power", "energy_wh"]:
-                            if k in values:
-                                crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=k, value=float(values[k])))
-                    elif cfg.get("driver") == "sdm630":
-                        values = read_sdm630_metrics(client, base_address=int(cfg.get("base", 0)))
-                        for k, v in values.items():
-                            if not k.startswith("_") and isinstance(v, (int, float)):
-                                crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=k, value=float(v)))
-                    else:
-                        # leitura genérica de regs
-                        regs = client.read_input_registers(address=int(cfg.get("base", 0)), count=int(cfg.get("count", 4)))
-                        metrics = cfg.get("metrics", ["voltage", "current", "power", "energy_wh"])
-                        for idx, val in enumerate(regs):
-                            metric = metrics[idx] if idx < len(metrics) else f"reg_{idx}"
-                            crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=metric, value=float(val)))
-            except Exception as e:
-                logger.error(f"POLL_RTU_ERROR | device_id={d.id} | name={d.name} | error={str(e)}")
-                print(f"Erro ao ler dispositivo Modbus RTU {d.id} ({d.name}): {e}")
-                continue
-        db.commit()
+        targets = [p.target for p in registry.plans("modbus", device_ids)]
+        targets, skipped = _admit(targets, _rtu_port)
+        report, results = _rtu_buses.poll(targets)
+        report.skipped = len(skipped)
+        rows: list[crud.MeasurementRow] = []
+        _record_outcomes(targets, results, report, _rtu_port)
+        telemetry.record_reads({i: v for i, v in report.latencies.items() if i in results}, report.errors)
+        for t in targets:
+            if t.id in results:
+                _store_values(rows, t.id, results[t.id], t.config)
+            else:
+                error = report.errors.get(t.id)
+                logger.error(f"POLL_RTU_ERROR | device_id={t.id} | name={t.name} | error={error}")
+                print(f"Erro ao ler dispositivo Modbus RTU {t.id} ({t.name}): {error}")
+        crud.create_measurements_bulk(db, rows)
+        _commit_stored(rows)
+        logger.info(f"POLL_RTU_CYCLE | polled={report.polled} | failed={report.failed} | skipped={report.skipped} | duration={report.duration_s:.3f}s")
+        return report
     finally:
         db.close()
 
 
-def poll_modbus_tcp_devices():
-    """Poller para dispositivos Modbus TCP (Elfin-EW11A, conversores RS485-WiFi, etc)."""
+def poll_modbus_tcp_devices(device_ids: Iterable[int] | None = None) -> PollCycleReport:
+    """Poller para dispositivos Modbus TCP (Elfin-EW11A, conversores RS485-WiFi, etc).
+
+    Todos os dispositivos são lidos em paralelo (ver `AsyncModbusTCPPoller`), sobre
+    conexões persistentes por gateway; a gravação no banco acontece depois, na
+    thread do scheduler. `device_ids` restringe o ciclo a um subconjunto.
+    """
     db: Session = SessionLocal()
     try:
-        devices = crud.list_devices(db)
-        for d in devices:
-            if d.device_type != "modbus_tcp" or not d.active:
-                continue
-            cfg = d.config or {}
-            try:
-                with ModbusTCPClient(
-                    host=cfg.get("host", "192.168.1.100"),
-                    port=int(cfg.get("port", 502)),
-                    slave_id=int(cfg.get("slave_id", 1)),
-                    timeout=float(cfg.get("timeout", 3.0)),
-                ) as client:
-                    if cfg.get("driver") == "pzem004t":
-                        values = read_pzem004t_metrics(client, base_address=int(cfg.get("base", 0)))
-                        logger.info(f"POLL_TCP | device_id={d.id} | driver=pzem004t | host={cfg.get('host')}:{cfg.get('port')} | metrics={len(values)}")
-                        for k in ["voltage", "current", "power", "energy_wh"]:
-                            if k in values:
-                                crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=k, value=float(values[k])))
-                    elif cfg.get("driver") == "sdm630":
-                        values = read_sdm630_metrics(client, base_address=int(cfg.get("base", 0)))
-                        metrics_count = sum(1 for k in values.keys() if not k.startswith("_"))
-                        logger.info(f"POLL_TCP | device_id={d.id} | driver=sdm630 | host={cfg.get('host')}:{cfg.get('port')} | metrics={metrics_count}")
-                        for k, v in values.items():
-                            if not k.startswith("_") and isinstance(v, (int, float)):
-                                crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=k, value=float(v)))
-                    else:
-                        # leitura genérica de regs
-                        regs = client.read_input_registers(address=int(cfg.get("base", 0)), count=int(cfg.get("count", 4)))
-                        logger.info(f"POLL_TCP | device_id={d.id} | driver=generic | host={cfg.get('host')}:{cfg.get('port')} | registers={len(regs)}")
-                        metrics = cfg.get("metrics", ["voltage", "current", "power", "energy_wh"])
-                        for idx, val in enumerate(regs):
-                            metric = metrics[idx] if idx < len(metrics) else f"reg_{idx}"
-                            crud.create_measurement(db, schemas.MeasurementCreate(device_id=d.id, metric=metric, value=float(val)))
-            except Exception as e:
-                logger.error(f"POLL_TCP_ERROR | device_id={d.id} | name={d.name} | host={cfg.get('host')} | error={str(e)}")
-                print(f"Erro ao ler dispositivo Modbus TCP {d.id} ({d.name}): {e}")
-                continue
-        db.commit()
+        targets = [p.target for p in registry.plans("modbus_tcp", device_ids)]
+        targets, skipped = _admit(targets, _tcp_gateway)
+        report, results = _tcp_poller.run_cycle(targets)
+        report.skipped = len(skipped)
+        rows: list[crud.MeasurementRow] = []
+        _record_outcomes(targets, results, report, _tcp_gateway)
+        telemetry.record_reads({i: v for i, v in report.latencies.items() if i in results}, report.errors)
+        for t in targets:
+            cfg = t.config
+            if t.id in results:
+                values = results[t.id]
+                logger.info(f"POLL_TCP | device_id={t.id} | driver={cfg.get('driver', 'generic')} | host={cfg.get('host')}:{cfg.get('port')} | metrics={len(values)}")
+                _store_values(rows, t.id, values, cfg)
+            else:
+                error = report.errors.get(t.id)
+                logger.error(f"POLL_TCP_ERROR | device_id={t.id} | name={t.name} | host={cfg.get('host')} | error={error}")
+                print(f"Erro ao ler dispositivo Modbus TCP {t.id} ({t.name}): {error}")
+        crud.create_measurements_bulk(db, rows)
+        _commit_stored(rows)
+        logger.info(f"POLL_TCP_CYCLE | polled={report.polled} | failed={report.failed} | skipped={report.skipped} | duration={report.duration_s:.3f}s")
+        return report
     finally:
         db.close()
 
+
+def _tuya_credentials(cfg: dict) -> TuyaCredentials | None:
+    """Credenciais da conta Tuya: `config` do dispositivo ou, na falta, as do .env (None se não houver)."""
+    creds = TuyaCredentials(
+        api_region=cfg.get("api_region") or settings.tuya_api_region,
+        api_key=cfg.get("api_key") or settings.tuya_api_key or "",
+        api_secret=cfg.get("api_secret") or settings.tuya_api_secret or "",
+        api_uid=cfg.get("api_uid") or settings.tuya_api_uid or "",
+    )
+    if not creds.api_key or not creds.api_secret:
+        return None
+    return creds
+
+
+def _tuya_gateway_key(t: TuyaDeviceTarget) -> str | None:
+    # modo local: o "gateway" é o próprio IP; assim a nuvem fora do ar não bloqueia leituras na LAN
+    if t.local:
+        return f"tuya-local:{t.address}"
+    return f"tuya:{t.credentials.key}" if t.credentials else None
+
+
+def _tuya_account(t: TuyaDeviceTarget) -> CircuitBreaker:
+    return breakers.get(_tuya_gateway_key(t))
+
+
+def poll_tuya_devices(device_ids: Iterable[int] | None = None) -> PollCycleReport:
+    """Poller para tomadas/medidores Tuya (`device_type: "tuya"`, `config["tuya_id"]`).
+
+    Dispositivos com `address` e `local_key` são lidos pela LAN em paralelo; os
+    demais, e os que não respondem localmente, vão para a nuvem em requisições de
+    status em lote, sob o limite de taxa da conta (ver `TuyaPoller`).
+    """
+    db: Session = SessionLocal()
+    try:
+        targets: list[TuyaDeviceTarget] = [p.target for p in registry.plans("tuya", device_ids)]
+        targets, skipped = _admit(targets, _tuya_account)
+        report, results = _tuya.poll(targets)
+        report.skipped = len(skipped)
+        rows: list[crud.MeasurementRow] = []
+        _record_outcomes(targets, results, report, _tuya_account)
+        telemetry.record_reads({i: v for i, v in report.latencies.items() if i in results}, report.errors)
+        for t in targets:
+            if t.id in results:
+                _store_values(rows, t.id, results[t.id], t.config)
+            else:
+                error = report.errors.get(t.id)
+                logger.error(f"POLL_TUYA_ERROR | device_id={t.id} | name={t.name} | tuya_id={t.tuya_id} | local={t.local} | error={error}")
+                print(f"Erro ao ler dispositivo Tuya {t.id} ({t.name}): {error}")
+        crud.create_measurements_bulk(db, rows)
+        _commit_stored(rows)
+        logger.info(f"POLL_TUYA_CYCLE | polled={report.polled} | failed={report.failed} | skipped={report.skipped} | duration={report.duration_s:.3f}s")
+        return report
+    finally:
+        db.close()
+
+
+POLLED_DEVICE_TYPES = ("modbus", "modbus_tcp", "tuya")
+
+
+def _tuya_target(d: models.Device, cfg: dict) -> TuyaDeviceTarget:
+    target = TuyaDeviceTarget(id=d.id, name=d.name, config=cfg, credentials=_tuya_credentials(cfg))
+    if not target.local and target.credentials is None:
+        raise ValueError("sem address/local_key e sem credenciais Tuya (config api_key/api_secret ou TUYA_API_KEY/TUYA_API_SECRET)")
+    return target
+
+
+# Alvos dos pollers, montados uma vez por dispositivo a partir do config validado
+registry.register_builder("modbus", lambda d, cfg: RTUDeviceTarget(id=d.id, name=d.name, config=cfg))
+registry.register_builder("modbus_tcp", lambda d, cfg: TCPDeviceTarget(id=d.id, name=d.name, config=cfg))
+registry.register_builder("tuya", _tuya_target)
+
+
+def schedulable_devices() -> list[ScheduledDevice]:
+    """Dispositivos ativos com poller, com seus intervalos próprios (do registro em memória)."""
+    return registry.schedulable(POLLED_DEVICE_TYPES)
+
+
+def device_dispatchers() -> dict:
+    """Poller de cada tipo de dispositivo, chamado com o lote de device_ids vencidos."""
+    return {
+        "modbus": poll_modbus_devices,
+        "modbus_tcp": poll_modbus_tcp_devices,
+        "tuya": poll_tuya_devices,
+    }
+
+
+def device_health(device: models.Device, reported: dict[str, dict] | None = None) -> dict:
+    """Estado dos breakers do dispositivo e do seu gateway/porta serial.
+
+    `reported`: breakers gravados pelos workers (`reported_breakers`), quando a coleta
+    não roda neste processo; senão, os breakers em memória.
+    """
+    cfg = device.config or {}
+    if device.device_type == "modbus_tcp":
+        gw_key = f"gateway:{cfg.get('host', '192.168.1.100')}:{int(cfg.get('port', 502))}"
+    elif device.device_type == "modbus":
+        gw_key = f"port:{cfg.get('port', 'COM3')}"
+    elif device.device_type == "tuya" and cfg.get("tuya_id"):
+        gw_key = _tuya_gateway_key(TuyaDeviceTarget(id=device.id, name=device.name, config=cfg, credentials=_tuya_credentials(cfg)))
+    else:
+        gw_key = None
+
+    def find(key: str) -> dict | None:
+        if reported is not None:
+            return reported.get(key)
+        b = breakers.find(key)
+        return b.snapshot() if b else None
+
+    dev = find(f"device:{device.id}")
+    gw = find(gw_key) if gw_key else None
+    return {
+        "device_id": device.id,
+        "name": device.name,
+        "device": dev or {"key": f"device:{device.id}", "state": "unknown"},
+        "gateway": gw or ({"key": gw_key, "state": "unknown"} if gw_key else None),
+    }
+
+
+def worker_status(scheduler) -> dict:
+    """Estado em memória de um worker de coleta, gravado com o heartbeat (`LeaseManager(status=...)`)."""
+    return {
+        "breakers": breakers.snapshot(),
+        "schedule": scheduler.schedule_stats(),
+        "telemetry": scheduler.telemetry.snapshot(),
+        "pool": {"gateways": tcp_pool_stats()},
+        "buses": {"buses": rtu_bus_stats()},
+        "tuya": tuya_stats(),
+        "deadband": deadband_stats(),
+        "registry": registry_stats(),
+    }
+
+
+def reported_breakers(reports: list[dict]) -> dict[str, dict]:
+    """Breakers dos relatórios dos workers por chave; vale o relatório mais recente.
+
+    Cada snapshot ganha `worker_id` e `reported_at` (`retry_in_s` é relativo a esse instante).
+    """
+    merged: dict[str, dict] = {}
+    for r in reports:  # do mais recente ao mais antigo
+        for snap in r["status"].get("breakers", []):
+            merged.setdefault(snap["key"], {**snap, "worker_id": r["worker_id"], "reported_at": r["reported_at"]})
+    return merged
+
+
+def tcp_pool_stats() -> list[dict]:
+    """Estatísticas das conexões persistentes por gateway usadas pelo poller TCP."""
+    return _tcp_poller.pool_stats()
+
+
+def registry_stats() -> dict:
+    """Registro de dispositivos: planos compilados por tipo, configs inválidos e recargas."""
+    return registry.stats()
+
+
+def tuya_stats() -> dict:
+    """Contas Tuya Cloud (requisições, tokens, token bucket), sessões locais e fallbacks para a nuvem."""
+    return _tuya.stats()
+
+
+def deadband_stats() -> dict:
+    """Leituras vistas x gravadas pelo filtro de deadband desde o início do processo."""
+    return deadband.stats()
+
+
+def rtu_bus_stats() -> list[dict]:
+    """Estatísticas dos workers de barramento serial (uma entrada por porta)."""
+    return _rtu_buses.stats()
+
+
+def shutdown_pollers():
+    _tcp_poller.shutdown()
+    _rtu_buses.shutdown()
+    _tuya.shutdown()
@@ -0,0 +1,64 @@
+"""Limitador de taxa (token bucket) para APIs com cota, como a Tuya Cloud."""
+from __future__ import annotations
+import threading
+import time
+from typing import Any
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        """
+        Args:
+            rate: Requisições por segundo sustentadas
+            capacity: Rajada máxima (padrão: `rate`)
+        """
+        if rate <= 0:
+            raise ValueError("rate deve ser positivo")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_s = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self.acquired += 1
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: float | None = None) -> bool:
+        """Bloqueia até haver `tokens` disponíveis; retorna False se `timeout` estourar."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.acquired += 1
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+            self.waited_s += wait
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate_per_s": self.rate,
+                "capacity": self.capacity,
+                "available": round(self._tokens, 2),
+                "acquired": self.acquired,
+                "waited_s": round(self.waited_s, 3),
+            }
@@ -0,0 +1,387 @@
+"""Rollups de medições: agregados de 1 min, 15 min, 1 h e 1 dia mantidos na gravação.
+
+`/api/metrics/timerange` e `/demand` agregam a série em degrau (`analytics.step_resample`):
+sem rollups, um período de um ano de uma métrica a cada 30 s lê ~1 milhão de linhas.
+`measurement_rollups` guarda, por (dispositivo, métrica, resolução, início do intervalo),
+as parcelas somáveis dessa agregação (segundos com valor, soma valor x duração, min,
+max, count e sum), então a consulta lê o rollup mais grosso que divide a frequência
+pedida e combina as linhas com pandas.
+
+Manutenção incremental:
+
+- `crud.create_measurements_bulk` grava, na mesma transação das medições, um trecho
+  pendente por dispositivo (`rollup_pending`: do primeiro ponto do lote até o último
+  mais a validade de um valor, `hold_limit` do dispositivo); pontos atrasados ou fora de ordem
+  geram o mesmo trecho, no passado;
+- `refresh` (agendado a cada ROLLUP_REFRESH_INTERVAL no agendador de coleta) recalcula
+  os intervalos de 1 min dos trechos pendentes a partir das medições brutas e, deles,
+  os de 15 min, 1 h e 1 dia; o que ainda está no futuro continua pendente;
+- na leitura, o que vem depois do trecho pendente mais antigo do dispositivo é lido
+  das medições brutas, então o resultado é o mesmo do cálculo direto.
+
+Os rollups sobrevivem à retenção das partições (`MEASUREMENT_RETENTION_DAYS`). Para
+refazer a partir das medições brutas (ex: depois de mudar DEADBAND_MAX_SILENCE ou de
+religar ROLLUPS_ENABLED):
+
+    python -m app.services.rollups rebuild [--device-id N]
+    python -m app.services.rollups status
+"""
+from __future__ import annotations
+import argparse
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable
+import pandas as pd
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .. import models
+from ..core.config import settings
+from .analytics import STEP_COMPONENTS, finish_components, step_components
+from .partitions import partitions
+
+
+logger = logging.getLogger("pieng.audit")
+
+# Com deadband um valor fica em vigor até o próximo ponto gravado; sem nenhum
+# ponto por dois heartbeats o dispositivo é considerado sem dados.
+HOLD_LIMIT_S = 2 * settings.deadband_max_silence
+
+
+def hold_limit(cfg: dict | None, default: float = HOLD_LIMIT_S) -> float:
+    """Validade de um valor do dispositivo: dois heartbeats do seu `max_silence`, se configurado."""
+    silence = (cfg or {}).get("max_silence")
+    return 2 * float(silence) if silence else default
+
+LEVELS = (60, 900, 3600, 86400)  # segundos; cada um divide o seguinte
+FREQ = {60: "1min", 900: "15min", 3600: "1h", 86400: "1D"}
+CHUNK = timedelta(days=1)  # recálculo em blocos (backfill de histórico longo)
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def floor_to(ts: datetime, seconds: int) -> datetime:
+    us = (ts - _EPOCH) // _US
+    return _EPOCH + timedelta(microseconds=us - us % (seconds * 1_000_000))
+
+
+def ceil_to(ts: datetime, seconds: int) -> datetime:
+    floored = floor_to(ts, seconds)
+    return floored if floored == ts else floored + timedelta(seconds=seconds)
+
+
+def _merge(spans: list[tuple[datetime, datetime]]) -> list[tuple[datetime, datetime]]:
+    merged: list[list[datetime]] = []
+    for a, b in sorted(spans):
+        if merged and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return [(a, b) for a, b in merged]
+
+
+class RollupStore:
+    def __init__(self, enabled: bool = True, max_hold: float = HOLD_LIMIT_S):
+        """
+        Args:
+            enabled: Com False nada é marcado e as consultas leem só as medições brutas
+            max_hold: Validade (s) de um valor sem nova gravação, a mesma das consultas;
+                dispositivos com `max_silence` próprio usam `hold_limit` da sua configuração
+        """
+        self.enabled = enabled
+        self.max_hold = max_hold
+        self.refreshes = 0
+        self.buckets_written = 0
+        self.last_refresh: datetime | None = None
+
+    def _holds(self, db: Session, device_ids) -> dict[int, float]:
+        """Validade de um valor por dispositivo (`max_silence` de `Device.config`)."""
+        rows = db.execute(select(models.Device.id, models.Device.config).where(models.Device.id.in_(list(device_ids))))
+        holds = {d: hold_limit(cfg, self.max_hold) for d, cfg in rows}
+        return {d: holds.get(d, self.max_hold) for d in device_ids}
+
+    # -- gravação ----------------------------------------------------------------
+
+    def mark(self, db: Session, params: list[dict]):
+        """Registra os trechos afetados por medições novas (na transação de `db`)."""
+        if not self.enabled or not params:
+            return
+        spans: dict[int, list] = {}
+        for p in params:
+            span = spans.get(p["device_id"])
+            if span is None:
+                spans[p["device_id"]] = [p["timestamp"], p["timestamp"], {p["metric"]}]
+            else:
+                span[0] = min(span[0], p["timestamp"])
+                span[1] = max(span[1], p["timestamp"])
+                span[2].add(p["metric"])
+        holds = self._holds(db, spans)
+        db.execute(insert(models.RollupPending), [
+            {"device_id": d, "start": a, "end": b + timedelta(seconds=holds[d]), "metrics": sorted(m)}
+            for d, (a, b, m) in spans.items()
+        ])
+
+    def _queue_history(self, db: Session, device_id: int | None = None) -> int:
+        """Marca como pendente todo o histórico bruto (backfill ou rebuild); retorna os dispositivos marcados."""
+        spans: dict[int, list] = {}
+
+        def add(device: int, lo: datetime, hi: datetime, metrics):
+            span = spans.setdefault(device, [lo, hi, set()])
+            span[0], span[1] = min(span[0], lo), max(span[1], hi)
+            span[2].update(metrics)
+
+        for t in [models.Measurement.__table__] + partitions.read_tables(db):
+            q = select(t.c.device_id, t.c.metric, func.min(t.c.timestamp), func.max(t.c.timestamp)).group_by(t.c.device_id, t.c.metric)
+            if device_id is not None:
+                q = q.where(t.c.device_id == device_id)
+            for d, m, lo, hi in db.execute(q):
+                add(d, lo, hi, [m])
+        snap = models.MeasurementSnapshot
+        q = select(snap.device_id, func.min(snap.timestamp), func.max(snap.timestamp)).group_by(snap.device_id)
+        if device_id is not None:
+            q = q.where(snap.device_id == device_id)
+        snap_spans = db.execute(q).all()
+        if snap_spans:
+            names = db.execute(select(models.MetricName.name)).scalars().all()  # métricas dentro dos blobs
+            for d, lo, hi in snap_spans:
+                add(d, lo, hi, names)
+        if spans:
+            self.mark(db, [
+                {"device_id": d, "metric": m, "timestamp": ts}
+                for d, (lo, hi, metrics) in spans.items() for m in metrics for ts in (lo, hi)
+            ])
+        return len(spans)
+
+    def init(self, engine: Engine):
+        """Banco com medições e sem rollups (primeira subida com rollups): enfileira o backfill."""
+        if not self.enabled:
+            return
+        with Session(engine) as db:
+            if db.execute(select(models.MeasurementRollup.device_id).limit(1)).first() is not None:
+                return
+            if db.execute(select(models.RollupPending.id).limit(1)).first() is not None:
+                return
+            devices = self._queue_history(db)
+            db.commit()
+        if devices:
+            logger.info(f"ROLLUP_BACKFILL_QUEUED | devices={devices}")
+
+    # -- recálculo ---------------------------------------------------------------
+
+    def _replace(self, db: Session, device_id: int, metric: str, level: int, lo: datetime, hi: datetime, frame: pd.DataFrame) -> int:
+        R = models.MeasurementRollup
+        db.execute(delete(R).where(
+            R.device_id == device_id, R.metric == metric, R.resolution == level, R.bucket >= lo, R.bucket < hi
+        ))
+        if frame.empty:
+            return 0
+        db.execute(insert(R), [
+            {
+                "device_id": device_id, "metric": metric, "resolution": level, "bucket": ts.to_pydatetime(),
+                "held_s": float(h), "weighted": float(w), "min": float(mn), "max": float(mx), "count": int(c), "sum": float(s),
+            }
+            for ts, h, w, mn, mx, c, s in frame[STEP_COMPONENTS].itertuples(index=False)
+        ])
+        return len(frame)
+
+    def _read(self, db: Session, device_id: int, metric: str, level: int, lo: datetime, hi: datetime) -> pd.DataFrame:
+        R = models.MeasurementRollup
+        rows = db.execute(select(R.bucket, R.held_s, R.weighted, R.min, R.max, R.count, R.sum).where(
+            R.device_id == device_id, R.metric == metric, R.resolution == level, R.bucket >= lo, R.bucket < hi
+        ).order_by(R.bucket)).all()
+        return pd.DataFrame(rows, columns=STEP_COMPONENTS)
+
+    def _raw(self, db: Session, device_id: int, metric: str, freq: str, lo: datetime, hi: datetime, max_hold: float) -> pd.DataFrame:
+        from .. import crud  # crud importa este módulo
+
+        timestamps, values = crud.measurement_arrays(db, device_id, metric, lo, hi)
+        if not len(timestamps):
+            return pd.DataFrame(columns=STEP_COMPONENTS)
+        return step_components(timestamps, values, freq, lo, hi, max_hold=max_hold)
+
+    def _recompute(self, db: Session, device_id: int, metric: str, lo: datetime, hi: datetime) -> int:
+        """Refaz os intervalos de 1 min de [lo, hi) a partir das medições e, deles, os mais grossos."""
+        raw = self._raw(db, device_id, metric, FREQ[LEVELS[0]], lo, hi, self._holds(db, [device_id])[device_id])
+        written = self._replace(db, device_id, metric, LEVELS[0], lo, hi, raw)
+        for finer, level in zip(LEVELS, LEVELS[1:]):
+            lo, hi = floor_to(lo, level), ceil_to(hi, level)
+            parts = self._read(db, device_id, metric, finer, lo, hi)
+            if not parts.empty:
+                g = parts.groupby(pd.DatetimeIndex(parts["timestamp"]).floor(FREQ[level]))
+                parts = g.agg({"held_s": "sum", "weighted": "sum", "min": "min", "max": "max", "count": "sum", "sum": "sum"})
+                parts = parts.rename_axis("timestamp").reset_index()
+            written += self._replace(db, device_id, metric, level, lo, hi, parts)
+        return written
+
+    def refresh(
+        self,
+        engine: Engine,
+        now: datetime | None = None,
+        time_budget: float | None = 5.0,
+        batch: int = 5000,
+        owns: Callable[[int], bool] | None = None,
+    ) -> int:
+        """Processa os trechos pendentes até `now`; retorna os intervalos gravados.
+
+        Cada bloco é gravado na sua própria transação curta (o SQLite tem um escritor
+        só). O que passar do orçamento de tempo, ou ainda estiver no futuro, volta
+        para `rollup_pending`. Com `owns`, só os dispositivos deste processo (workers
+        com leases): cada trecho é processado por um worker só.
+        """
+        if not self.enabled:
+            return 0
+        horizon = floor_to(now or datetime.utcnow(), LEVELS[0])
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        written = 0
+        with Session(engine) as db:
+            q = select(models.RollupPending).order_by(models.RollupPending.id).limit(batch)
+            if owns is not None:
+                mine = [d for d in db.execute(select(models.RollupPending.device_id).distinct()).scalars() if owns(d)]
+                if not mine:
+                    return 0
+                q = q.where(models.RollupPending.device_id.in_(mine))
+            pending = db.execute(q).scalars().all()
+            if not pending:
+                return 0
+            series: dict[tuple[int, str], list[tuple[datetime, datetime]]] = defaultdict(list)
+            for p in pending:
+                for metric in p.metrics:
+                    series[(p.device_id, metric)].append((floor_to(p.start, LEVELS[0]), ceil_to(p.end, LEVELS[0])))
+            pending_ids = [p.id for p in pending]
+            db.rollback()
+
+            left: dict[int, list] = {}
+            for (device_id, metric), spans in series.items():
+                for a, b in _merge(spans):
+                    while a < min(b, horizon) and (deadline is None or time.monotonic() < deadline):
+                        c = min(a + CHUNK, b, horizon)
+                        written += self._recompute(db, device_id, metric, a, c)
+                        db.commit()
+                        a = c
+                    if a < b:
+                        span = left.setdefault(device_id, [a, b, set()])
+                        span[0], span[1] = min(span[0], a), max(span[1], b)
+                        span[2].add(metric)
+
+            db.execute(delete(models.RollupPending).where(models.RollupPending.id.in_(pending_ids)))
+            if left:
+                db.execute(insert(models.RollupPending), [
+                    {"device_id": d, "start": a, "end": b, "metrics": sorted(m)} for d, (a, b, m) in left.items()
+                ])
+            db.commit()
+        self.refreshes += 1
+        self.buckets_written += written
+        self.last_refresh = datetime.utcnow()
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.info(f"ROLLUP_REFRESH_PARTIAL | buckets={written} | pending_devices={len(left)}")
+        return written
+
+    def rebuild(self, engine: Engine, device_id: int | None = None) -> int:
+        """Recalcula os rollups de todo o histórico bruto (de um dispositivo ou de todos)."""
+        with Session(engine) as db:
+            self._queue_history(db, device_id)
+            db.commit()
+        written = 0
+        while True:
+            done = self.refresh(engine, time_budget=None)
+            written += done
+            with Session(engine) as db:
+                oldest = db.execute(select(func.min(models.RollupPending.start))).scalar()
+            # sobra só o trecho em aberto (validade do último valor, no futuro)
+            if not done or oldest is None or oldest >= floor_to(datetime.utcnow(), LEVELS[0]):
+                break
+        logger.info(f"ROLLUP_REBUILT | device_id={device_id} | buckets={written}")
+        return written
+
+    def schedule(self, scheduler, engine: Engine, seconds: float, owns: Callable[[int], bool] | None = None):
+        """Agenda `refresh` no `PollingScheduler`; `owns` restringe aos dispositivos deste processo (leases do worker)."""
+        if self.enabled:
+            scheduler.add_job(lambda: self.refresh(engine, owns=owns), seconds=seconds, id="rollup_refresh", overlap="skip")
+
+    # -- leitura -----------------------------------------------------------------
+
+    def horizon(self, db: Session, device_id: int) -> datetime | None:
+        """Início do trecho pendente mais antigo do dispositivo (rollups valem só antes dele)."""
+        start = db.execute(select(func.min(models.RollupPending.start)).where(models.RollupPending.device_id == device_id)).scalar()
+        return floor_to(start, LEVELS[0]) if start is not None else None
+
+    def resample(self, db: Session, device_id: int, metric: str, freq: str, start: datetime, end: datetime) -> pd.DataFrame:
+        """Mesmo resultado de `step_resample` sobre as medições brutas, lendo rollups onde houver.
+
+        Usa o rollup mais grosso que divide `freq`; as bordas do período que não
+        fecham um intervalo desse rollup descem para os mais finos e, abaixo de
+        1 min, para as medições brutas, assim como o trecho ainda pendente.
+        """
+        freq_s = pd.Timedelta(freq).total_seconds()
+        levels = [level for level in LEVELS if freq_s % level == 0]
+        max_hold = self._holds(db, [device_id])[device_id]
+        if not self.enabled or not levels or start >= end:
+            return finish_components([self._raw(db, device_id, metric, freq, start, end, max_hold)], freq)
+
+        horizon = self.horizon(db, device_id)
+        horizon = end if horizon is None else max(start, min(horizon, end))
+        parts: list[pd.DataFrame] = []
+        raw: list[tuple[datetime, datetime]] = []
+
+        def cover(a: datetime, b: datetime, levels: list[int]):
+            if a >= b:
+                return
+            if not levels:
+                raw.append((a, b))
+                return
+            level, finer = levels[0], levels[1:]
+            inner_a, inner_b = ceil_to(a, level), floor_to(b, level)
+            if inner_a >= inner_b:
+                cover(a, b, finer)
+                return
+            cover(a, inner_a, finer)
+            parts.append(self._read(db, device_id, metric, level, inner_a, inner_b))
+            cover(inner_b, b, finer)
+
+        cover(start, horizon, levels[::-1])
+        if horizon < end:
+            raw.append((horizon, end))
+        for a, b in _merge(raw):
+            parts.append(self._raw(db, device_id, metric, freq, a, b, max_hold))
+        return finish_components(parts, freq)
+
+    def stats(self, engine: Engine) -> dict:
+        R, P = models.MeasurementRollup, models.RollupPending
+        with Session(engine) as db:
+            rows = dict(db.execute(select(R.resolution, func.count()).group_by(R.resolution)).all())
+            pending, oldest = db.execute(select(func.count(), func.min(P.start))).one()
+        return {
+            "enabled": self.enabled,
+            "rows": {FREQ[level]: rows.get(level, 0) for level in LEVELS},
+            "pending": pending,
+            "oldest_pending": oldest.isoformat() if oldest else None,
+            "refreshes": self.refreshes,
+            "buckets_written": self.buckets_written,
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None,
+        }
+
+
+rollups = RollupStore(settings.rollups_enabled)
+
+
+def main():
+    from ..core.db import engine, init_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "refresh", "status"])
+    parser.add_argument("--device-id", type=int, default=None, help="só este dispositivo (rebuild)")
+    args = parser.parse_args()
+    init_db()
+    if args.command == "rebuild":
+        print(f"{rollups.rebuild(engine, args.device_id)} intervalos recalculados")
+    elif args.command == "refresh":
+        print(f"{rollups.refresh(engine, time_budget=None)} intervalos recalculados")
+    else:
+        for key, value in rollups.stats(engine).items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,350 @@
 from __future__ import annotations
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from typing import Callable
+from typing import Callable, Any, Iterable
+from .telemetry import PollTelemetry, telemetry as default_telemetry
+
+
+logger = logging.getLogger(__name__)
+
+OVERLAP_POLICIES = ("skip", "coalesce", "queue")
+
+
+@dataclass
+class ScheduledDevice:
+    """Dispositivo agendado: tipo (seleciona o poller) e intervalo próprio em segundos."""
+    device_id: int
+    kind: str
+    interval: float
+
+
+@dataclass
+class _DeviceState:
+    device: ScheduledDevice
+    base: float  # prazo nominal (taxa fixa, sem jitter)
+    generation: int = 0
+    in_flight: bool = False
+    runs: int = 0
+    missed: int = 0
+    lateness: deque = field(default_factory=lambda: deque(maxlen=200))
+
+    def stats(self) -> dict[str, Any]:
+        late = sorted(self.lateness)
+        n = len(late)
+        return {
+            "device_id": self.device.device_id,
+            "kind": self.device.kind,
+            "interval_s": self.device.interval,
+            "runs": self.runs,
+            "missed_deadlines": self.missed,
+            "lateness_avg_s": round(sum(late) / n, 4) if n else 0.0,
+            "lateness_p95_s": round(late[min(n - 1, int(n * 0.95))], 4) if n else 0.0,
+            "lateness_max_s": round(late[-1], 4) if n else 0.0,
+        }
+
+
+class DevicePollQueue:
+    """Fila de prioridade (heap) com o próximo prazo de leitura de cada dispositivo.
+
+    Cada dispositivo segue taxa fixa no seu próprio intervalo; o prazo efetivo recebe
+    um jitter de até `jitter` x intervalo para que leituras não disparem todas juntas.
+    Um prazo é considerado perdido quando chega sem que a leitura anterior tenha
+    terminado (começou atrasada ou demorou mais que o intervalo); os períodos perdidos
+    são contados uma vez, em `complete`, e pulados (não há rajada de recuperação).
+    """
+
+    def __init__(self, jitter: float = 0.1):
+        self.jitter = max(0.0, float(jitter))
+        self._heap: list[tuple[float, int, int, int]] = []  # (prazo, seq, device_id, generation)
+        self._states: dict[int, _DeviceState] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _push(self, state: _DeviceState):
+        jitter = random.uniform(0, self.jitter * state.device.interval) if self.jitter else 0.0
+        heapq.heappush(self._heap, (state.base + jitter, next(self._seq), state.device.device_id, state.generation))
+
+    def sync(self, devices: Iterable[ScheduledDevice], now: float | None = None):
+        """Atualiza o conjunto agendado: inclui novos, reajusta intervalos e remove ausentes."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            seen = set()
+            for dev in devices:
+                seen.add(dev.device_id)
+                state = self._states.get(dev.device_id)
+                if state is None:
+                    # fase inicial aleatória espalha os dispositivos dentro do intervalo
+                    state = _DeviceState(device=dev, base=now + random.uniform(0, dev.interval))
+                    self._states[dev.device_id] = state
+                    self._push(state)
+                elif state.device.interval != dev.interval or state.device.kind != dev.kind:
+                    state.device = dev
+                    state.generation += 1
+                    if not state.in_flight:
+                        state.base = min(state.base, now + dev.interval)
+                        self._push(state)
+            for device_id in list(self._states):
+                if device_id not in seen:
+                    del self._states[device_id]
+
+    def next_deadline(self) -> float | None:
+        with self._lock:
+            while self._heap:
+                deadline, _, device_id, gen = self._heap[0]
+                state = self._states.get(device_id)
+                if state is None or state.generation != gen or state.in_flight:
+                    heapq.heappop(self._heap)
+                    continue
+                return deadline
+            return None
+
+    def pop_due(self, now: float | None = None) -> list[tuple[ScheduledDevice, float]]:
+        """Remove e devolve os dispositivos com prazo vencido, com o respectivo prazo."""
+        now = time.monotonic() if now is None else now
+        due: list[tuple[ScheduledDevice, float]] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, device_id, gen = heapq.heappop(self._heap)
+                state = self._states.get(device_id)
+                if state is None or state.generation != gen or state.in_flight:
+                    continue
+                state.in_flight = True
+                lateness = max(0.0, now - deadline)
+                state.lateness.append(lateness)
+                state.runs += 1
+                due.append((state.device, deadline))
+        return due
+
+    def complete(self, device_id: int, now: float | None = None):
+        """Reagenda o dispositivo após a leitura terminar."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get(device_id)
+            if state is None:
+                return
+            state.in_flight = False
+            state.base += state.device.interval
+            if state.base <= now:
+                # início atrasado ou leitura mais longa que o intervalo: os prazos que passaram contam como perdidos
+                skipped = int((now - state.base) // state.device.interval) + 1
+                state.base += skipped * state.device.interval
+                state.missed += skipped
+            self._push(state)
+
+    def stats(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return [s.stats() for s in self._states.values()]
+
+
+class GuardedJob:
+    """Envolve a função de um job periódico e trata disparos que chegam com ela ainda rodando.
+
+    Políticas de sobreposição:
+    - skip: o disparo é descartado
+    - coalesce: os disparos acumulados viram uma única execução logo após a atual
+    - queue: cada disparo vira uma execução, em sequência (até `max_queued` pendentes)
+
+    Cada execução registra duração e atraso (disparo -> início) na telemetria.
+    """
+
+    def __init__(self, job_id: str, func: Callable, policy: str, telemetry: PollTelemetry, max_queued: int = 10):
+        if policy not in OVERLAP_POLICIES:
+            raise ValueError(f"política de sobreposição inválida: {policy} (use {', '.join(OVERLAP_POLICIES)})")
+        self.job_id = job_id
+        self.func = func
+        self.policy = policy
+        self.telemetry = telemetry
+        self.max_queued = max(1, int(max_queued))
+        self._pending: deque[float] = deque()
+        self._running = False
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        fired = time.monotonic()
+        with self._lock:
+            if self._running:
+                self._overrun(fired)
+                return
+            self._running = True
+        try:
+            while True:
+                self._run_once(fired)
+                with self._lock:
+                    if not self._pending:
+                        self._running = False
+                        return
+                    fired = self._pending.popleft()
+        except BaseException:
+            with self._lock:
+                self._running = False
+            raise
+
+    def _overrun(self, fired: float):
+        if self.policy == "skip":
+            action = "skipped"
+        elif self.policy == "coalesce":
+            action = "coalesced"
+            if not self._pending:
+                self._pending.append(fired)
+        elif len(self._pending) < self.max_queued:
+            action = "queued"
+            self._pending.append(fired)
+        else:
+            action = "dropped"
+        self.telemetry.record_overrun(self.job_id, action)
+        logger.warning("job %s ainda em execução: disparo %s", self.job_id, action)
+
+    def _run_once(self, fired: float):
+        start = time.monotonic()
+        ok = True
+        try:
+            self.func()
+        except Exception:
+            ok = False
+            logger.exception("erro no job %s", self.job_id)
+        finally:
+            self.telemetry.record_job(self.job_id, time.monotonic() - start, start - fired, ok)
 
 
 class PollingScheduler:
-    def __init__(self, timezone: str = "UTC"):
+    def __init__(
+        self,
+        timezone: str = "UTC",
+        jitter: float = 0.1,
+        dispatch_workers: int = 8,
+        overlap_policy: str = "skip",
+        telemetry: PollTelemetry | None = None,
+    ):
+        if overlap_policy not in OVERLAP_POLICIES:
+            raise ValueError(f"política de sobreposição inválida: {overlap_policy} (use {', '.join(OVERLAP_POLICIES)})")
         self.scheduler = BackgroundScheduler(timezone=timezone)
+        self.overlap_policy = overlap_policy
+        self.telemetry = telemetry or default_telemetry
+        self.device_queue = DevicePollQueue(jitter=jitter)
+        self._dispatch_workers = dispatch_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._dispatchers: dict[str, Callable[[list[int]], Any]] = {}
+        self._loader: Callable[[], Iterable[ScheduledDevice]] | None = None
+        self._refresh_seconds = 30.0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add_job(self, func: Callable, seconds: float, *, id: str, overlap: str | None = None):
+        """Agenda `func` a cada `seconds`, com proteção contra sobreposição.
 
-    def add_job(self, func: Callable, seconds: int, *, id: str):
-        self.scheduler.add_job(func, IntervalTrigger(seconds=seconds), id=id, replace_existing=True)
+        `overlap` (skip, coalesce ou queue) sobrescreve a política padrão do scheduler.
+        O APScheduler pode disparar enquanto a execução anterior ainda roda; quem
+        decide o que fazer com esse disparo é o `GuardedJob`, não o `max_instances`.
+        """
+        job = GuardedJob(id, func, overlap or self.overlap_policy, self.telemetry)
+        self.telemetry.register_job(id, float(seconds))
+        self.scheduler.add_job(
+            job,
+            IntervalTrigger(seconds=seconds),
+            id=id,
+            replace_existing=True,
+            max_instances=2,
+            coalesce=True,
+            misfire_grace_time=None,
+        )
+
+    def schedule_devices(
+        self,
+        loader: Callable[[], Iterable[ScheduledDevice]],
+        dispatchers: dict[str, Callable[[list[int]], Any]],
+        refresh_seconds: float = 30.0,
+    ):
+        """Agenda leituras por dispositivo, cada um no seu intervalo.
+
+        Args:
+            loader: Retorna os dispositivos a agendar (chamado a cada `refresh_seconds`)
+            dispatchers: Por tipo de dispositivo, função que lê um lote de device_ids
+            refresh_seconds: Período de recarga da lista de dispositivos
+        """
+        self._loader = loader
+        self._dispatchers = dict(dispatchers)
+        self._refresh_seconds = refresh_seconds
+        self.refresh_devices()
+        if self.scheduler.running:
+            self._start_dispatcher()
+
+    def refresh_devices(self):
+        if self._loader is not None:
+            self.device_queue.sync(self._loader())
+            self._wakeup.set()
+
+    def _start_dispatcher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self._dispatch_workers, thread_name_prefix="poll-dispatch")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="poll-scheduler", daemon=True)
+        self._thread.start()
+        self.add_job(self.refresh_devices, seconds=max(1, int(self._refresh_seconds)), id="refresh_device_schedule")
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            deadline = self.device_queue.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if timeout is None or timeout > 0:
+                self._wakeup.wait(timeout if timeout is not None else 1.0)
+                self._wakeup.clear()
+                continue
+            batches: dict[str, list[int]] = {}
+            now = time.monotonic()
+            for dev, deadline in self.device_queue.pop_due(now):
+                self.telemetry.record_queue_lag(dev.kind, max(0.0, now - deadline))
+                batches.setdefault(dev.kind, []).append(dev.device_id)
+            for kind, ids in batches.items():
+                if self._stop.is_set():
+                    return
+                try:
+                    self._executor.submit(self._run_batch, kind, ids)
+                except RuntimeError:  # executor encerrado por `shutdown` entre a checagem e o submit
+                    return
+
+    def _run_batch(self, kind: str, device_ids: list[int]):
+        t0 = time.monotonic()
+        try:
+            fn = self._dispatchers.get(kind)
+            if fn is not None:
+                fn(device_ids)
+        except Exception:
+            logger.exception("erro no lote de leitura %s", kind)
+        finally:
+            self.telemetry.record_cycle(kind, time.monotonic() - t0)
+            for device_id in device_ids:
+                self.device_queue.complete(device_id)
+            self._wakeup.set()
+
+    def schedule_stats(self) -> dict[str, Any]:
+        devices = self.device_queue.stats()
+        return {
+            "devices": devices,
+            "total_runs": sum(d["runs"] for d in devices),
+            "total_missed": sum(d["missed_deadlines"] for d in devices),
+        }
 
     def start(self):
         if not self.scheduler.running:
             self.scheduler.start()
+        if self._loader is not None:
+            self._start_dispatcher()
 
     def shutdown(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
         if self.scheduler.running:
             self.scheduler.shutdown(wait=False)
-
-
-
@@ -0,0 +1,181 @@
+"""Layout de snapshots: uma linha por dispositivo e aquisição.
+
+No layout de linhas (`measurements`, entidade-atributo-valor) uma leitura do
+SDM630 vira 16 linhas, cada uma com o nome da métrica repetido e uma entrada no
+índice (device_id, metric, timestamp). Com `MEASUREMENT_LAYOUT=snapshot` a
+leitura vira uma linha em `measurement_snapshots`: os ids das métricas (uint16,
+do catálogo `metric_catalog`) e os valores (float64) empacotados em dois blobs,
+com um índice só (device_id, timestamp).
+
+Leituras de várias métricas no mesmo intervalo saem numa consulta; os blobs de
+todas as linhas são concatenados e decodificados de uma vez com NumPy. As
+consultas do `crud` juntam os dois layouts, então dados antigos continuam
+visíveis depois da troca de layout.
+"""
+from __future__ import annotations
+import threading
+from datetime import datetime
+from typing import Iterable
+import numpy as np
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+from ..core.db import insert_ignore
+from .. import models
+
+
+ID_DTYPE = np.dtype("<u2")
+VALUE_DTYPE = np.dtype("<f8")
+MAX_METRIC_ID = np.iinfo(ID_DTYPE).max
+_PENDING_KEY = "metric_catalog_pending"
+
+
+def pack(metric_ids: Iterable[int], values: Iterable[float]) -> tuple[bytes, bytes]:
+    return np.asarray(list(metric_ids), dtype=ID_DTYPE).tobytes(), np.asarray(list(values), dtype=VALUE_DTYPE).tobytes()
+
+
+def unpack_many(blobs: list[tuple[bytes, bytes]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Decodifica vários snapshots de uma vez: (índice da linha, id da métrica, valor) por valor."""
+    if not blobs:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty.astype(ID_DTYPE), empty.astype(VALUE_DTYPE)
+    ids = np.frombuffer(b"".join(b[0] for b in blobs), dtype=ID_DTYPE)
+    values = np.frombuffer(b"".join(b[1] for b in blobs), dtype=VALUE_DTYPE)
+    counts = np.fromiter((len(b[0]) // ID_DTYPE.itemsize for b in blobs), dtype=np.int64, count=len(blobs))
+    return np.repeat(np.arange(len(blobs)), counts), ids, values
+
+
+class MetricCatalog:
+    """Cache do catálogo de métricas (nome <-> id).
+
+    Ids criados numa transação só entram no cache depois do commit dela: se a
+    transação for desfeita, o id não existe no banco e não pode ficar no cache.
+    """
+
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, mapping: dict[str, int]):
+        with self._lock:
+            self._ids.update(mapping)
+            self._names.update({i: n for n, i in mapping.items()})
+
+    def ids(self, db: Session, names: Iterable[str], create: bool = True) -> dict[str, int]:
+        """Ids das métricas; com `create` as que faltam são cadastradas (na transação de `db`)."""
+        names = set(names)
+        pending: dict[str, int] = db.info.get(_PENDING_KEY, {})
+        with self._lock:
+            found = {n: self._ids[n] for n in names if n in self._ids}
+        found.update({n: pending[n] for n in names - found.keys() if n in pending})
+        missing = names - found.keys()
+        if not missing:
+            return found
+        loaded = dict(db.execute(select(models.MetricName.name, models.MetricName.id).where(models.MetricName.name.in_(missing))).all())
+        found.update(loaded)
+        missing -= loaded.keys()
+        if missing and create:
+            insert_ignore(db, models.MetricName.__table__, [{"name": n} for n in sorted(missing)])
+            created = dict(db.execute(select(models.MetricName.name, models.MetricName.id).where(models.MetricName.name.in_(missing))).all())
+            if created and max(created.values()) > MAX_METRIC_ID:
+                raise ValueError(f"catálogo de métricas cheio (ids até {MAX_METRIC_ID})")
+            db.info.setdefault(_PENDING_KEY, {}).update(created)
+            found.update(created)
+        self._remember(loaded)  # já estavam gravados antes desta transação
+        return found
+
+    def names(self, db: Session, ids: Iterable[int]) -> dict[int, str]:
+        ids = {int(i) for i in ids}
+        with self._lock:
+            found = {i: self._names[i] for i in ids if i in self._names}
+        missing = ids - found.keys()
+        if missing:
+            loaded = dict(db.execute(select(models.MetricName.id, models.MetricName.name).where(models.MetricName.id.in_(missing))).all())
+            found.update(loaded)
+            pending = db.info.get(_PENDING_KEY, {})
+            committed = {n: i for i, n in loaded.items() if n not in pending}
+            self._remember(committed)
+        return found
+
+
+catalog = MetricCatalog()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_metrics(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        catalog._remember(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_metrics(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def insert_snapshots(db: Session, rows: list[dict]) -> int:
+    """Agrupa linhas {device_id, metric, timestamp, value} por (dispositivo, instante) e grava um snapshot por grupo."""
+    if not rows:
+        return 0
+    ids = catalog.ids(db, {r["metric"] for r in rows})
+    groups: dict[tuple[int, datetime], dict[int, float]] = {}
+    for r in rows:
+        groups.setdefault((r["device_id"], r["timestamp"]), {})[ids[r["metric"]]] = r["value"]
+    params = []
+    for (device_id, timestamp), values in groups.items():
+        metric_ids, packed_values = pack(values.keys(), values.values())
+        params.append({"device_id": device_id, "timestamp": timestamp, "metric_ids": metric_ids, "values": packed_values})
+    db.execute(insert(models.MeasurementSnapshot), params)
+    return len(params)
+
+
+def read_points(
+    db: Session,
+    device_id: int,
+    metrics: Iterable[str] | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    before: datetime | None = None,
+    newest_first: bool = False,
+    limit: int | None = None,
+) -> list[tuple[datetime, str, float]]:
+    """Valores gravados em snapshots: (timestamp, métrica, valor), na ordem do tempo.
+
+    `start`/`end` são inclusivos e `before` exclusivo. Com `limit`, lê os snapshots
+    em blocos até juntar `limit` valores das métricas pedidas.
+    """
+    wanted = None
+    if metrics is not None:
+        known = catalog.ids(db, metrics, create=False)
+        if not known:
+            return []
+        wanted = np.fromiter(known.values(), dtype=ID_DTYPE)
+    snap = models.MeasurementSnapshot
+    q = select(snap.timestamp, snap.metric_ids, snap.values).where(snap.device_id == device_id)
+    if start is not None:
+        q = q.where(snap.timestamp >= start)
+    if end is not None:
+        q = q.where(snap.timestamp <= end)
+    if before is not None:
+        q = q.where(snap.timestamp < before)
+    q = q.order_by(snap.timestamp.desc() if newest_first else snap.timestamp.asc())
+
+    out: list[tuple[datetime, str, float]] = []
+    chunk = max(limit or 0, 256)
+    offset = 0
+    while True:
+        batch = db.execute(q.limit(chunk).offset(offset) if limit is not None else q).all()
+        row_idx, ids, values = unpack_many([(r[1], r[2]) for r in batch])
+        if wanted is not None:
+            keep = np.isin(ids, wanted)
+            row_idx, ids, values = row_idx[keep], ids[keep], values[keep]
+        names = catalog.names(db, np.unique(ids).tolist())
+        out.extend(
+            (batch[r][0], names.get(i, f"metric#{i}"), v)
+            for r, i, v in zip(row_idx.tolist(), ids.tolist(), values.tolist())
+        )
+        if limit is None:
+            return out
+        if len(out) >= limit or len(batch) < chunk:
+            return out[:limit]
+        offset += chunk
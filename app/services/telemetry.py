@@ -0,0 +1,136 @@
+"""Telemetria da coleta: janelas móveis de duração de ciclo, latência por dispositivo e atraso de fila.
+
+Os valores ficam só em memória (últimas `history` amostras de cada série) e servem
+para dimensionar o `poll_interval` com dados: se o p95 da duração de um job se
+aproxima do intervalo, o job vai começar a sobrepor execuções.
+"""
+from __future__ import annotations
+import threading
+from collections import deque
+from typing import Any
+from ..core.config import settings
+
+
+class RollingWindow:
+    """Últimas N amostras de uma série, com contagem total desde o início."""
+
+    def __init__(self, maxlen: int = 500):
+        self._values: deque[float] = deque(maxlen=max(1, int(maxlen)))
+        self.total = 0
+
+    def add(self, value: float):
+        self._values.append(float(value))
+        self.total += 1
+
+    def summary(self) -> dict[str, Any]:
+        values = sorted(self._values)
+        n = len(values)
+        if not n:
+            return {"count": self.total, "window": 0}
+        return {
+            "count": self.total,
+            "window": n,
+            "last": round(self._values[-1], 4),
+            "avg": round(sum(values) / n, 4),
+            "p50": round(values[n // 2], 4),
+            "p95": round(values[min(n - 1, int(n * 0.95))], 4),
+            "max": round(values[-1], 4),
+        }
+
+
+class PollTelemetry:
+    def __init__(self, history: int = 500, device_history: int = 100):
+        """
+        Args:
+            history: Amostras mantidas por série de job/tipo de dispositivo
+            device_history: Amostras de latência mantidas por dispositivo
+        """
+        self.history = history
+        self.device_history = device_history
+        self._jobs: dict[str, dict[str, Any]] = {}
+        self._cycles: dict[str, RollingWindow] = {}
+        self._queue_lag: dict[str, RollingWindow] = {}
+        self._reads: dict[int, RollingWindow] = {}
+        self._read_failures: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _job(self, job_id: str, interval_s: float | None = None) -> dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = {
+                "interval_s": interval_s,
+                "duration": RollingWindow(self.history),
+                "lag": RollingWindow(self.history),
+                "errors": 0,
+                "overruns": {"skipped": 0, "coalesced": 0, "queued": 0, "dropped": 0},
+            }
+        elif interval_s is not None:
+            job["interval_s"] = interval_s
+        return job
+
+    def register_job(self, job_id: str, interval_s: float):
+        with self._lock:
+            self._job(job_id, interval_s)
+
+    def record_job(self, job_id: str, duration_s: float, lag_s: float, ok: bool = True):
+        """Uma execução de job: duração e atraso entre o disparo e o início efetivo."""
+        with self._lock:
+            job = self._job(job_id)
+            job["duration"].add(duration_s)
+            job["lag"].add(lag_s)
+            if not ok:
+                job["errors"] += 1
+
+    def record_overrun(self, job_id: str, action: str):
+        """Disparo que encontrou o job ainda rodando (skipped, coalesced, queued ou dropped)."""
+        with self._lock:
+            self._job(job_id)["overruns"][action] += 1
+
+    def record_cycle(self, kind: str, duration_s: float):
+        """Duração de um lote de leituras de um tipo de dispositivo."""
+        with self._lock:
+            self._cycles.setdefault(kind, RollingWindow(self.history)).add(duration_s)
+
+    def record_queue_lag(self, kind: str, lag_s: float):
+        """Atraso entre o prazo de leitura de um dispositivo e o despacho do lote."""
+        with self._lock:
+            self._queue_lag.setdefault(kind, RollingWindow(self.history)).add(lag_s)
+
+    def record_reads(self, latencies: dict[int, float], failed: Any = ()):
+        """Latência de leitura por device_id (só leituras concluídas) e falhas."""
+        with self._lock:
+            for device_id, latency in latencies.items():
+                self._reads.setdefault(device_id, RollingWindow(self.device_history)).add(latency)
+            for device_id in failed:
+                self._read_failures[device_id] = self._read_failures.get(device_id, 0) + 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            jobs = {}
+            for job_id, job in self._jobs.items():
+                duration = job["duration"].summary()
+                interval = job["interval_s"]
+                jobs[job_id] = {
+                    "interval_s": interval,
+                    "duration_s": duration,
+                    "lag_s": job["lag"].summary(),
+                    "errors": job["errors"],
+                    "overruns": dict(job["overruns"]),
+                    # fração do intervalo consumida no p95: acima de 1 o job sobrepõe execuções
+                    "load_p95": round(duration["p95"] / interval, 4) if interval and "p95" in duration else None,
+                }
+            return {
+                "jobs": jobs,
+                "cycles": {kind: w.summary() for kind, w in self._cycles.items()},
+                "queue_lag": {kind: w.summary() for kind, w in self._queue_lag.items()},
+                "devices": {
+                    device_id: {
+                        **(self._reads[device_id].summary() if device_id in self._reads else {"count": 0, "window": 0}),
+                        "failures": self._read_failures.get(device_id, 0),
+                    }
+                    for device_id in sorted(set(self._reads) | set(self._read_failures))
+                },
+            }
+
+
+telemetry = PollTelemetry(history=settings.telemetry_history)
@@ -0,0 +1,279 @@
+"""Pollers Tuya: nuvem (status em lote) e rede local, com fallback para a nuvem.
+
+Dispositivos com `local_key` e `address` no config são lidos pela LAN
+(`TuyaLocalPoller`): sessões persistentes, em paralelo. Só os que não respondem
+localmente — e os sem dados locais — vão para a nuvem (`TuyaCloudPoller`).
+
+Na nuvem, os dispositivos do ciclo são agrupados pelas credenciais da conta Tuya; cada conta
+tem um `TuyaAPIClient` persistente (token e lista de dispositivos em cache) e um
+`TokenBucket` próprio, já que a cota da nuvem é por projeto. O status é pedido em
+lotes de `TUYA_STATUS_BATCH_SIZE` dispositivos, então algumas centenas de tomadas
+cabem em poucas requisições por ciclo.
+"""
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable
+from ..connectors.tuya import TuyaAPIClient, map_tuya_status
+from ..connectors.tuya_local import TuyaLocalSession
+from .async_poller import PollCycleReport
+from .rate_limit import TokenBucket
+
+
+@dataclass(frozen=True)
+class TuyaCredentials:
+    api_region: str
+    api_key: str
+    api_secret: str
+    api_uid: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.api_region}:{self.api_key}"
+
+
+@dataclass
+class TuyaDeviceTarget:
+    """Dados mínimos de um dispositivo `tuya`, desacoplados da sessão ORM."""
+    id: int
+    name: str
+    config: dict
+    credentials: TuyaCredentials | None = None
+
+    @property
+    def tuya_id(self) -> str:
+        return str(self.config["tuya_id"])
+
+    @property
+    def address(self) -> str | None:
+        return self.config.get("address")
+
+    @property
+    def local(self) -> bool:
+        """Lido pela LAN: tem `address` e `local_key` e não está forçado em `mode: "cloud"`."""
+        return bool(self.address and self.config.get("local_key")) and self.config.get("mode") != "cloud"
+
+    @property
+    def local_only(self) -> bool:
+        """`mode: "local"`: só pela LAN; sem resposta, a leitura falha (sem recorrer à nuvem)."""
+        return self.local and self.config.get("mode") == "local"
+
+    @property
+    def session_key(self) -> tuple:
+        cfg = self.config
+        return (self.tuya_id, self.address, cfg.get("local_key"), float(cfg.get("version", 3.3)), int(cfg.get("local_port", 6668)))
+
+
+class TuyaCloudPoller:
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: int = 20,
+        token_ttl: float = 3600.0,
+        device_list_ttl: float = 600.0,
+        client_factory: Callable[..., TuyaAPIClient] = TuyaAPIClient,
+    ):
+        """
+        Args:
+            rate: Requisições por segundo permitidas por conta Tuya
+            burst: Rajada máxima do token bucket
+            client_factory: Construtor do cliente (substituível por um cliente falso)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.token_ttl = token_ttl
+        self.device_list_ttl = device_list_ttl
+        self.client_factory = client_factory
+        self._clients: dict[TuyaCredentials, TuyaAPIClient] = {}
+        self._buckets: dict[TuyaCredentials, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def client(self, creds: TuyaCredentials) -> TuyaAPIClient:
+        with self._lock:
+            client = self._clients.get(creds)
+            if client is None:
+                bucket = self._buckets[creds] = TokenBucket(self.rate, self.burst)
+                client = self._clients[creds] = self.client_factory(
+                    creds.api_region,
+                    creds.api_key,
+                    creds.api_secret,
+                    creds.api_uid,
+                    token_ttl=self.token_ttl,
+                    device_list_ttl=self.device_list_ttl,
+                    rate_limiter=bucket,
+                )
+            return client
+
+    def poll(self, targets: list[TuyaDeviceTarget]) -> tuple[PollCycleReport, dict[int, dict[str, float]]]:
+        report = PollCycleReport(started_at=datetime.utcnow(), polled=len(targets))
+        t0 = time.perf_counter()
+        results: dict[int, dict[str, float]] = {}
+        by_account: dict[TuyaCredentials, list[TuyaDeviceTarget]] = {}
+        for t in targets:
+            by_account.setdefault(t.credentials, []).append(t)
+        for creds, group in by_account.items():
+            started = time.perf_counter()
+            try:
+                statuses = self.client(creds).get_status_batch(t.tuya_id for t in group)
+            except Exception as e:
+                for t in group:
+                    report.failed += 1
+                    report.errors[t.id] = str(e)
+                continue
+            # latência por dispositivo: tempo da conta dividido entre os dispositivos do lote
+            latency = (time.perf_counter() - started) / len(group)
+            for t in group:
+                status = statuses.get(t.tuya_id)
+                if status is None:
+                    report.failed += 1
+                    report.errors[t.id] = f"dispositivo {t.tuya_id} ausente na resposta da nuvem"
+                    continue
+                results[t.id] = map_tuya_status(status, t.config.get("dps_map"))
+                report.latencies[t.id] = latency
+        report.duration_s = time.perf_counter() - t0
+        return report, results
+
+    def stats(self) -> list[dict[str, Any]]:
+        with self._lock:
+            items = [(creds, client, self._buckets.get(creds)) for creds, client in self._clients.items()]
+        return [
+            {
+                "account": creds.key,
+                **client.stats(),
+                "rate_limit": bucket.stats() if bucket else None,
+            }
+            for creds, client, bucket in items
+        ]
+
+
+class TuyaLocalPoller:
+    def __init__(self, max_concurrency: int = 32, timeout: float = 2.0, retry_after: float = 60.0):
+        """
+        Args:
+            max_concurrency: Dispositivos lidos em paralelo (um socket persistente cada)
+            timeout: Timeout de conexão/leitura por dispositivo (s)
+            retry_after: Após uma falha local, tempo (s) em que o dispositivo vai direto para a nuvem
+        """
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_concurrency)), thread_name_prefix="tuya-local")
+        self._sessions: dict[int, tuple[tuple, TuyaLocalSession]] = {}
+        self._down_until: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.failures = 0
+
+    def session(self, target: TuyaDeviceTarget) -> TuyaLocalSession:
+        key = target.session_key
+        with self._lock:
+            current = self._sessions.get(target.id)
+            if current is not None and current[0] == key:
+                return current[1]
+            tuya_id, address, local_key, version, port = key
+            session = TuyaLocalSession(tuya_id, address, local_key, version=version, port=port, timeout=self.timeout)
+            self._sessions[target.id] = (key, session)
+        if current is not None:
+            current[1].close()
+        return session
+
+    def reachable(self, target: TuyaDeviceTarget, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return self._down_until.get(target.id, 0.0) <= now
+
+    def _read(self, target: TuyaDeviceTarget) -> tuple[dict[str, float], float]:
+        started = time.perf_counter()
+        dps = self.session(target).status()
+        return map_tuya_status(dps, target.config.get("dps_map")), time.perf_counter() - started
+
+    def poll(self, targets: list[TuyaDeviceTarget]) -> tuple[PollCycleReport, dict[int, dict[str, float]]]:
+        report = PollCycleReport(started_at=datetime.utcnow(), polled=len(targets))
+        t0 = time.perf_counter()
+        results: dict[int, dict[str, float]] = {}
+        futures = [(t, self._executor.submit(self._read, t)) for t in targets]
+        for t, fut in futures:
+            try:
+                results[t.id], report.latencies[t.id] = fut.result()
+                self._down_until.pop(t.id, None)
+            except Exception as e:
+                report.failed += 1
+                report.errors[t.id] = str(e)
+                self._down_until[t.id] = time.monotonic() + self.retry_after
+        self.reads += len(targets)
+        self.failures += report.failed
+        report.duration_s = time.perf_counter() - t0
+        return report, results
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            sessions = len(self._sessions)
+        return {
+            "sessions": sessions,
+            "reads": self.reads,
+            "failures": self.failures,
+            "unreachable": sorted(i for i, until in self._down_until.items() if until > now),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            sessions = [s for _, s in self._sessions.values()]
+            self._sessions.clear()
+        for s in sessions:
+            s.close()
+
+
+class TuyaPoller:
+    """Lê primeiro pela LAN e completa pela nuvem (dispositivos sem modo local ou inacessíveis).
+
+    Com `mode: "local"` o dispositivo é sempre tentado pela LAN e nunca vai à nuvem.
+    """
+
+    def __init__(self, cloud: TuyaCloudPoller, local: TuyaLocalPoller):
+        self.cloud = cloud
+        self.local = local
+        self.cloud_fallbacks = 0
+
+    def poll(self, targets: list[TuyaDeviceTarget]) -> tuple[PollCycleReport, dict[int, dict[str, float]]]:
+        report = PollCycleReport(started_at=datetime.utcnow(), polled=len(targets))
+        t0 = time.perf_counter()
+        local = [t for t in targets if t.local_only or (t.local and self.local.reachable(t))]
+        local_ids = {t.id for t in local}
+        local_report, results = self.local.poll(local)
+
+        # nuvem: sem modo local, marcados como inacessíveis, ou que falharam agora na LAN
+        cloud = [t for t in targets if not t.local_only and (t.id not in local_ids or t.id in local_report.errors)]
+        fallback = [t for t in cloud if t.local]
+        no_account = {t.id for t in cloud if t.credentials is None}
+        cloud = [t for t in cloud if t.credentials is not None]
+        cloud_report, cloud_results = self.cloud.poll(cloud)
+        results.update(cloud_results)
+        self.cloud_fallbacks += sum(1 for t in fallback if t.id in cloud_results)
+
+        report.latencies.update(local_report.latencies)
+        report.latencies.update(cloud_report.latencies)
+        for t in targets:
+            if t.id in results:
+                continue
+            report.failed += 1
+            if t.local_only:
+                report.errors[t.id] = local_report.errors.get(t.id) or "dispositivo local sem resposta (mode: local, sem nuvem)"
+            elif t.id in cloud_report.errors:
+                report.errors[t.id] = cloud_report.errors[t.id]
+            elif t.id in no_account:
+                report.errors[t.id] = local_report.errors.get(t.id) or "dispositivo local inacessível e sem credenciais de nuvem"
+        report.duration_s = time.perf_counter() - t0
+        return report, results
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "accounts": self.cloud.stats(),
+            "local": self.local.stats(),
+            "cloud_fallbacks": self.cloud_fallbacks,
+        }
+
+    def shutdown(self):
+        self.local.shutdown()
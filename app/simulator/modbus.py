@@ -0,0 +1,402 @@
+"""Frota de medidores Modbus simulados para testes de carga do poller.
+
+Cada "gateway" simulado é um servidor pymodbus (Modbus TCP ou RTU sobre TCP) que
+responde por um ou mais slave IDs; cada slave é um `SimulatedMeter` (SDM630 ou
+PZEM-004T) cujos registradores são gerados no momento da leitura a partir de um
+perfil de carga que varia no tempo, com injeção solar opcional. As energias de
+importação/exportação são integradas a partir da potência líquida.
+
+Falhas de rede/dispositivo são injetadas por um proxy TCP na frente do servidor
+(`FaultProfile`): latência com jitter, respostas descartadas (timeout no cliente)
+e quadros de lixo.
+
+Tudo roda num event loop próprio em thread dedicada (`ModbusSimulator`):
+
+    sim = ModbusSimulator()
+    port = sim.add_gateway({1: SimulatedMeter("sdm630"), 2: SimulatedMeter("pzem004t")})
+    sim.start()
+    ...
+    sim.stop()
+"""
+from __future__ import annotations
+import asyncio
+import math
+import random
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+from pymodbus import Framer
+from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext
+from pymodbus.datastore.store import BaseModbusDataBlock
+from pymodbus.server import ModbusTcpServer
+from ..connectors.eastron_sdm630 import SDM630_MAP
+from ..connectors.pzem004t import PZEM004T_MAP
+from ..connectors.register_map import RegisterMap
+
+
+METER_MAPS: dict[str, RegisterMap] = {"sdm630": SDM630_MAP, "pzem004t": PZEM004T_MAP}
+REGISTER_SPACE = 0x200  # endereços servidos por slave (cobre o mapa completo do SDM630)
+
+
+def encode_registers(regmap: RegisterMap, values: dict[str, float], size: int = REGISTER_SPACE) -> list[int]:
+    """Inverso do `CompiledDecoder`: escreve os valores das métricas nos registradores do mapa."""
+    regs = [0] * size
+    for f in regmap.fields:
+        value = values.get(f.name, 0.0) / f.scale
+        if f.type == "float32":
+            hi, lo = struct.unpack(">HH", struct.pack(">f", value))
+        elif f.type in ("u32", "i32"):
+            raw = int(round(value)) & 0xFFFFFFFF
+            hi, lo = raw >> 16, raw & 0xFFFF
+        else:
+            regs[f.address] = int(round(value)) & 0xFFFF
+            continue
+        if f.word_order == "little":
+            hi, lo = lo, hi
+        regs[f.address], regs[f.address + 1] = hi, lo
+    return regs
+
+
+@dataclass
+class LoadProfile:
+    """Perfil diário de carga: base + picos de manhã/noite, menos a geração solar."""
+    base_w: float = 600.0
+    peak_w: float = 3500.0
+    solar_peak_w: float = 0.0
+    noise: float = 0.05
+    time_scale: float = 1.0  # segundos simulados por segundo real (ex: 3600 = 1 h/s)
+    phase_offset_h: float = 0.0
+
+    def net_power(self, sim_t: float, rng: random.Random) -> tuple[float, float]:
+        """(consumo, geração solar) em W no instante simulado `sim_t` (segundos desde meia-noite)."""
+        hour = (sim_t / 3600.0 + self.phase_offset_h) % 24.0
+        bumps = math.exp(-((hour - 7.5) ** 2) / 2.0) + 1.2 * math.exp(-((hour - 19.5) ** 2) / 3.0)
+        load = self.base_w + (self.peak_w - self.base_w) * min(1.0, bumps)
+        load *= 1.0 + rng.gauss(0.0, self.noise)
+        solar = self.solar_peak_w * max(0.0, math.sin(math.pi * (hour - 6.0) / 12.0)) if 6.0 <= hour <= 18.0 else 0.0
+        return max(0.0, load), solar
+
+
+class SimulatedMeter:
+    def __init__(self, kind: str = "sdm630", profile: LoadProfile | None = None, seed: int | None = None):
+        if kind not in METER_MAPS:
+            raise ValueError(f"medidor simulado inválido: {kind} (use {', '.join(METER_MAPS)})")
+        self.kind = kind
+        self.regmap = METER_MAPS[kind]
+        self.profile = profile or LoadProfile()
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.start_sim_t = self.rng.uniform(0, 86400)
+        self.last = self.started
+        self.import_kwh = self.rng.uniform(100, 5000)
+        self.export_kwh = 0.0
+        self.reads = 0
+
+    def values(self, now: float | None = None) -> dict[str, float]:
+        """Métricas instantâneas, integrando as energias desde a leitura anterior."""
+        now = time.monotonic() if now is None else now
+        sim_t = self.start_sim_t + (now - self.started) * self.profile.time_scale
+        load, solar = self.profile.net_power(sim_t, self.rng)
+        net = load - solar
+        dt_h = (now - self.last) * self.profile.time_scale / 3600.0
+        self.last = now
+        if net >= 0:
+            self.import_kwh += net * dt_h / 1000.0
+        else:
+            self.export_kwh += -net * dt_h / 1000.0
+        self.reads += 1
+
+        freq = 60.0 + self.rng.gauss(0.0, 0.02)
+        if self.kind == "pzem004t":
+            voltage = 220.0 + self.rng.gauss(0.0, 1.5)
+            power = max(0.0, net)
+            return {
+                "voltage": voltage,
+                "current": power / voltage,
+                "power": power,
+                "energy_wh": self.import_kwh * 1000.0,
+            }
+
+        out: dict[str, float] = {}
+        share = (0.36, 0.33, 0.31)
+        pf = 0.9 + 0.08 * self.rng.random()
+        for i, s in enumerate(share, start=1):
+            v = 127.0 + self.rng.gauss(0.0, 1.0)
+            p = net * s
+            va = abs(p) / pf
+            out[f"voltage_l{i}"] = v
+            out[f"current_l{i}"] = va / v
+            out[f"power_l{i}"] = p
+            out[f"apparent_power_l{i}"] = va
+            out[f"reactive_power_l{i}"] = math.sqrt(max(0.0, va * va - p * p))
+            out[f"power_factor_l{i}"] = pf if p >= 0 else -pf
+            out[f"thd_voltage_l{i}"] = 2.0 + self.rng.random()
+            out[f"thd_current_l{i}"] = 8.0 + 4.0 * self.rng.random()
+            out[f"energy_import_kwh_l{i}"] = self.import_kwh * s
+            out[f"energy_export_kwh_l{i}"] = self.export_kwh * s
+        out.update({
+            "power_total": net,
+            "apparent_power_total": abs(net) / pf,
+            "reactive_power_total": sum(out[f"reactive_power_l{i}"] for i in (1, 2, 3)),
+            "power_factor": pf if net >= 0 else -pf,
+            "frequency": freq,
+            "energy_import_kwh": self.import_kwh,
+            "energy_export_kwh": self.export_kwh,
+            "energy_total_kwh": self.import_kwh + self.export_kwh,
+            "voltage_l1_l2": out["voltage_l1"] * math.sqrt(3),
+            "voltage_l2_l3": out["voltage_l2"] * math.sqrt(3),
+            "voltage_l3_l1": out["voltage_l3"] * math.sqrt(3),
+            "current_neutral": abs(out["current_l1"] - out["current_l3"]),
+        })
+        return out
+
+    def registers(self) -> list[int]:
+        return encode_registers(self.regmap, self.values())
+
+
+class MeterDataBlock(BaseModbusDataBlock):
+    """Bloco de Input Registers que gera os valores do medidor a cada leitura."""
+
+    def __init__(self, meter: SimulatedMeter):
+        self.meter = meter
+        self.address = 0
+        self.default_value = 0
+        self.values = [0] * REGISTER_SPACE
+        self._stamp = 0.0
+
+    def validate(self, address, count=1):
+        return 0 <= address and address + count <= REGISTER_SPACE
+
+    def getValues(self, address, count=1):
+        # leituras em blocos consecutivos da mesma coleta usam o mesmo quadro
+        now = time.monotonic()
+        if now - self._stamp > 0.05:
+            self.values = self.meter.registers()
+            self._stamp = now
+        return self.values[address:address + count]
+
+    def setValues(self, address, values):
+        pass
+
+
+@dataclass
+class FaultProfile:
+    """Falhas injetadas por resposta: latência (+ jitter), descarte e lixo, com probabilidades."""
+    latency_s: float = 0.0
+    jitter_s: float = 0.0
+    timeout_rate: float = 0.0
+    garbage_rate: float = 0.0
+    seed: int | None = None
+    injected: dict[str, int] = field(default_factory=lambda: {"responses": 0, "dropped": 0, "garbage": 0})
+
+    @property
+    def active(self) -> bool:
+        return bool(self.latency_s or self.jitter_s or self.timeout_rate or self.garbage_rate)
+
+
+class _FaultProxy:
+    def __init__(self, upstream_port: int, faults: FaultProfile, host: str):
+        self.upstream_port = upstream_port
+        self.faults = faults
+        self.host = host
+        # semente por gateway: com a mesma semente todos os proxies sorteariam a mesma sequência
+        self.rng = random.Random(None if faults.seed is None else f"{faults.seed}:{upstream_port}")
+        self.writers: set[asyncio.StreamWriter] = set()
+        self.tasks: set[asyncio.Task] = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            up_reader, up_writer = await asyncio.open_connection(self.host, self.upstream_port)
+        except OSError:
+            writer.close()
+            return
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        self.writers.update((writer, up_writer))
+
+        async def client_to_server():
+            try:
+                while data := await reader.read(4096):
+                    up_writer.write(data)
+                    await up_writer.drain()
+            finally:
+                up_writer.close()
+
+        async def server_to_client():
+            f = self.faults
+            try:
+                while data := await up_reader.read(4096):
+                    f.injected["responses"] += 1
+                    delay = f.latency_s + (self.rng.uniform(0, f.jitter_s) if f.jitter_s else 0.0)
+                    if delay:
+                        await asyncio.sleep(delay)
+                    roll = self.rng.random()
+                    if roll < f.timeout_rate:
+                        f.injected["dropped"] += 1
+                        continue
+                    if roll < f.timeout_rate + f.garbage_rate:
+                        f.injected["garbage"] += 1
+                        data = bytes(self.rng.getrandbits(8) for _ in range(len(data)))
+                    writer.write(data)
+                    await writer.drain()
+            finally:
+                writer.close()
+
+        try:
+            await asyncio.gather(client_to_server(), server_to_client(), return_exceptions=True)
+        finally:
+            self.writers.difference_update((writer, up_writer))
+            self.tasks.discard(task)
+
+    async def close(self):
+        for w in list(self.writers):
+            w.close()
+        if self.tasks:
+            await asyncio.wait(list(self.tasks), timeout=2.0)
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+@dataclass
+class SimulatedGateway:
+    port: int
+    meters: dict[int, SimulatedMeter]
+    framer: str = "socket"
+    faults: FaultProfile | None = None
+    upstream_port: int | None = None
+
+
+class ModbusSimulator:
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.gateways: list[SimulatedGateway] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._servers: list[Any] = []
+        self._proxies: list[_FaultProxy] = []
+
+    def add_gateway(
+        self,
+        meters: dict[int, SimulatedMeter],
+        port: int | None = None,
+        framer: str = "socket",
+        faults: FaultProfile | None = None,
+    ) -> int:
+        """Registra um gateway (um servidor, vários slave IDs); retorna a porta que os clientes devem usar.
+
+        `framer`: `socket` (Modbus TCP) ou `rtu` (RTU sobre TCP). Com `faults`, a porta
+        devolvida é a do proxy de falhas, que encaminha para o servidor real.
+        """
+        gw = SimulatedGateway(port=port or self._free_port(), meters=meters, framer=framer, faults=faults)
+        if faults is not None and faults.active:
+            gw.upstream_port = self._free_port(exclude={gw.port})
+        self.gateways.append(gw)
+        return gw.port
+
+    def _free_port(self, exclude: set[int] = frozenset()) -> int:
+        # o SO pode devolver a mesma porta efêmera duas vezes antes dos servidores subirem
+        used = {p for gw in self.gateways for p in (gw.port, gw.upstream_port) if p} | set(exclude)
+        while (port := free_port(self.host)) in used:
+            pass
+        return port
+
+    def add_meters(
+        self,
+        count: int,
+        slaves_per_gateway: int = 1,
+        kind: str = "sdm630",
+        framer: str = "socket",
+        faults: FaultProfile | None = None,
+        solar_share: float = 0.3,
+        time_scale: float = 1.0,
+        seed: int = 0,
+    ) -> list[dict[str, Any]]:
+        """Cria `count` medidores em gateways de `slaves_per_gateway` slaves cada.
+
+        Retorna o `config` de dispositivo `modbus_tcp` de cada medidor, pronto para o poller.
+        Uma fração `solar_share` dos medidores tem geração solar (potência líquida negativa ao meio-dia).
+        """
+        rng = random.Random(seed)
+        configs = []
+        for start in range(0, count, slaves_per_gateway):
+            meters = {}
+            for slave_id in range(1, min(slaves_per_gateway, count - start) + 1):
+                profile = LoadProfile(
+                    base_w=rng.uniform(200, 1200),
+                    peak_w=rng.uniform(2000, 8000),
+                    solar_peak_w=rng.uniform(2000, 6000) if rng.random() < solar_share else 0.0,
+                    time_scale=time_scale,
+                )
+                meters[slave_id] = SimulatedMeter(kind, profile, seed=rng.getrandbits(32))
+            port = self.add_gateway(meters, framer=framer, faults=faults)
+            for slave_id in meters:
+                configs.append({
+                    "host": self.host,
+                    "port": port,
+                    "slave_id": slave_id,
+                    "driver": kind,
+                    "framer": framer,
+                })
+        return configs
+
+    async def _start_all(self):
+        for gw in self.gateways:
+            slaves = {sid: ModbusSlaveContext(ir=MeterDataBlock(m), zero_mode=True) for sid, m in gw.meters.items()}
+            listen = gw.upstream_port or gw.port
+            server = ModbusTcpServer(
+                ModbusServerContext(slaves=slaves, single=False),
+                framer=Framer(gw.framer),
+                address=(self.host, listen),
+            )
+            await server.listen()
+            self._servers.append(server)
+            if gw.upstream_port:
+                proxy = _FaultProxy(gw.upstream_port, gw.faults, self.host)
+                self._proxies.append(proxy)
+                self._servers.append(await asyncio.start_server(proxy.handle, self.host, gw.port))
+
+    def start(self, timeout: float = 60.0):
+        """Sobe todos os gateways registrados numa thread com event loop próprio."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="modbus-simulator", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_all(), self._loop).result(timeout)
+
+    async def _stop_all(self):
+        for server in self._servers:
+            if isinstance(server, asyncio.AbstractServer):
+                server.close()
+            else:
+                await server.shutdown()
+        self._servers.clear()
+        for proxy in self._proxies:
+            await proxy.close()
+        self._proxies.clear()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._stop_all(), self._loop).result(10)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+            self._loop = None
+
+    def stats(self) -> dict[str, Any]:
+        meters = [m for gw in self.gateways for m in gw.meters.values()]
+        # o mesmo FaultProfile pode servir a vários gateways: contar cada perfil uma vez
+        faults = list({id(gw.faults): gw.faults.injected for gw in self.gateways if gw.faults is not None and gw.upstream_port}.values())
+        return {
+            "gateways": len(self.gateways),
+            "meters": len(meters),
+            "meter_reads": sum(m.reads for m in meters),
+            "faults": {k: sum(f[k] for f in faults) for k in ("responses", "dropped", "garbage")} if faults else None,
+        }
@@ -0,0 +1,97 @@
+"""Tomada Tuya simulada que fala o protocolo LAN (3.3) num socket TCP.
+
+Serve para testar o modo local (`TuyaLocalSession`/`TuyaLocalPoller`) sem
+hardware: responde às consultas de status (DP_QUERY) com DPS de uma tomada de
+medição (tensão, corrente, potência e energia), com carga variando no tempo.
+"""
+from __future__ import annotations
+import json
+import math
+import socketserver
+import struct
+import threading
+import time
+from typing import Any
+import tinytuya
+from tinytuya import AESCipher, TuyaMessage, pack_message, unpack_message
+
+
+PREFIX_55AA = b"\x00\x00\x55\xaa"
+HEADER_LEN = 16  # prefixo, seqno, comando, tamanho
+
+
+def _frame(request: TuyaMessage, payload: bytes) -> bytes:
+    # respostas do dispositivo levam o retcode (4 bytes) antes do payload
+    return pack_message(TuyaMessage(request.seqno, request.cmd, 0, struct.pack(">I", 0) + payload, 0, True, 0x55AA, None))
+
+
+class FakeTuyaPlug:
+    def __init__(self, tuya_id: str, local_key: str, base_power_w: float = 100.0, latency_s: float = 0.0):
+        self.tuya_id = tuya_id
+        self.local_key = local_key
+        self.base_power_w = base_power_w
+        self.latency_s = latency_s
+        self.queries = 0
+        self.started = time.monotonic()
+
+    def dps(self) -> dict[str, Any]:
+        t = time.monotonic() - self.started
+        power = self.base_power_w * (1.0 + 0.2 * math.sin(t / 10.0))
+        voltage = 220.0 + 2.0 * math.sin(t / 7.0)
+        return {
+            "1": True,
+            "17": int(t / 36.0 * self.base_power_w / 100.0),  # add_ele: 0,001 kWh
+            "18": int(power / voltage * 1000),  # mA
+            "19": int(power * 10),  # 0,1 W
+            "20": int(voltage * 10),  # 0,1 V
+        }
+
+    def reply(self, request: TuyaMessage) -> bytes:
+        self.queries += 1
+        payload = json.dumps({"devId": self.tuya_id, "dps": self.dps()}).encode()
+        encrypted = AESCipher(self.local_key.encode("latin1")).encrypt(payload, use_base64=False)
+        return _frame(request, encrypted)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        plug: FakeTuyaPlug = self.server.plug
+        buf = b""
+        while True:
+            try:
+                chunk = self.request.recv(4096)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buf += chunk
+            while len(buf) >= HEADER_LEN:
+                start = buf.find(PREFIX_55AA)
+                if start < 0:
+                    buf = b""
+                    break
+                buf = buf[start:]
+                (length,) = struct.unpack(">I", buf[12:16])
+                if len(buf) < HEADER_LEN + length:
+                    break
+                frame, buf = buf[:HEADER_LEN + length], buf[HEADER_LEN + length:]
+                msg = unpack_message(frame, no_retcode=True)
+                if msg.cmd in (tinytuya.DP_QUERY, tinytuya.CONTROL_NEW, tinytuya.DP_QUERY_NEW):
+                    if plug.latency_s:
+                        time.sleep(plug.latency_s)
+                    self.request.sendall(plug.reply(msg))
+                elif msg.cmd == tinytuya.HEART_BEAT:
+                    self.request.sendall(_frame(msg, b""))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_fake_plug(plug: FakeTuyaPlug, host: str = "127.0.0.1", port: int = 0) -> tuple[socketserver.ThreadingTCPServer, int]:
+    """Sobe a tomada simulada numa thread; retorna o servidor e a porta efetiva."""
+    server = _Server((host, port), _Handler)
+    server.plug = plug
+    threading.Thread(target=server.serve_forever, name=f"fake-tuya-{plug.tuya_id}", daemon=True).start()
+    return server, server.server_address[1]
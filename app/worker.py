@@ -0,0 +1,105 @@
+"""
+Worker de coleta standalone: roda os pollers fora do processo da API.
+
+Vários workers (processos ou máquinas) dividem os dispositivos entre si por
+leases no banco (`app/services/leases.py`): cada um lê só os seus, renova o
+heartbeat a cada WORKER_REBALANCE_INTERVAL e, se um worker morre, os demais
+assumem os dispositivos dele após WORKER_LEASE_TTL.
+
+Uso:
+    python -m app.worker                 # um worker
+    python -m app.worker --processes 4   # quatro processos nesta máquina
+"""
+from __future__ import annotations
+import argparse
+import logging
+import multiprocessing as mp
+import signal
+import threading
+from .core.config import settings
+from .core.db import engine, init_db
+from .services.device_registry import registry
+from .services.leases import LeaseManager
+from .services.partitions import partitions
+from .services.cold_tier import cold_tier
+from .services.energy import energy
+from .services.rollups import rollups
+from .services.pollers import device_dispatchers, schedulable_devices, shutdown_pollers, worker_status
+from .services.scheduler import PollingScheduler, ScheduledDevice
+
+
+logger = logging.getLogger("pieng.audit")
+
+
+def run(worker_id: str | None = None):
+    init_db()
+    # alterações de dispositivos feitas pela API (outro processo) chegam pela recarga periódica
+    registry.resync_seconds = settings.worker_registry_resync
+    # breakers, agenda e conexões vão ao banco a cada heartbeat: a API (que não coleta) serve esses dados
+    leases = LeaseManager(worker_id, ttl=settings.worker_lease_ttl, status=lambda: worker_status(scheduler))
+    scheduler = PollingScheduler(
+        timezone=settings.scheduler_timezone,
+        jitter=settings.poll_jitter,
+        dispatch_workers=settings.poll_dispatch_workers,
+        overlap_policy=settings.poll_overlap_policy,
+    )
+
+    def owned_devices() -> list[ScheduledDevice]:
+        devices = schedulable_devices()
+        try:
+            owned = leases.rebalance(d.device_id for d in devices)
+        except Exception:
+            logger.exception(f"WORKER_LEASE_ERROR | worker={leases.worker_id}")
+            if leases.expired:
+                # sem renovar dentro do TTL outro worker pode ter assumido: para de ler tudo
+                return []
+            raise
+        return [d for d in devices if d.device_id in owned]
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    scheduler.schedule_devices(owned_devices, device_dispatchers(), refresh_seconds=settings.worker_rebalance_interval)
+    partitions.schedule_retention(scheduler, engine)  # DROP TABLE IF EXISTS: vários workers não conflitam
+    rollups.schedule(scheduler, engine, settings.rollup_refresh_interval, owns=leases.owns)  # cada trecho pendente é de um worker só
+    energy.schedule(scheduler, engine, settings.energy_refresh_interval, owns=leases.owns)
+    cold_tier.schedule(scheduler, engine, settings.cold_tier_interval, devices=lambda: set(leases.owned))  # cada worker move só os seus dispositivos
+    scheduler.start()
+    logger.info(f"WORKER_START | worker={leases.worker_id} | devices={len(leases.owned)}")
+    print(f"Worker {leases.worker_id}: {len(leases.owned)} dispositivos")
+    try:
+        while not stop.wait(60.0):
+            stats = leases.stats()
+            logger.info(f"WORKER_STATUS | worker={stats['worker_id']} | devices={stats['devices']} | live_workers={stats['live_workers']}")
+    finally:
+        scheduler.shutdown()
+        shutdown_pollers()
+        leases.release_all()
+        logger.info(f"WORKER_STOP | worker={leases.worker_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-id", default=None, help="identificador do worker (padrão: host-pid-aleatório)")
+    parser.add_argument("--processes", type=int, default=1, help="workers a iniciar nesta máquina")
+    args = parser.parse_args()
+    if args.processes <= 1:
+        run(args.worker_id)
+        return
+    procs = [
+        mp.Process(target=run, args=(f"{args.worker_id}-{i}" if args.worker_id else None,), name=f"poller-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark da camada fria: varredura de um ano de uma métrica, quente x fria
+Grava um ano de leituras de um medidor, mede a leitura do ano inteiro de uma
+métrica com `crud.measurement_arrays` e `crud.measurement_series` nas linhas
+quentes, move os meses fechados para segmentos (`cold_tier.tier`) e repete as
+leituras, agora fatias dos arquivos mapeados em memória.
+
+Uso:
+    python benchmark_cold_tier.py                        # 365 dias a cada 60 s
+    python benchmark_cold_tier.py --days 365 --interval 30 --profile timeseries
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.core.config import settings
+from app.core.db import init_db, make_engine
+from app.services.cold_tier import cold_tier
+
+METRICS = ["voltage_l1", "current_l1", "power_total", "energy_import"]
+
+
+def timed(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--interval", type=int, default=60, help="segundos entre leituras")
+    parser.add_argument("--profile", default="default", choices=["default", "timeseries"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-cold-")
+    engine = make_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}", args.profile)
+    init_db(engine, args.profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    settings.measurement_layout = "rows"
+    settings.rollups_enabled = False
+    cold_tier.root, cold_tier.after_days = Path(tmpdir) / "cold", 1
+    rng = random.Random(5)
+    db = Session()
+    try:
+        client = models.Client(name="bench")
+        db.add(client)
+        db.flush()
+        device = models.Device(client_id=client.id, name="sdm", device_type="modbus_tcp", config={})
+        db.add(device)
+        db.commit()
+        device_id = device.id
+
+        start = datetime(2023, 1, 1)
+        n = args.days * 86400 // args.interval
+        t0 = time.perf_counter()
+        energy_kwh = 0.0
+        batch = []
+        for k in range(n):
+            ts = start + timedelta(seconds=k * args.interval)
+            energy_kwh += rng.uniform(0, 0.05)
+            batch += [(device_id, m, ts, energy_kwh if m == "energy_import" else rng.uniform(0, 400)) for m in METRICS]
+            if len(batch) >= 20_000:
+                crud.create_measurements_bulk(db, batch)
+                batch = []
+        if batch:
+            crud.create_measurements_bulk(db, batch)
+        print(f"{n * len(METRICS):,} medições ({args.days} dias a cada {args.interval} s, {len(METRICS)} métricas) em {time.perf_counter() - t0:.1f} s")
+
+        end = start + timedelta(days=args.days)
+        scans = {
+            "measurement_arrays": lambda: crud.measurement_arrays(db, device_id, "voltage_l1", start, end),
+            "measurement_series": lambda: crud.measurement_series(db, device_id, ["voltage_l1"], start, end),
+        }
+        hot = {name: timed(fn, args.repeat) for name, fn in scans.items()}
+
+        t0 = time.perf_counter()
+        moved = cold_tier.tier(engine, now=end + timedelta(days=40))
+        db.expire_all()
+        elapsed = time.perf_counter() - t0
+        size = sum(f.stat().st_size for f in cold_tier.root.rglob("*.npy"))
+        print(f"tiering: {moved:,} linhas em {elapsed:.1f} s -> {size / 2**20:.1f} MiB em segmentos")
+
+        points = len(scans["measurement_arrays"]()[0])
+        print(f"ano inteiro de uma métrica ({points:,} pontos):")
+        for name, fn in scans.items():
+            cold = timed(fn, args.repeat)
+            print(f"  {name:>19}: quente {hot[name] * 1000:8.1f} ms  fria {cold * 1000:8.1f} ms  ({hot[name] / cold:.1f}x)")
+    finally:
+        db.close()
+        engine.dispose()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark do envio ao Google Drive: CSV diário regravado x spool em segmentos gzip
+Usa um Drive falso em memória (mesma interface `files().list/get_media/create/update`
+do googleapiclient) que conta requisições e bytes. Compara, para as medições de um dia:
+
+- o caminho antigo de `save_measurement` (listar a pasta, baixar o CSV do dia,
+  acrescentar uma linha e subir o arquivo inteiro a cada medição), medido nas
+  primeiras `--legacy-rows` linhas e extrapolado (bytes crescem com o quadrado);
+- o `DriveSpool`: custo do `append` no caminho quente e requisições/bytes dos
+  segmentos .csv.gz enviados por upload retomável.
+
+Uso:
+    python benchmark_drive_spool.py                          # 1 medidor, 16 métricas a cada 30 s
+    python benchmark_drive_spool.py --meters 10 --legacy-rows 1000
+"""
+import argparse
+import io
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from app.connectors.google_drive import GoogleDriveStorage
+from app.services.drive_spool import DriveSpool
+from benchmark_bulk_insert import SDM630_METRICS
+
+
+class _Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class _Upload:
+    """Upload retomável: um `next_chunk` por pedaço de `chunksize` bytes."""
+
+    def __init__(self, drive, name, media):
+        self.drive, self.name, self.media, self.pos, self.buf = drive, name, media, 0, b""
+
+    def next_chunk(self, num_retries=0):
+        chunk = self.media.getbytes(self.pos, self.media.chunksize())
+        self.buf += chunk
+        self.pos += len(chunk)
+        self.drive.count(len(chunk), 0)
+        if self.pos < self.media.size():
+            return None, None
+        return None, {"id": self.drive.put(self.name, self.buf)}
+
+
+class FakeDrive:
+    def __init__(self):
+        self.files_by_id: dict[str, tuple[str, bytes]] = {}
+        self.requests = self.sent = self.received = 0
+
+    def count(self, sent: int, received: int):
+        self.requests += 1
+        self.sent += sent
+        self.received += received
+
+    def put(self, name: str, data: bytes, file_id: str | None = None) -> str:
+        file_id = file_id or f"f{len(self.files_by_id)}"
+        self.files_by_id[file_id] = (name, data)
+        return file_id
+
+    def files(self):
+        drive = self
+
+        class Files:
+            def list(self, q, **kwargs):
+                names = [part.split("'")[1] for part in q.split(" and ") if part.startswith("name")]
+                exact = "name = " in q
+
+                def run():
+                    drive.count(0, 0)
+                    hits = [
+                        {"id": i, "name": n} for i, (n, _) in drive.files_by_id.items()
+                        if (n == names[0] if exact else n.startswith(names[0]))
+                    ]
+                    return {"files": hits}
+                return _Request(run)
+
+            def get_media(self, fileId):
+                def run():
+                    data = drive.files_by_id[fileId][1]
+                    drive.count(0, len(data))
+                    return data
+                return _Request(run)
+
+            def create(self, body, media_body, fields=None):
+                if hasattr(media_body, "chunksize"):
+                    return _Upload(drive, body["name"], media_body)
+                def run():
+                    data = media_body.getvalue()
+                    drive.count(len(data), 0)
+                    return {"id": drive.put(body["name"], data)}
+                return _Request(run)
+
+            def update(self, fileId, media_body):
+                def run():
+                    data = media_body.getvalue()
+                    drive.count(len(data), 0)
+                    drive.put(drive.files_by_id[fileId][0], data, fileId)
+                    return {"id": fileId}
+                return _Request(run)
+        return Files()
+
+
+def legacy_save(drive: FakeDrive, device_id: int, metric: str, value: float, timestamp: datetime):
+    """Caminho antigo de `GoogleDriveStorage.save_measurement`."""
+    data = {"device_id": device_id, "metric": metric, "value": value, "timestamp": timestamp.isoformat()}
+    filename = f"measurements_{timestamp.strftime('%Y-%m-%d')}.csv"
+    files = drive.files().list(q=f"name='{filename}' and 'F' in parents").execute()["files"]
+    if files:
+        existing = pd.read_csv(io.BytesIO(drive.files().get_media(fileId=files[0]["id"]).execute()))
+        combined = pd.concat([existing, pd.DataFrame([data])], ignore_index=True)
+        drive.files().update(fileId=files[0]["id"], media_body=io.BytesIO(combined.to_csv(index=False).encode())).execute()
+    else:
+        drive.files().create(body={"name": filename}, media_body=io.BytesIO(pd.DataFrame([data]).to_csv(index=False).encode())).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, default=1)
+    parser.add_argument("--interval", type=int, default=30, help="segundos entre leituras")
+    parser.add_argument("--legacy-rows", type=int, default=2000, help="linhas medidas no caminho antigo")
+    parser.add_argument("--segment-rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1)
+    rows = [
+        (device_id, metric, 230.0 + (k % 97) / 10, start + timedelta(seconds=k * args.interval))
+        for k in range(86400 // args.interval)
+        for device_id in range(1, args.meters + 1)
+        for metric in SDM630_METRICS
+    ]
+    n = len(rows)
+    print(f"{n:,} medições em um dia ({args.meters} medidores x {len(SDM630_METRICS)} métricas a cada {args.interval} s)")
+
+    legacy = FakeDrive()
+    m = min(args.legacy_rows, n)
+    t0 = time.perf_counter()
+    for row in rows[:m]:
+        legacy_save(legacy, *row)
+    elapsed = time.perf_counter() - t0
+    # bytes por chamada crescem linearmente com a linha k: total ~ (n/m)^2 do medido
+    scale = (n / m) ** 2
+    print(f"CSV diário regravado ({m:,} primeiras linhas): {elapsed / m * 1e3:.1f} ms/medição (sem rede), "
+          f"{legacy.requests / m:.0f} requisições/medição, {(legacy.sent + legacy.received) / 2**20:.1f} MiB trafegados")
+    print(f"  dia inteiro (extrapolado): {legacy.requests / m * n:,.0f} requisições, "
+          f"{(legacy.sent + legacy.received) * scale / 2**30:,.1f} GiB trafegados")
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-spool-")
+    try:
+        drive = FakeDrive()
+        spool = DriveSpool(
+            tmpdir, segment_rows=args.segment_rows, segment_age=3600, upload_interval=3600,
+            storage_factory=lambda: GoogleDriveStorage(service=drive, folder_id="F"),
+        )
+        t0 = time.perf_counter()
+        for row in rows:
+            spool.append(*row)
+        hot = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        spool.flush()
+        upload = time.perf_counter() - t0
+        spool.shutdown()
+        st = spool.stats()
+        print(f"spool: append {hot / n * 1e6:.1f} µs/medição; {st['uploaded']} segmentos (último flush {upload:.2f} s), "
+              f"{drive.requests} requisições, {drive.sent / 2**20:.2f} MiB enviados "
+              f"(gzip {st['compression_ratio']:.1f}x sobre {spool.raw_bytes / 2**20:.2f} MiB de CSV)")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark do codec Gorilla: espaço no banco e leitura da camada fria comprimida
+Grava leituras simuladas de SDM630 (16 métricas, valores de registradores float32 em
+passeio aleatório, ~40% repetidos como com deadband, a cada 30 s com jitter de
+milissegundos) num SQLite e mede:
+
+- compressão por métrica (`gorilla.report`) sobre 16 bytes/ponto (int64 + float64);
+- tamanho do banco (VACUUM) com as linhas em `measurements` e depois de mover o mês
+  para a camada fria com COLD_TIER_FORMAT=gorilla;
+- codificação/decodificação (milhões de pontos/s) e a latência de consultas de
+  painel (`crud.measurement_series`, 1 dia e o mês inteiro) quente x fria.
+
+Uso:
+    python benchmark_gorilla.py                       # 4 medidores, 10 dias
+    python benchmark_gorilla.py --meters 10 --days 28
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.core.config import settings
+from app.core.db import init_db, make_engine
+from app.services import gorilla
+from app.services.cold_tier import cold_tier
+from benchmark_bulk_insert import SDM630_METRICS
+
+LEVEL = {"voltage": 230.0, "current": 12.0, "power": 2500.0, "frequency": 60.0, "power_factor": 0.92}
+
+
+def series(rng, metric: str, n: int) -> np.ndarray:
+    """Passeio aleatório quantizado em float32; contadores só crescem."""
+    if "energy" in metric:
+        return np.cumsum(rng.uniform(0, 0.02, n)).astype(np.float32).astype(float) + 1000
+    level = next((v for k, v in LEVEL.items() if metric.startswith(k)), 5.0)
+    walk = level * (1 + np.cumsum(rng.normal(0, 0.001, n)))
+    walk[rng.random(n) < 0.4] = np.nan  # deadband: mantém o valor anterior
+    walk = np.asarray(pd_ffill(walk))
+    return walk.astype(np.float32).astype(float)
+
+
+def pd_ffill(x: np.ndarray) -> np.ndarray:
+    idx = np.where(np.isnan(x), 0, np.arange(len(x)))
+    np.maximum.accumulate(idx, out=idx)
+    out = x[idx]
+    out[np.isnan(out)] = x[~np.isnan(x)][0]
+    return out
+
+
+def db_size(engine) -> int:
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar()
+
+
+def timed(fn, repeat: int = 5) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, default=4)
+    parser.add_argument("--days", type=int, default=10, help="dias de janeiro (até 31)")
+    parser.add_argument("--interval", type=int, default=30)
+    parser.add_argument("--profile", default="default", choices=["default", "timeseries"])
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-gorilla-")
+    engine = make_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}", args.profile)
+    init_db(engine, args.profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    settings.measurement_layout = "rows"
+    settings.rollups_enabled = False
+    cold_tier.after_days, cold_tier.format = 1, "gorilla"
+    rng = np.random.default_rng(3)
+    db = Session()
+    try:
+        client = models.Client(name="bench")
+        db.add(client)
+        db.flush()
+        devices = [models.Device(client_id=client.id, name=f"sdm-{i}", device_type="modbus_tcp", config={}) for i in range(args.meters)]
+        db.add_all(devices)
+        db.commit()
+        device_ids = [d.id for d in devices]
+
+        start = datetime(2024, 1, 1)
+        n = min(args.days, 31) * 86400 // args.interval
+        offsets = np.arange(n) * args.interval * 1_000_000 + rng.integers(0, 80_000, n)  # µs, jitter de coleta
+        times = [start + timedelta(microseconds=int(us)) for us in offsets]
+        t0 = time.perf_counter()
+        for device_id in device_ids:
+            values = {m: series(rng, m, n) for m in SDM630_METRICS}
+            for i in range(0, n, 1000):
+                crud.create_measurements_bulk(db, [
+                    (device_id, m, times[k], values[m][k]) for k in range(i, min(i + 1000, n)) for m in SDM630_METRICS
+                ])
+        rows = n * len(SDM630_METRICS) * args.meters
+        print(f"{rows:,} medições ({args.meters} medidores x {len(SDM630_METRICS)} métricas, {n * args.interval / 86400:g} dias a cada {args.interval} s) em {time.perf_counter() - t0:.0f} s")
+
+        report = gorilla.report(db, device_ids[:1], start, start + timedelta(days=31))
+        print(f"compressão (medidor {device_ids[0]}):")
+        for r in report:
+            print(f"  {r['metric']:<20} {r['bits_per_point']:5.1f} bits/ponto  {r['ratio']:5.1f}x")
+        points, size = sum(r["points"] for r in report), sum(r["bytes"] for r in report)
+        print(f"  {'total':<20} {8 * size / points:5.1f} bits/ponto  {16 * points / size:5.1f}x sobre 16 B/ponto")
+
+        ts, vals = crud.measurement_arrays(db, device_ids[0], "voltage_l1", start, start + timedelta(days=31))
+        ts = ts.view(np.int64)
+        enc = timed(lambda: gorilla.encode_blocks(ts, vals), 3)
+        blobs = gorilla.encode_blocks(ts, vals)
+        dec = timed(lambda: gorilla.decode_blocks(blobs), 3)
+        print(f"codec: codifica {len(ts) / enc / 1e6:.1f} M pontos/s, decodifica {len(ts) / dec / 1e6:.1f} M pontos/s")
+
+        day = (start + timedelta(days=3), start + timedelta(days=4))
+        month = (start, start + timedelta(days=31))
+        queries = {
+            "1 dia, 16 métricas": lambda: crud.measurement_series(db, device_ids[0], SDM630_METRICS, *day),
+            "mês, 1 métrica": lambda: crud.measurement_series(db, device_ids[0], ["voltage_l1"], *month),
+        }
+        hot = {name: timed(fn) for name, fn in queries.items()}
+        db.close()
+
+        before = db_size(engine)
+        t0 = time.perf_counter()
+        moved = cold_tier.tier(engine, now=datetime(2024, 3, 1))
+        elapsed = time.perf_counter() - t0
+        after = db_size(engine)
+        print(f"banco: {before / 2**20:.1f} MiB ({before / rows:.0f} B/medição) -> {after / 2**20:.1f} MiB "
+              f"({after / rows:.1f} B/medição) depois de mover {moved:,} linhas em {elapsed:.0f} s: {before / after:.1f}x menor")
+
+        db = Session()
+        print("consultas de painel (p50, cache de blocos frio):")
+        for name, fn in queries.items():
+            def cold_read(fn=fn):
+                cold_tier._cache.clear()
+                fn()
+            cold = timed(cold_read)
+            print(f"  {name:<20}: quente {hot[name] * 1000:7.1f} ms  gorilla {cold * 1000:7.1f} ms")
+    finally:
+        db.close()
+        engine.dispose()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
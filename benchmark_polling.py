@@ -0,0 +1,113 @@
+"""
+Benchmark do poller Modbus TCP contra uma frota simulada
+Sobe N medidores simulados (app/simulator/modbus.py) num processo separado,
+agrupados em gateways de S slaves, e mede ciclos completos de coleta do
+AsyncModbusTCPPoller: duração do ciclo, leituras/s, latência por medidor e falhas.
+As leituras passam pelo filtro de deadband dos pollers (report-by-exception), e
+o resumo mostra quantos valores seriam gravados no banco.
+
+Uso:
+    python benchmark_polling.py --meters 1000 --slaves 10 --cycles 3
+    python benchmark_polling.py --meters 1000 --slaves 1 --latency 0.02 --timeout-rate 0.01 --garbage-rate 0.01
+    python benchmark_polling.py --meters 500 --framer rtu --kind pzem004t
+"""
+import argparse
+import multiprocessing as mp
+import time
+from app.services.async_poller import AsyncModbusTCPPoller, TCPDeviceTarget
+from app.services.deadband import DeadbandFilter
+
+
+def run_simulator(args, conn):
+    from app.simulator.modbus import ModbusSimulator, FaultProfile
+    faults = FaultProfile(
+        latency_s=args.latency,
+        jitter_s=args.jitter,
+        timeout_rate=args.timeout_rate,
+        garbage_rate=args.garbage_rate,
+        seed=42,
+    )
+    sim = ModbusSimulator()
+    configs = sim.add_meters(
+        args.meters,
+        slaves_per_gateway=args.slaves,
+        kind=args.kind,
+        framer=args.framer,
+        faults=faults if faults.active else None,
+        time_scale=args.time_scale,
+    )
+    sim.start()
+    conn.send(configs)
+    conn.recv()  # aguarda o fim do benchmark
+    conn.send(sim.stats())
+    sim.stop()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, default=1000)
+    parser.add_argument("--slaves", type=int, default=10, help="slaves por gateway (EW11)")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--kind", default="sdm630", choices=["sdm630", "pzem004t"])
+    parser.add_argument("--framer", default="socket", choices=["socket", "rtu"])
+    parser.add_argument("--concurrency", type=int, default=200, help="leituras simultâneas no poller")
+    parser.add_argument("--per-gateway", type=int, default=1, help="transações simultâneas por gateway")
+    parser.add_argument("--timeout", type=float, default=1.0, help="timeout por requisição (s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="latência injetada por resposta (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fração de respostas descartadas")
+    parser.add_argument("--garbage-rate", type=float, default=0.0, help="fração de respostas com lixo")
+    parser.add_argument("--time-scale", type=float, default=60.0, help="segundos simulados por segundo real")
+    parser.add_argument("--max-silence", type=float, default=300.0, help="heartbeat do deadband (s simulados)")
+    args = parser.parse_args()
+
+    parent, child = mp.Pipe()
+    proc = mp.Process(target=run_simulator, args=(args, child), daemon=True)
+    proc.start()
+    configs = parent.recv()
+    gateways = len({c["port"] for c in configs})
+    print(f"Simulador: {len(configs)} medidores {args.kind} em {gateways} gateways ({args.framer})")
+
+    targets = [
+        TCPDeviceTarget(id=i + 1, name=f"sim-{i + 1}", config={**c, "timeout": args.timeout})
+        for i, c in enumerate(configs)
+    ]
+    poller = AsyncModbusTCPPoller(max_concurrency=args.concurrency, per_gateway_concurrency=args.per_gateway)
+    deadband = DeadbandFilter(max_silence=args.max_silence)
+    try:
+        for cycle in range(1, args.cycles + 1):
+            t0 = time.perf_counter()
+            report, results = poller.run_cycle(targets)
+            elapsed = time.perf_counter() - t0
+            sim_now = time.monotonic() * args.time_scale  # relógio simulado, o mesmo dos medidores
+            for device_id, values in results.items():
+                deadband.commit(device_id, deadband.filter(device_id, values, now=sim_now), now=sim_now)
+            lat = list(report.latencies.values())
+            print(
+                f"ciclo {cycle}: {report.succeeded}/{report.polled} ok em {elapsed:.2f}s"
+                f" ({report.succeeded / elapsed:.0f} medidores/s)"
+                f" | latência p50 {percentile(lat, 0.5) * 1000:.1f} ms p95 {percentile(lat, 0.95) * 1000:.1f} ms"
+                f" | falhas {report.failed}"
+            )
+        stats = poller.pool_stats()
+        print(f"Pool: {len(stats)} conexões, reconexões {sum(s['reconnects'] for s in stats)},"
+              f" erros {sum(s['request_errors'] for s in stats)}")
+        db = deadband.stats()
+        print(f"Deadband: {db['values_stored']}/{db['values_seen']} valores gravados"
+              f" (redução {db['reduction'] * 100:.1f}%, heartbeat {args.max_silence:.0f}s simulados)")
+    finally:
+        poller.shutdown()
+        parent.send("fim")
+        print(f"Simulador: {parent.recv()}")
+        proc.join(10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark de rollups: timerange/demand lendo medições brutas x rollups
+Grava uma métrica de um medidor a cada 30 s por N dias, processa os rollups e
+mede o tempo de `rollups.resample` (o que `/api/metrics/timerange` e `/demand`
+chamam) com os rollups desligados (só medições brutas) e ligados, conferindo
+que o resultado é o mesmo.
+
+Uso:
+    python benchmark_rollups.py               # 90 dias
+    python benchmark_rollups.py --days 365
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.core.db import init_db, make_engine
+from app.services.rollups import rollups
+
+
+# período do timerange -> frequência (como em routers/metrics.py)
+PERIODS = [("1d", timedelta(days=1), "15min"), ("1w", timedelta(weeks=1), "1h"), ("1m", timedelta(days=30), "6h"), ("1y", timedelta(days=365), "1D")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--interval", type=int, default=30, help="segundos entre leituras")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-rollups-")
+    try:
+        engine = make_engine(f"sqlite:///{os.path.join(tmpdir, 'rollups.db')}")
+        init_db(engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        rng = random.Random(5)
+        db = Session()
+        client = models.Client(name="bench")
+        db.add(client)
+        db.flush()
+        device = models.Device(client_id=client.id, name="sdm", device_type="modbus_tcp", config={})
+        db.add(device)
+        db.commit()
+        device_id = device.id
+
+        end = datetime(2024, 1, 1) + timedelta(days=args.days)
+        steps = args.days * 86400 // args.interval
+        t0 = time.perf_counter()
+        for k in range(0, steps, 2880):
+            crud.create_measurements_bulk(db, [
+                (device_id, "power_total", end - timedelta(days=args.days) + timedelta(seconds=s * args.interval), rng.uniform(0, 5000))
+                for s in range(k, min(k + 2880, steps))
+            ])
+        write_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        buckets = rollups.refresh(engine, now=end + timedelta(hours=1), time_budget=None)
+        print(f"{steps:,} medições em {write_s:.1f}s; rollups: {buckets:,} intervalos em {time.perf_counter() - t0:.1f}s")
+
+        for label, span, freq in PERIODS:
+            start = max(end - span, end - timedelta(days=args.days))
+            timings = {}
+            frames = {}
+            for enabled in (False, True):
+                rollups.enabled = enabled
+                t0 = time.perf_counter()
+                for _ in range(args.repeat):
+                    frames[enabled] = rollups.resample(db, device_id, "power_total", freq, start, end)
+                timings[enabled] = (time.perf_counter() - t0) / args.repeat
+            pd.testing.assert_frame_equal(frames[False], frames[True], check_dtype=False, rtol=1e-9)
+            print(
+                f"  {label:>3} ({freq:>5}): brutas {timings[False] * 1000:8.1f} ms  rollups {timings[True] * 1000:7.1f} ms"
+                f"  ({timings[False] / timings[True]:.0f}x, {len(frames[True])} intervalos, iguais)"
+            )
+        db.close()
+        engine.dispose()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
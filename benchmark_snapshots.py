@@ -0,0 +1,104 @@
+"""
+Benchmark dos layouts de medição: linhas (EAV) x snapshots
+Grava a mesma frota de SDM630 (16 métricas a cada 30 s) em dois bancos, um por
+layout, e compara o espaço em disco (tabela e índices, via `dbstat` do SQLite) e
+o tempo para ler as 16 séries de um medidor num dia com `crud.measurement_series`.
+
+Uso:
+    python benchmark_snapshots.py                       # 10 medidores, 2 dias
+    python benchmark_snapshots.py --meters 50 --days 7
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.core.config import settings
+from app.core.db import Base
+from benchmark_bulk_insert import SDM630_METRICS
+
+
+def build(path: str, layout: str, meters: int, days: int, interval: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    settings.measurement_layout = layout
+    rng = random.Random(7)
+    db = Session()
+    try:
+        client = models.Client(name="bench")
+        db.add(client)
+        db.flush()
+        devices = [models.Device(client_id=client.id, name=f"sdm-{i}", device_type="modbus_tcp", config={}) for i in range(meters)]
+        db.add_all(devices)
+        db.commit()
+        device_ids = [d.id for d in devices]
+        start = datetime(2024, 1, 1)
+        steps = days * 86400 // interval
+        t0 = time.perf_counter()
+        for k in range(0, steps, 120):  # uma hora por transação
+            rows = [
+                (d, m, start + timedelta(seconds=s * interval), rng.uniform(0, 400))
+                for s in range(k, min(k + 120, steps))
+                for d in device_ids
+                for m in SDM630_METRICS
+            ]
+            crud.create_measurements_bulk(db, rows)
+        write_s = time.perf_counter() - t0
+    finally:
+        db.close()
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        sizes = dict(conn.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all())
+    return engine, Session, device_ids[0], start, write_s, sizes
+
+
+def read_day(Session, device_id: int, start: datetime, repeat: int) -> tuple[float, int]:
+    db = Session()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            series = crud.measurement_series(db, device_id, SDM630_METRICS, start + timedelta(hours=1), start + timedelta(days=1))
+        return (time.perf_counter() - t0) / repeat, sum(len(s) for s in series.values())
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, default=10)
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--interval", type=int, default=30, help="segundos entre leituras")
+    parser.add_argument("--repeat", type=int, default=5, help="repetições da leitura")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-layout-")
+    try:
+        results = {}
+        for layout, table in (("rows", "measurements"), ("snapshot", "measurement_snapshots")):
+            engine, Session, device_id, start, write_s, sizes = build(
+                os.path.join(tmpdir, f"{layout}.db"), layout, args.meters, args.days, args.interval
+            )
+            prefix = "ix_measurements" if layout == "rows" else "ix_snapshots"
+            table_b = sizes.get(table, 0)
+            index_b = sum(v for k, v in sizes.items() if k.startswith(prefix))
+            read_s, points = read_day(Session, device_id, start, args.repeat)
+            engine.dispose()
+            results[layout] = (table_b, index_b, write_s, read_s)
+            print(
+                f"{layout:>8}: tabela {table_b / 2**20:8.1f} MiB  índices {index_b / 2**20:8.1f} MiB  "
+                f"gravação {write_s:6.2f}s  leitura 16 métricas x 1 dia {read_s * 1000:7.1f} ms ({points} pontos)"
+            )
+        (rt, ri, rw, rr), (st, si, sw, sr) = results["rows"], results["snapshot"]
+        print(f"  snapshots: {rt / st:.1f}x menos tabela, {ri / max(si, 1):.1f}x menos índice, leitura {rr / sr:.1f}x mais rápida")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark dos perfis SQLite: default x timeseries
+Grava a mesma frota de SDM630 (16 métricas por leitura, um commit por ciclo de
+coleta, como os pollers) num banco de cada perfil e mede:
+
+- vazão de gravação (linhas/s) com `crud.create_measurements_bulk`;
+- latência de leitura de intervalo (`crud.measurement_series`, uma métrica de um
+  medidor numa janela aleatória), p50/p95.
+
+Uso:
+    python benchmark_sqlite_profile.py                             # 50 medidores, 6 h a cada 30 s
+    python benchmark_sqlite_profile.py --meters 200 --hours 24 --window 6
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.core.config import settings
+from app.core.db import init_db, make_engine
+from benchmark_bulk_insert import SDM630_METRICS
+
+
+def run(path: str, profile: str, args) -> tuple[float, list[float]]:
+    engine = make_engine(f"sqlite:///{path}", profile)
+    init_db(engine, profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    settings.measurement_layout = "rows"
+    rng = random.Random(11)
+    db = Session()
+    try:
+        client = models.Client(name="bench")
+        db.add(client)
+        db.flush()
+        devices = [models.Device(client_id=client.id, name=f"sdm-{i}", device_type="modbus_tcp", config={}) for i in range(args.meters)]
+        db.add_all(devices)
+        db.commit()
+        device_ids = [d.id for d in devices]
+
+        start = datetime(2024, 1, 1)
+        cycles = args.hours * 3600 // args.interval
+        n = 0
+        t0 = time.perf_counter()
+        for k in range(cycles):  # um commit por ciclo
+            ts = start + timedelta(seconds=k * args.interval)
+            n += crud.create_measurements_bulk(db, [(d, m, ts, rng.uniform(0, 400)) for d in device_ids for m in SDM630_METRICS])
+        write_rate = n / (time.perf_counter() - t0)
+
+        latencies = []
+        window = timedelta(hours=args.window)
+        span = timedelta(hours=args.hours) - window
+        for _ in range(args.queries):
+            a = start + span * rng.random()
+            t0 = time.perf_counter()
+            crud.measurement_series(db, rng.choice(device_ids), [rng.choice(SDM630_METRICS)], a, a + window)
+            latencies.append(time.perf_counter() - t0)
+    finally:
+        db.close()
+        engine.dispose()
+    return write_rate, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meters", type=int, default=50)
+    parser.add_argument("--hours", type=int, default=6)
+    parser.add_argument("--interval", type=int, default=30, help="segundos entre ciclos de coleta")
+    parser.add_argument("--window", type=float, default=2, help="janela das leituras de intervalo (h)")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-sqlite-")
+    try:
+        print(f"{args.meters} medidores x {len(SDM630_METRICS)} métricas, {args.hours} h a cada {args.interval} s")
+        results = {}
+        for profile in ("default", "timeseries"):
+            rate, lat = run(os.path.join(tmpdir, f"{profile}.db"), profile, args)
+            lat_ms = sorted(x * 1000 for x in lat)
+            p50, p95 = statistics.median(lat_ms), lat_ms[int(len(lat_ms) * 0.95) - 1]
+            results[profile] = (rate, p50)
+            print(f"  {profile:>10}: gravação {rate:>9,.0f} linhas/s  leitura {args.window:g} h: p50 {p50:6.2f} ms  p95 {p95:6.2f} ms")
+        (dr, dp), (tr, tp) = results["default"], results["timeseries"]
+        print(f"  timeseries: gravação {tr / dr:.1f}x, leitura p50 {dp / tp:.1f}x")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
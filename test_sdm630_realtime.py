@@ -6,8 +6,8 @@ import time
 import os
 import sys
 from datetime import datetime
-from pymodbus.client import ModbusTcpClient
 from app.connectors.eastron_sdm630 import read_sdm630_metrics
+from app.connectors.modbus_pool import tcp_pool
 
 # Fix Windows console encoding
 if sys.platform == 'win32':
@@ -43,13 +43,13 @@ def monitor_sdm630(host="10.0.0.109", port=8899, slave_id=1, interval=2):
     print(f"   Slave ID: {slave_id}")
     print(f"   Intervalo: {interval}s\n")
 
-    client = ModbusTcpClient(host=host, port=port, timeout=3)
+    # Conexão persistente do pool: reaproveitada entre leituras e reaberta com backoff se cair
+    client = tcp_pool.client(host=host, port=port, slave_id=slave_id, timeout=3)
 
     if not client.connect():
         print("❌ Falha ao conectar no EW11")
         return
 
-    client.slave_id = slave_id
     print("✅ Conectado! Iniciando monitoramento...\n")
     time.sleep(1)
 
@@ -136,12 +136,15 @@ def monitor_sdm630(host="10.0.0.109", port=8899, slave_id=1, interval=2):
         print("\n\n✋ Monitoramento interrompido pelo usuário")
 
     finally:
-        client.close()
+        pool_stats = tcp_pool.stats()
+        tcp_pool.close_all()
         print(f"\n📊 Estatísticas finais:")
         print(f"   Total de leituras: {readings}")
         print(f"   Erros: {errors}")
         if readings > 0:
             print(f"   Taxa de sucesso: {((readings-errors)/readings*100):.1f}%")
+        for gw in pool_stats:
+            print(f"   Gateway {gw['host']}:{gw['port']}: {gw['requests']} requisições, {gw['reconnects']} reconexões")
         print("\n🔌 Conexão fechada.")
 
 
@@ -0,0 +1,60 @@
+"""
+Teste do modo local Tuya contra tomadas simuladas
+Sobe N tomadas falsas (protocolo LAN 3.3) em portas locais, lê todas em paralelo
+com o TuyaLocalPoller (sessões persistentes) e mostra a latência por leitura.
+Inclui um dispositivo inacessível para exercitar o fallback (sem credenciais de
+nuvem ele fica como falha).
+
+Uso: python test_tuya_local.py [N] [ciclos]
+"""
+import sys
+import time
+from app.simulator.tuya_local import FakeTuyaPlug, start_fake_plug
+from app.services.tuya_poller import TuyaCloudPoller, TuyaDeviceTarget, TuyaLocalPoller, TuyaPoller
+
+LOCAL_KEY = "0123456789abcdef"
+
+
+def main(n: int = 50, cycles: int = 5):
+    servers = []
+    targets = []
+    for i in range(n):
+        server, port = start_fake_plug(FakeTuyaPlug(f"fake{i:04d}", LOCAL_KEY, base_power_w=50 + i))
+        servers.append(server)
+        targets.append(TuyaDeviceTarget(
+            id=i + 1,
+            name=f"Tomada {i + 1}",
+            config={"tuya_id": f"fake{i:04d}", "address": "127.0.0.1", "local_port": port, "local_key": LOCAL_KEY},
+        ))
+    # porta sem servidor: falha local, sem nuvem configurada
+    targets.append(TuyaDeviceTarget(
+        id=n + 1,
+        name="Offline",
+        config={"tuya_id": "offline", "address": "127.0.0.1", "local_port": 1, "local_key": LOCAL_KEY},
+    ))
+
+    poller = TuyaPoller(TuyaCloudPoller(), TuyaLocalPoller(max_concurrency=32, timeout=1.0, retry_after=60))
+    try:
+        for cycle in range(cycles):
+            report, results = poller.poll(targets)
+            latencies = sorted(report.latencies.values())
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+            print(
+                f"ciclo {cycle + 1}: {len(results)}/{report.polled} ok em {report.duration_s * 1000:.1f} ms"
+                f" | latência p50 {p50:.2f} ms | falhas: {report.failed}"
+            )
+        sample = results.get(1, {})
+        print(f"\nTomada 1: {sample}")
+        print(f"Erro do offline: {report.errors.get(n + 1)}")
+        print(f"Estado: {poller.stats()['local']}")
+    finally:
+        poller.shutdown()
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(n, cycles)